@@ -20,6 +20,11 @@ if 'EDIBLES_PYTHONDIR' in os.environ:
 else:
     PYTHONDIR = os.path.dirname(__file__)
 
+if 'EDIBLES_CACHEDIR' in os.environ:
+    CACHEDIR = os.environ['EDIBLES_CACHEDIR']
+else:
+    CACHEDIR = os.path.join(os.path.expanduser('~'), '.cache', 'edibles')
+
 #print("Going Through")
     
 
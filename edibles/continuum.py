@@ -1,3 +1,4 @@
+import io
 import matplotlib.pyplot as plt
 import numpy as np
 from datetime import datetime
@@ -6,9 +7,79 @@ from pprint import pprint
 
 from edibles.utils.edibles_spectrum import EdiblesSpectrum
 from edibles.models import ContinuumModel
+from edibles.utils.continuum_guess import envelope_continuum, polynomial_continuum
 from pathlib import Path
 
 
+def format_save(method, n_anchors, x_points, y_points, user, comments, date_time=None):
+    """The text of one saved continuum in the continuum csv files, see Continuum.add_to_csv.
+
+    Args:
+        method (str): The method of fitting
+        n_anchors (int): The number of anchor points
+        x_points (list): x values of the anchor points
+        y_points (list): y values of the anchor points
+        user (str): The name of the person adding the data
+        comments (str): Any comments about the data
+        date_time (datetime): Time of the save, default: now
+
+    Returns:
+        str: The save, ending with an empty line
+
+    """
+    date_time = datetime.now() if date_time is None else date_time
+    f = io.StringIO()
+    f.write("######\n")
+    f.write("# method=" + str(method) + "\n")
+    f.write("# n_anchors=" + str(n_anchors) + "\n")
+    f.write("# datetime=" + str(date_time) + "\n")
+    f.write("# user=" + str(user) + "\n")
+    f.write("# comments=" + str(comments) + "\n")
+    np.savetxt(f, (x_points, y_points), delimiter=",")
+    f.write("\n")
+    return f.getvalue()
+
+
+def parse_saves(lines):
+    """Parse the saved continua of a continuum csv file, see Continuum.add_to_csv.
+
+    Args:
+        lines (iterable): The lines of the file, e.g. an open file
+
+    Returns:
+        list: One dict per save, in file order, with the keys of its header lines
+        (method, n_anchors, datetime, user, comments) and the anchors x and y
+
+    """
+    saves = []
+    for line in lines:
+        line = line.split("\n")[0]
+        if len(line) == 0:
+            continue
+        # initialize new save group
+        if line == "######":
+            saves.append({"x": None, "y": None})
+        # update dict
+        elif line[0:2] == "# ":
+            key, val = line.split("# ")[1].split("=", 1)
+            if key == "n_anchors":
+                val = int(val)
+            if key == "datetime":
+                val = datetime.strptime(val, "%Y-%m-%d %H:%M:%S.%f")
+            saves[-1][key] = val
+        elif saves[-1]["x"] is None:
+            saves[-1]["x"] = [float(item) for item in line.split(",")]
+        else:
+            saves[-1]["y"] = [float(item) for item in line.split(",")]
+    return saves
+
+
+def read_saves(csv_file):
+    """The saved continua in a continuum csv file, see parse_saves."""
+    with open(csv_file, mode="r") as f:
+        return parse_saves(f)
+
+
 class Continuum:
     """A class that has multiple methods for fitting different types of continua.
 
@@ -17,14 +88,19 @@ class Continuum:
         method (str): The method of fitting
         plot (bool): If true, plots the continuum fit
         verbose (int): If > 0, display more status messages
+        store (ContinuumStore): If given, saved continua are read from and added to
+            this store instead of the continuum csv files
 
     """
 
-    def __init__(self, Spectrum, method="None", plot=False, verbose=0, *args, **kwargs):
+    def __init__(self, Spectrum, method="None", plot=False, verbose=0, *args, store=None, **kwargs):
 
+        self.store = store
         # check existing the available continuum csv files
         try:
-            if Spectrum.continuum_filename:
+            if store is not None:
+                self.num_saved_continua = store.count(Spectrum.filename)
+            elif Spectrum.continuum_filename:
                 self.num_saved_continua = 0
                 with open(Spectrum.continuum_filename) as f:
                     for row in f:
@@ -41,6 +117,8 @@ class Continuum:
 
         if method == "spline":
             self.spline(*args, **kwargs)
+        elif method == "clipped_spline":
+            self.clipped_spline(*args, **kwargs)
         elif method == "alphashape":
             self.alphashape(*args, **kwargs)
         elif method == "polynomial":
@@ -63,19 +141,72 @@ class Continuum:
         self.model = ContinuumModel(n_anchors=n_anchors)
         self.cont_pars = self.model.guess(self.Spectrum.flux, x=self.Spectrum.wave)
 
-        self.result = self.model.fit(
-            data=self.Spectrum.flux, params=self.cont_pars, x=self.Spectrum.wave
+        # The x anchors are fixed, so the fit is linear in the y anchors.
+        self.result = self.model.linear_fit(
+            self.Spectrum.flux, x=self.Spectrum.wave, params=self.cont_pars
+        )
+
+        if self.plot:
+            self.result.plot_fit()
+            plt.show()
+
+    def clipped_spline(self, *args, **kwargs):
+        """A spline function through a set number of anchor points, fit while
+        iteratively rejecting points far from the continuum (e.g. absorption lines).
+
+        Args:
+            n_anchors (int): The number of anchor points in the spline
+            lower (float): Reject points more than lower standard deviations below
+                the fit, default=1.0. None: no rejection below
+            upper (float): Reject points more than upper standard deviations above
+                the fit, default=None (no rejection above)
+            maxiters (int): Maximum number of clipping iterations, default=10
+
+        Note:
+            After the fit, self.mask holds the points that were kept,
+            self.clipped_fraction the fraction that was rejected, self.n_iterations
+            the number of iterations used and self.converged whether the rejection
+            mask converged. The continuum at Spectrum.wave is stored in
+            self.continuum; self.result.best_fit covers the same points.
+
+        """
+
+        if self.verbose > 0:
+            print("method: ", self.method)
+            print()
+
+        n_anchors = kwargs["n_anchors"]
+
+        self.model = ContinuumModel(n_anchors=n_anchors)
+        self.cont_pars = self.model.guess(self.Spectrum.flux, x=self.Spectrum.wave)
+
+        self.result, self.mask, self.n_iterations, self.converged = self.model.clipped_fit(
+            self.Spectrum.flux, x=self.Spectrum.wave, params=self.cont_pars,
+            lower=kwargs.get("lower", 1.0), upper=kwargs.get("upper"),
+            maxiters=kwargs.get("maxiters", 10)
         )
+        self.clipped_fraction = 1.0 - np.mean(self.mask)
+        self.continuum = self.result.best_fit
+
+        if self.verbose > 0:
+            print("Clipped fraction: {:.3f}, iterations: {}, converged: {}".format(
+                self.clipped_fraction, self.n_iterations, self.converged))
 
         if self.plot:
             self.result.plot_fit()
             plt.show()
 
-    def alphashape(self):
-        """A function that uses alphashape to find a continuum.
+    def alphashape(self, *args, **kwargs):
+        """A function that finds the upper envelope of the spectrum as continuum
+        (the large-alpha limit of an alpha shape), see
+        continuum_guess.envelope_continuum. No initial guess or fit is needed.
+
+        Args:
+            n_bins (int): Number of bins the flux is reduced to, default=100
+            percentile (float): Percentile of the flux taken in each bin, default=90
 
         Note:
-            Currently not implemented
+            The continuum at Spectrum.wave is stored in self.continuum
 
         """
 
@@ -83,23 +214,55 @@ class Continuum:
             print("method: ", self.method)
             print()
 
-        print("This method is not available yet.")
+        self.continuum = envelope_continuum(self.Spectrum.wave, self.Spectrum.flux,
+                                            n_bins=kwargs.get("n_bins", 100),
+                                            percentile=kwargs.get("percentile", 90.0))
+        if self.plot:
+            self._plot_continuum()
+
+    def polynomial(self, *args, **kwargs):
+        """A function that fits a polynomial continuum, with optional sigma-clipping,
+        see continuum_guess.polynomial_continuum.
 
-    def polynomial(self):
-        """A function that uses a polynomial to find a continuum.
+        Args:
+            degree (int): Degree of the polynomial, default=3
+            lower (float): Reject points more than lower standard deviations below the
+                fit, default=None (no rejection)
+            upper (float): Reject points more than upper standard deviations above the
+                fit, default=None (no rejection)
+            maxiters (int): Maximum number of clipping iterations, default=5
 
         Note:
-            Currently not implemented
+            The continuum at Spectrum.wave is stored in self.continuum, the points
+            used in the fit in self.mask
 
         """
 
         if self.verbose > 0:
             print("method: ", self.method)
             print()
-        print("This method is not available yet.")
+
+        self.continuum, self.mask = polynomial_continuum(
+            self.Spectrum.wave, self.Spectrum.flux, degree=kwargs.get("degree", 3),
+            lower=kwargs.get("lower"), upper=kwargs.get("upper"),
+            maxiters=kwargs.get("maxiters", 5))
+        if self.plot:
+            self._plot_continuum()
+
+    def _plot_continuum(self):
+        plt.plot(self.Spectrum.wave, self.Spectrum.flux)
+        plt.plot(self.Spectrum.wave, self.continuum)
+        plt.show()
+
+    def _saves(self):
+        """The saved continua of the spectrum, from the store or the csv file."""
+        if self.store is not None:
+            return self.store.saves(self.Spectrum.filename)
+        return read_saves(self.Spectrum.continuum_filename)
 
     def prebuilt_model(self, chosen_save_num=None, plot=False, verbose=0):
-        """A function that generates continua based on data saved in csv files.
+        """A function that generates continua based on data saved in csv files
+        (or in the ContinuumStore, if one was given).
 
 
         Args:
@@ -114,45 +277,14 @@ class Continuum:
         assert self.num_saved_continua > 0, "There is no saved continuum."
 
         # read and parse file contents
-        saves_counter = 0
-        saves_dict = {}
-        with open(self.Spectrum.continuum_filename, mode="r") as f:
-            for line in f:
-                line = line.split("\n")[0]
-
-                # initialize new save group
-                if len(line) > 0:
-                    if line == "######":
-                        name = "save" + str(saves_counter)
-                        saves_counter += 1
-                        saves_dict[name] = {"x": None, "y": None}
-
-                    # update dict
-                    elif line[0:2] == "# ":
-                        key, val = line.split("# ")[1].split("=")
-
-                        if key == "n_anchors":
-                            val = int(val)
-                        if key == "datetime":
-                            val = datetime.strptime(val, "%Y-%m-%d %H:%M:%S.%f")
-
-                        saves_dict[name][key] = val
-
-                    else:
-                        if saves_dict[name]["x"] is None:
-                            saves_dict[name]["x"] = [
-                                float(item) for item in line.split(",")
-                            ]
-                        else:
-                            saves_dict[name]["y"] = [
-                                float(item) for item in line.split(",")
-                            ]
+        saves = self._saves()
+        saves_counter = len(saves)
 
         if chosen_save_num is not None:
             assert chosen_save_num < self.num_saved_continua, (
                 "There are only " + str(self.num_saved_continua) + " saved continua."
             )
-            chosen_save = saves_dict["save" + str(chosen_save_num)]
+            chosen_save = saves[chosen_save_num]
 
             if verbose > 0:
                 print("Number of saved continuum datasets: ", saves_counter)
@@ -178,7 +310,7 @@ class Continuum:
             return out
         else:
             for j in range(saves_counter):
-                chosen_save = saves_dict["save" + str(j)]
+                chosen_save = saves[j]
                 try:
                     method = str(chosen_save["method"])
                 except:
@@ -268,19 +400,41 @@ class Continuum:
         y_points = [self.result.params[yname].value for yname in self.model.ynames]
 
         with open(csv_file, mode="a") as f:
-            f.write("######\n")
-            f.write("# method=" + str(self.method) + "\n")
-            f.write("# n_anchors=" + str(self.model.n_anchors) + "\n")
-            f.write("# datetime=" + str(datetime.now()) + "\n")
-            f.write("# user=" + str(user) + "\n")
-            f.write("# comments=" + str(comments) + "\n")
-            np.savetxt(f, (x_points, y_points), delimiter=",")
-            f.write("\n")
+            f.write(format_save(self.method, self.model.n_anchors, x_points, y_points,
+                                user, comments))
 
         if self.verbose > 0:
             print("Appended to file!")
         if self.verbose > 1:
-            print("File appended to: " + csv_file)
+            print("File appended to: " + str(csv_file))
+
+    def add_to_store(self, user, comments):
+        """A function that saves the continuum model parameters to the ContinuumStore.
+
+        Args:
+            user (str): The name of the person adding the data
+            comments (str): Any comments the user wishes to make about the data to be saved
+
+        Returns:
+            int: The save number
+
+        """
+        assert self.store is not None, "No ContinuumStore was given"
+        assert isinstance(self.model, ContinuumModel)
+        assert isinstance(user, str)
+        assert len(user) > 0, "A name must be entered"
+        assert isinstance(comments, str)
+
+        x_points = [self.result.params[xname].value for xname in self.model.xnames]
+        y_points = [self.result.params[yname].value for yname in self.model.ynames]
+
+        save_num = self.store.add(self.Spectrum.filename, x_points, y_points,
+                                  method=self.method, user=user, comments=comments)
+        self.num_saved_continua = save_num + 1
+
+        if self.verbose > 0:
+            print("Added to store as save {}!".format(save_num))
+        return save_num
 
 
 if __name__ == "__main__":
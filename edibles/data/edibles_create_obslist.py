@@ -1,145 +1,197 @@
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import numpy as np
-import csv
+import pandas as pd
 from astropy.io import fits
 from edibles import DATADIR, PYTHONDIR, DATARELEASE
-from edibles.utils.edibles_spectrum import EdiblesSpectrum
 
+# Columns read by the oracle and FilterDR, followed by the extended metadata and
+# the size/modification time used to decide which files have to be re-read.
+OBSLOG_COLUMNS = ["Object", "RA", "DEC", "DateObs", "Setting", "Order", "WaveMin", "WaveMax",
+                  "Filename"]
+EXTRA_COLUMNS = ["VBary", "ExpTime", "NAXIS1", "CRVAL1", "CDELT1", "ContinuumFile",
+                 "FileSize", "FileMTime"]
 
-def createObsList(dryrun=True):
-    """Set up of the list of FITS files in the data directory with the necessary
-    information that we need to supply to the oracle to work. Essentially, we
-    will recursively list all of the FITS files first, then open each of them
-    to read the header and extract the information. Finally, store everything
-    in a text file.
+# We need to make sure we have a consistent format for the object names.
+OBJECT_ALIASES = {"kappa Ori": "HD 38771", "lambda Sco": "HD 158926"}
+
+
+def normalizeObjectName(objectstring):
+    """Replace kappa Ori and lambda Sco by their HD numbers, and fix the
+    inconsistent spaces: trim all whitespace, then add one after the HD characters.
+
+    :param objectstring: OBJECT keyword from the header
+    :type objectstring: str
+
+    :return: e.g. 'HD 170740'
+    :rtype: str
+    """
+    objectstring = OBJECT_ALIASES.get(objectstring.strip(), objectstring)
+    objectstring = "".join(objectstring.split())
+    return objectstring[:2] + ' ' + objectstring[2:]
 
-    :param dryrun: If True, dont save list. Default=True
-    :type drtyrun: bool
 
+def continuumFilename(datadir, relative_filename):
+    """Continuum product of a spectrum, as looked for by EdiblesSpectrum.
 
+    :return: Path relative to the continuum folder, or '' if there is none
+    :rtype: str
     """
+    fullfilename = datadir + relative_filename
+    csv_file = fullfilename.replace(".fits", ".csv").replace(
+        "/DR4/data/", "/DR4/continuum/").replace(r"\DR4\data", r"\DR4\continuum")
+    if csv_file != fullfilename.replace(".fits", ".csv") and os.path.isfile(csv_file):
+        return relative_filename.replace(".fits", ".csv")
+    return ""
+
+
+def findFitsFiles(datadir):
+    """Recursively list all FITS files, with their size and modification time.
 
-    print("Data Release in " + DATADIR)
-    allfitsfiles = []
-    for path, dirs, files in os.walk(DATADIR):
-        for file in files:
+    :return: Table with columns Filename (relative to datadir), FileSize, FileMTime
+    :rtype: pandas.DataFrame
+    """
+    rows = []
+    for path, dirs, files in os.walk(datadir):
+        dirs.sort()
+        for file in sorted(files):
             if file.endswith(".fits"):
                 fullfilename = os.path.join(path, file)
-                relative_filename = fullfilename[len(DATADIR):]
-                # print(relative_filename)
-                allfitsfiles.append(relative_filename)
+                stat = os.stat(fullfilename)
+                rows.append((fullfilename[len(datadir):], stat.st_size, stat.st_mtime_ns))
+    return pd.DataFrame(rows, columns=["Filename", "FileSize", "FileMTime"])
+
+
+def readHeader(relative_filename, datadir=DATADIR):
+    """Read the obslog entry of one FITS file from its header.
+
+    EdiblesSpectrum is too slow for this (it used to take 5 sec per file), so only
+    the primary header is read.
 
+    :param relative_filename: File name relative to datadir, starting with a separator
+    :type relative_filename: str
+
+    :return: The obslog columns for this file
+    :rtype: dict
+    """
+    header = fits.getheader(datadir + relative_filename)
+    crval1 = header["CRVAL1"]
+    cdelt1 = header["CDELT1"]
+    nwave = header["NAXIS1"]
+
+    idx_O = relative_filename.find("_O")
+    if idx_O != -1:
+        idx_dot = relative_filename.find(".")
+        order = relative_filename[idx_O + 2: idx_dot]
+    else:
+        order = "ALL"
+    setting = ""
+    if "HIERARCH ESO INS GRAT1 WLEN" in header:
+        setting = int(header["HIERARCH ESO INS GRAT1 WLEN"])
+    if "HIERARCH ESO INS GRAT2 WLEN" in header:
+        setting = int(header["HIERARCH ESO INS GRAT2 WLEN"])
+
+    return {
+        "Object": normalizeObjectName(header["OBJECT"]),
+        "RA": header["RA"],
+        "DEC": header["DEC"],
+        "DateObs": header["DATE-OBS"],
+        "Setting": setting,
+        "Order": order,
+        "WaveMin": round(crval1, 1),
+        "WaveMax": round(crval1 + cdelt1 * nwave, 1),
+        "Filename": relative_filename,
+        "VBary": header.get("HIERARCH ESO QC VRAD BARYCOR", np.nan),
+        "ExpTime": header.get("EXPTIME", np.nan),
+        "NAXIS1": nwave,
+        "CRVAL1": crval1,
+        "CDELT1": cdelt1,
+        "ContinuumFile": continuumFilename(datadir, relative_filename),
+    }
+
+
+def createObsList(dryrun=True, incremental=True, max_workers=None, datadir=None, outfile=None):
+    """Set up of the list of FITS files in the data directory with the necessary
+    information that we need to supply to the oracle to work. Essentially, we
+    will recursively list all of the FITS files first, then read the header of
+    each of them (in parallel) to extract the information. Finally, store
+    everything in a text file.
+
+    Besides the obslog columns, the barycentric correction, exposure time,
+    wavelength solution and continuum product of every file are stored, so this
+    metadata can be looked up without opening the FITS file (see
+    EdiblesOracle.getObsMetadata).
+
+    With incremental=True, only files that are new, or whose size or modification
+    time changed since the existing list was written, are read again.
+
+    :param dryrun: If True, dont save list. Default=True
+    :type drtyrun: bool
+    :param incremental: If True, reuse the entries of unchanged files. Default=True
+    :type incremental: bool
+    :param max_workers: Number of worker processes reading headers; 1 reads them in
+        this process. Default: number of CPUs
+    :type max_workers: int
+    :param datadir: Data release folder. Default=DATADIR
+    :type datadir: str
+    :param outfile: Obslog file. Default=PYTHONDIR/data/<DATARELEASE>_ObsLog.csv
+    :type outfile: str
+
+    :return: The obslog
+    :rtype: pandas.DataFrame
+    """
+    datadir = DATADIR if datadir is None else datadir
+    outfile = PYTHONDIR + "/data/" + DATARELEASE + "_ObsLog.csv" if outfile is None else outfile
+
+    print("Data Release in " + datadir)
+    allfitsfiles = findFitsFiles(datadir)
     print(len(allfitsfiles))
 
-    class obsfile:
-        def __init__(self):
-            self.filename = ""
-            self.object = ""
-            self.date_obs = ""
-            self.setting = ""
-            self.order = ""
-            self.wave_min = ""
-            self.wave_max = ""
-            self.ra = ""
-            self.dec = ""
-            self.exptime = ""
-            # self.order=0
-            # self.merged=False
-
-    n_files = len(allfitsfiles)
-    full_list = [obsfile() for i in range(n_files)]
-
-    for count in range(len(allfitsfiles)):
-    #for count in range(1000):
-        print(count, n_files, allfitsfiles[count])
-        full_list[count].filename = allfitsfiles[count]
-        #print(DATADIR + full_list[count].filename)
-        #spec = EdiblesSpectrum(full_list[count].filename)
-        # EdiblesSpectrum has become too slow -- takes 5 sec per file! 
-        # So faster to just work with header! 
-        hdu = fits.open(DATADIR + full_list[count].filename)
-        header = hdu[0].header
-        crval1 = header["CRVAL1"]
-        cdelt1 = header["CDELT1"]
-        nwave = header["NAXIS1"]
-
-        objectstring = header["OBJECT"]
-        # We need to make sure we have a consistent format. 
-        # So replace kappa Ori with HD 38771; lambda Sco by HD 158926
-        # And lots of inconsistencies with spaces! 
-        if objectstring == 'kappa Ori': obectstring = 'HD 38771'
-        if objectstring == 'lambda Sco': obectstring = 'HD 158926'
-        # Idea: trim all whitespace, then add one after the HD characters. 
-        objectstring = "".join(objectstring.split())
-        objectstring = objectstring[:2] + ' ' + objectstring[2:]
-        #print(objectstring)
-        full_list[count].object = objectstring
-        full_list[count].date_obs = header["DATE-OBS"]
-        full_list[count].ra = header["RA"]
-        full_list[count].dec = header["DEC"]
-        full_list[count].exptime = header["EXPTIME"]
-        idx_O = allfitsfiles[count].find("_O")
-        if idx_O != -1:
-            # print(idx)
-            idx_dot = allfitsfiles[count].find(".")
-            full_list[count].order = (allfitsfiles[count])[idx_O + 2: idx_dot]
-        else:
-            full_list[count].order = "ALL"
-        if "HIERARCH ESO INS GRAT1 WLEN" in header:
-            full_list[count].setting = int(header["HIERARCH ESO INS GRAT1 WLEN"])
-        if "HIERARCH ESO INS GRAT2 WLEN" in header:
-            full_list[count].setting = int(header["HIERARCH ESO INS GRAT2 WLEN"])
-        full_list[count].wave_min = "{:.1f}".format(crval1)
-        full_list[count].wave_max = "{:.1f}".format(crval1 + cdelt1 * nwave)
-    
-
-    # Create arrays of formatted strings to print to a csv file now.
-    pstrings = [
-        [
-            "Object",
-            "RA",
-            "DEC",
-            "DateObs",
-            "Setting",
-            "Order",
-            "WaveMin",
-            "WaveMax",
-            "Filename",
-        ]
-    ]
-    for count in range(n_files):
-        pstrings.append(
-            [
-                full_list[count].object,
-                full_list[count].ra,
-                full_list[count].dec,
-                full_list[count].date_obs,
-                full_list[count].setting,
-                full_list[count].order,
-                full_list[count].wave_min,
-                full_list[count].wave_max,
-                full_list[count].filename,
-            ]
-        )
-
-    # Time to print things out! Let's use csv format to do that.
-    outfile = PYTHONDIR + "/data/" + DATARELEASE + "_ObsLog.csv"
-    # length_checker = np.vectorize(len)
-    # all_lengths = length_checker(allfitsfiles)
-    # print(np.max(all_lengths))
+    # Entries of files that did not change since the last run can be reused.
+    previous = pd.DataFrame(columns=OBSLOG_COLUMNS + EXTRA_COLUMNS)
+    if incremental and os.path.isfile(outfile):
+        existing = pd.read_csv(outfile, dtype={"Order": str, "ContinuumFile": str},
+                               keep_default_na=False, na_values=[""])
+        if set(EXTRA_COLUMNS) <= set(existing.columns):
+            previous = existing
+    merged = allfitsfiles.merge(previous.drop_duplicates("Filename"), on="Filename", how="left",
+                                suffixes=("", "_previous"))
+    unchanged = ((merged.FileSize == merged.FileSize_previous)
+                 & (merged.FileMTime == merged.FileMTime_previous)).to_numpy()
+    to_read = allfitsfiles.Filename[~unchanged].tolist()
+    print("Reading %d of %d headers" % (len(to_read), len(allfitsfiles)))
+
+    read = partial(readHeader, datadir=datadir)
+    if max_workers == 1:
+        headers = [read(filename) for filename in to_read]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            headers = list(pool.map(read, to_read, chunksize=64))
+
+    new_rows = pd.DataFrame(headers, columns=OBSLOG_COLUMNS + EXTRA_COLUMNS[:-2])
+    new_rows = new_rows.merge(allfitsfiles, on="Filename", how="left")
+    old_rows = merged.loc[unchanged, OBSLOG_COLUMNS + EXTRA_COLUMNS]
+
+    # Keep the order of the directory listing.
+    obslog = pd.concat([old_rows, new_rows], ignore_index=True)
+    position = pd.Series(np.arange(len(allfitsfiles)), index=allfitsfiles.Filename)
+    obslog = obslog.iloc[np.argsort(position[obslog.Filename].to_numpy(), kind="stable")]
+    obslog = obslog[OBSLOG_COLUMNS + EXTRA_COLUMNS].reset_index(drop=True).infer_objects()
+    obslog["ContinuumFile"] = obslog["ContinuumFile"].fillna("")
 
     if dryrun is False:
-        with open(outfile, "w") as csvFile:
-            writer = csv.writer(csvFile)
-            writer.writerows(pstrings)
-            print('Wrote to file!')
+        tmp_file = outfile + ".%d.tmp" % os.getpid()
+        obslog.to_csv(tmp_file, index=False)
+        os.replace(tmp_file, outfile)
+        print('Wrote to file!')
     else:
-        spamwriter=csv.writer(sys.stdout)
-        spamwriter.writerows(pstrings)
+        obslog.to_csv(sys.stdout, index=False)
         print('Wrote to stdout!')
 
-    return
+    return obslog
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import numpy as np
 import inspect
 import collections
+from collections import OrderedDict
 from scipy.interpolate import CubicSpline
 from lmfit import Model
 from lmfit.models import update_param_vals
@@ -75,6 +76,40 @@ class VoigtModel(Model):
         return update_param_vals(pars, self.prefix, **kwargs)
 
 
+def default_anchors(x, n_anchors):
+    """Indices of the data points closest to n_anchors evenly spaced wavelengths.
+
+    Args:
+        x (array_like): x data points
+        n_anchors (int): number of anchor points
+
+    Returns:
+        1darray: index into x of each anchor point
+
+    """
+    x = np.asarray(x)
+    spacing = np.linspace(np.min(x), np.max(x), n_anchors)
+    return np.abs(x[:, None] - spacing[None, :]).argmin(axis=0)
+
+
+def spline_basis(x, x_anchors):
+    """Matrix B such that B @ y_anchors is the cubic spline through the anchors, evaluated at x.
+
+    With fixed x anchors, scipy's (not-a-knot) CubicSpline is linear in the y anchors,
+    so column i of B is the spline through a unit y value at anchor i.
+
+    Args:
+        x (array_like): x data points
+        x_anchors (array_like): increasing x values of the anchor points
+
+    Returns:
+        2darray: shape (len(x), len(x_anchors))
+
+    """
+    n_anchors = len(x_anchors)
+    return CubicSpline(np.asarray(x_anchors, dtype=float), np.eye(n_anchors))(np.asarray(x))
+
+
 class ContinuumModel(Model):
     """A model that puts a cubic spline through a small number (max 10) of evenly spaced
     anchor points, specified by ``n_anchors``. Only the y value of the anchor points is fit.
@@ -95,8 +130,15 @@ class ContinuumModel(Model):
         - 'propagate' : do nothing
         - 'omit' : drop missing data
 
+        2. The spline is evaluated as a matrix-vector product with a basis matrix
+        (see spline_basis) that is computed once per x grid and set of x anchors, so
+        repeated evaluations during a fit do not rebuild the spline. A fit of the
+        continuum alone is linear in the y anchors; use linear_fit for it.
+
     """
 
+    BASIS_CACHE_SIZE = 16
+
 
     def __init__(self, n_anchors, independent_vars=["x"], prefix="", nan_policy="raise", verbose=0, **kwargs):
 
@@ -124,11 +166,11 @@ class ContinuumModel(Model):
         # if verbose >=3, print x and y anchors each time
 
 
+        self._basis_cache = OrderedDict()
+
         def cont(x, x_0=-999, y_0=1, **kwargs):
 
-            spacing = np.linspace(np.min(x), np.max(x), self.n_anchors)
             x = np.asarray(x)
-            spacing_idx = [np.argmin(np.abs(x - space)) for space in spacing]
 
             x_anchors = [x_0]
             y_anchors = [y_0]
@@ -140,9 +182,8 @@ class ContinuumModel(Model):
                     y_anchors.append(kwargs[arg])
 
             if all(anchor == -999 for anchor in x_anchors):
-                x_anchors = [x[i] for i in spacing_idx]
+                x_anchors = x[default_anchors(x, self.n_anchors)]
 
-            spline = CubicSpline(x_anchors, y_anchors)
             if self.verbose >= 3:
                 print("====== Spline Continuum ======")
                 x_anchors_p = ["%.5f" % item for item in x_anchors]
@@ -151,7 +192,7 @@ class ContinuumModel(Model):
                 y_anchors_p = ["%.5f" % item for item in y_anchors]
                 print("Ys: ", y_anchors_p)
 
-            return spline(x)
+            return self.basis(x, x_anchors) @ np.asarray(y_anchors, dtype=float)
 
 
         sig = inspect.signature(cont)
@@ -178,6 +219,172 @@ class ContinuumModel(Model):
         super().__init__(cont, **kwargs)
 
 
+    def basis(self, x, x_anchors):
+        """The spline basis matrix for an x grid and x anchors, from the cache if possible.
+
+        Args:
+            x (array_like): x data points
+            x_anchors (array_like): x values of the anchor points
+
+        Returns:
+            2darray: shape (len(x), n_anchors), see spline_basis
+
+        """
+        x = np.ascontiguousarray(x, dtype=float)
+        key = (x.shape, hash(x.tobytes()), tuple(float(a) for a in x_anchors))
+        basis = self._basis_cache.get(key)
+        if basis is None:
+            basis = spline_basis(x, x_anchors)
+            self._basis_cache[key] = basis
+            while len(self._basis_cache) > self.BASIS_CACHE_SIZE:
+                self._basis_cache.popitem(last=False)
+        else:
+            self._basis_cache.move_to_end(key)
+        return basis
+
+    def linear_fit(self, data, x, params=None, weights=None):
+        """Fit the y anchors by (weighted) linear least squares, without an optimizer.
+
+        The x anchors are taken from params (as set by guess); the result is an
+        lmfit ModelResult like that of Model.fit, so it can be plotted and its
+        parameters saved in the same way.
+
+        Args:
+            data (array_like): y data points
+            x (array_like): x data points
+            params (lmfit.Parameters): parameters with the x anchors, default: guess(data, x)
+            weights (array_like): weights multiplying the residuals, as in Model.fit
+
+        Returns:
+            lmfit.model.ModelResult: the fit, with the best y anchors and their uncertainties
+
+        """
+        x = np.asarray(x, dtype=float)
+        data = np.asarray(data, dtype=float)
+        params = self.guess(data, x=x) if params is None else params.copy()
+
+        x_anchors = [params[self.prefix + name].value for name in self.xnames]
+        if all(anchor == -999 for anchor in x_anchors):
+            x_anchors = x[default_anchors(x, self.n_anchors)]
+        design = self.basis(x, x_anchors)
+        w = np.ones_like(data)
+        if weights is not None:
+            w = np.broadcast_to(np.asarray(weights, dtype=float), data.shape)
+
+        y_anchors, _, rank, _ = np.linalg.lstsq(design * w[:, None], data * w, rcond=None)
+        init_vals = [params[self.prefix + name].value for name in self.ynames]
+
+        # Evaluate the exact solution through Model.fit with the anchors fixed, so the
+        # result is a regular ModelResult; bounds from guess do not apply to it.
+        for name, value in zip(self.ynames, y_anchors):
+            params[self.prefix + name].set(value=value, vary=False, min=-np.inf, max=np.inf)
+        result = self.fit(data, params=params, x=x, weights=weights)
+
+        # Then give it the statistics of the n_anchors-parameter fit it is.
+        var_names = [self.prefix + name for name in self.ynames]
+        for name, value in zip(var_names, init_vals):
+            result.params[name].set(vary=True)
+            result.init_params[name].set(value=value, vary=True)
+        result.method = "lstsq"
+        # Points with zero weight (e.g. rejected by clipped_fit) do not count.
+        resid = (data - design @ y_anchors) * w
+        result.var_names = var_names
+        result.init_vals = init_vals
+        result.nvarys = self.n_anchors
+        result.ndata = int(np.count_nonzero(w))
+        result.nfree = result.ndata - self.n_anchors
+        result.chisqr = max(float(np.sum(resid ** 2)), 1.e-250 * result.ndata)
+        result.redchi = result.chisqr / max(1, result.nfree)
+        neg2_log_likel = result.ndata * np.log(result.chisqr / result.ndata)
+        result.aic = neg2_log_likel + 2 * result.nvarys
+        result.bic = neg2_log_likel + np.log(result.ndata) * result.nvarys
+
+        result.covar = None
+        result.errorbars = False
+        if rank == self.n_anchors and result.nfree > 0:
+            result.covar = np.linalg.inv((design * w[:, None]).T @ (design * w[:, None])) * result.redchi
+            result.errorbars = True
+            stderr = np.sqrt(np.diag(result.covar))
+            for i, name in enumerate(var_names):
+                par = result.params[name]
+                par.stderr = float(stderr[i])
+                par.correl = {other: float(result.covar[i, j] / (stderr[i] * stderr[j]))
+                              for j, other in enumerate(var_names) if j != i}
+        result.success = True
+        result.message = "Solved by linear least squares."
+        return result
+
+    def clipped_fit(self, data, x, params=None, lower=1.0, upper=None, maxiters=10, weights=None):
+        """Fit the y anchors while iteratively rejecting points far from the continuum.
+
+        Each iteration fits the points that are kept, computes the standard deviation
+        of their residuals, and rejects the points more than lower (upper) standard
+        deviations below (above) the fit. The basis matrix is computed once and every
+        fit is a linear least squares solution, so an iteration only refits with the
+        new rejection mask. Clipping stops when the mask no longer changes or after
+        maxiters iterations.
+
+        The final fit covers all of x, with zero weight for the rejected points, so
+        result.best_fit is the continuum over the whole grid; result.residual is
+        zero at the rejected points.
+
+        Args:
+            data (array_like): y data points
+            x (array_like): x data points
+            params (lmfit.Parameters): parameters with the x anchors, default: guess(data, x)
+            lower (float): rejection threshold below the fit, in standard deviations,
+                None: no rejection below
+            upper (float): rejection threshold above the fit, in standard deviations,
+                None: no rejection above
+            maxiters (int): maximum number of clipping iterations
+            weights (array_like): weights multiplying the residuals, as in Model.fit
+
+        Returns:
+            tuple: tuple containing:
+
+                lmfit.model.ModelResult: the fit to the points that were kept, evaluated on all of x
+
+                1darray: boolean mask of the points that were kept
+
+                int: the number of clipping iterations used
+
+                bool: True if the mask converged within maxiters iterations
+
+        """
+        x = np.asarray(x, dtype=float)
+        data = np.asarray(data, dtype=float)
+        params = self.guess(data, x=x) if params is None else params
+        w = np.ones_like(data)
+        if weights is not None:
+            w = np.broadcast_to(np.asarray(weights, dtype=float), data.shape)
+
+        x_anchors = [params[self.prefix + name].value for name in self.xnames]
+        if all(anchor == -999 for anchor in x_anchors):
+            x_anchors = x[default_anchors(x, self.n_anchors)]
+        design = self.basis(x, x_anchors)
+
+        mask = np.ones(len(data), dtype=bool)
+        converged = False
+        n_iterations = 0
+        while n_iterations < maxiters:
+            n_iterations += 1
+            y_anchors = np.linalg.lstsq(design[mask] * w[mask, None], data[mask] * w[mask],
+                                        rcond=None)[0]
+            out = design @ y_anchors
+            std = np.std((data - out)[mask])
+            keep = np.ones(len(data), dtype=bool)
+            if lower is not None:
+                keep &= data >= out - lower * std
+            if upper is not None:
+                keep &= data <= out + upper * std
+            if np.array_equal(keep, mask):
+                converged = True
+                break
+            mask = keep
+
+        result = self.linear_fit(data, x=x, params=params, weights=w * mask)
+        return result, mask, n_iterations, converged
+
     def guess(self, data, x=None, **kwargs):
         """
         Estimate initial anchor points through a dataset for the fitting of a cubic spline.
@@ -192,8 +399,7 @@ class ContinuumModel(Model):
 
         pars = self.make_params()
 
-        spacing = np.linspace(np.min(x), np.max(x), self.n_anchors)
-        spacing_idx = [(np.abs(x - space)).argmin() for space in spacing]
+        spacing_idx = default_anchors(x, self.n_anchors)
 
         data = np.asarray(data)
 
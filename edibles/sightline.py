@@ -1,13 +1,91 @@
+import ast
+import bisect
+import hashlib
+import operator
+
 import numpy as np
 import matplotlib.pyplot as plt
-import bisect
-from lmfit import Parameters
+from asteval import get_ast_names
+from lmfit import Model, Parameters
+from lmfit.model import CompositeModel, ModelResult
 import astropy.constants as cst
 
 from edibles.models import ContinuumModel, VoigtModel
 from edibles.utils.edibles_spectrum import EdiblesSpectrum
 
 
+def _product_factors(model):
+    '''The factors of a model built only by multiplication, None if it uses another operator.'''
+    if isinstance(model, CompositeModel):
+        if model.op is not operator.mul:
+            return None
+        left = _product_factors(model.left)
+        right = _product_factors(model.right)
+        if left is None or right is None:
+            return None
+        return left + right
+    return [model]
+
+
+# The outcome of the minimization in a ModelResult, as opposed to what depends on its model.
+_FIT_ATTRIBUTES = ('params', 'status', 'success', 'message', 'ier', 'lmdif_message', 'aborted',
+                   'nfev', 'nvarys', 'ndata', 'nfree', 'var_names', 'init_vals', 'covar',
+                   'errorbars', 'chisqr', 'redchi', 'aic', 'bic', 'call_kws', 'uvars', 'flatchain')
+
+
+def _full_result(model, reduced):
+    '''The ModelResult of model, for a fit done with an equivalent reduced model.
+
+    The minimization outcome (best parameters, statistics, covariance) is taken
+    from the reduced fit; the initial and best fit, best values, residual and
+    components are evaluated with model itself.
+
+    Args:
+        model (lmfit.model.Model): The full model
+        reduced (lmfit.model.ModelResult): The fit of a model that evaluates to the
+            same values as model for all parameters of the fit
+
+    Returns:
+        lmfit.model.ModelResult: The fit of model
+
+    '''
+    result = ModelResult(model, reduced.init_params, data=reduced.data, weights=reduced.weights,
+                         method=reduced.method, fcn_kws=reduced.userkws, iter_cb=reduced.iter_cb,
+                         scale_covar=reduced.scale_covar, nan_policy=reduced.nan_policy,
+                         calc_covar=reduced.calc_covar, max_nfev=reduced.max_nfev, **reduced.kws)
+    for attr in _FIT_ATTRIBUTES:
+        if hasattr(reduced, attr):
+            setattr(result, attr, getattr(reduced, attr))
+
+    result.userargs = (result.data, result.weights)
+    result.components = model.components
+    result.init_fit = model.eval(params=result.init_params, **result.userkws)
+    result.init_values = {name: result.init_params[name].value for name in model.param_names}
+    result.best_values = {name: result.params[name].value for name in model.param_names}
+    result.best_fit = model.eval(params=result.params, **result.userkws)
+    result.residual = result.userfcn(result.params, *result.userargs, **result.userkws)
+    data = np.asarray(result.data)
+    sstot = ((data - data.mean()) ** 2).sum()
+    result.rsquared = 1.0 - ((data - result.best_fit) ** 2).sum() / max(sstot, np.finfo(float).tiny)
+    return result
+
+
+def _fixed_parameters(params):
+    '''Names of the parameters that cannot change in a fit: those that do not vary,
+    and expressions of those only.'''
+    fixed = set(name for name, par in params.items() if par.expr is None and not par.vary)
+    deps = {name: set(get_ast_names(ast.parse(par.expr))) & set(params)
+            for name, par in params.items() if par.expr is not None}
+    changed = True
+    while changed:
+        changed = False
+        for name in deps:
+            if name not in fixed and deps[name] <= fixed:
+                fixed.add(name)
+                changed = True
+    return fixed
+
+
 class Sightline:
     '''A model of the sightline between the telescope and the target star.
 
@@ -52,6 +130,8 @@ class Sightline:
         self.add_source("Telluric", similar={'b': 2})
         self.add_source("Nontelluric", similar=None)
 
+        self._frozen_cache = {}
+
     def add_source(self, name, similar=None):
         '''Adds a new source of absorption to the sightline.
 
@@ -162,8 +242,70 @@ class Sightline:
         self.most_recent = source + '_' + name
         self.n_lines += 1
 
+    def _frozen_model(self, model, params, x):
+        '''Replaces the frozen factors of a product model by their cached product.
+
+        A factor is frozen if none of its parameters can change in a fit (see
+        freeze). The product of the frozen factors is evaluated once on x and
+        kept until x or a frozen parameter value changes. There is one cache per
+        model, so fits of the old and the current model do not evict each other.
+
+        Args:
+            model (lmfit.model.Model): The model to fit
+            params (lmfit.parameter.Parameters): The parameters of the fit
+            x (1darray): Wavelength data to fit
+
+        Returns:
+            lmfit.model.CompositeModel: The cached frozen product times the varying
+            factors, or None if the model is not a product of frozen and varying factors
+
+        '''
+        factors = _product_factors(model)
+        if factors is None:
+            return None
+        fixed = _fixed_parameters(params)
+        frozen = [factor for factor in factors if set(factor.param_names) <= fixed]
+        varying = [factor for factor in factors if not set(factor.param_names) <= fixed]
+        if not frozen or not varying:
+            return None
+
+        x = np.asarray(x, dtype=float)
+        key = (hashlib.sha1(np.ascontiguousarray(x)).hexdigest(),
+               tuple((name, params[name].value) for factor in frozen for name in factor.param_names))
+        # Only keep the caches of the models that can still be fit.
+        live = [m for m in (model, self.complete_model, getattr(self, 'old_complete_model', None))
+                if m is not None]
+        self._frozen_cache = {id(m): self._frozen_cache[id(m)] for m in live
+                              if id(m) in self._frozen_cache and self._frozen_cache[id(m)][0] is m}
+        cached = self._frozen_cache.get(id(model))
+        if cached is None or cached[1] != key:
+            frozen_flux = np.ones_like(x)
+            for factor in frozen:
+                frozen_flux = frozen_flux * factor.eval(params=params, x=x)
+            cached = (model, key, frozen_flux)
+            self._frozen_cache[id(model)] = cached
+        frozen_x, frozen_flux = x, cached[2]
+        frozen_params = Parameters()
+        for factor in frozen:
+            for name in factor.param_names:
+                frozen_params.add(params[name].name, value=params[name].value)
+
+        def frozen_product(x):
+            if x is frozen_x or np.array_equal(x, frozen_x):
+                return frozen_flux
+            # e.g. evaluating the result on a finer grid
+            out = np.ones_like(x, dtype=float)
+            for factor in frozen:
+                out = out * factor.eval(params=frozen_params, x=x)
+            return out
+
+        reduced = Model(frozen_product, name='frozen')
+        for factor in varying:
+            reduced = reduced * factor
+        return reduced
+
     def fit(self, data=None, old=False, x=None, report=False,
-            plot=False, weights=None, method='leastsq', **kwargs):
+            plot=False, weights=None, method='leastsq', cache_frozen=True, **kwargs):
         '''Fits a model to the sightline data given by the EdiblesSpectrum object.
 
         Args:
@@ -174,6 +316,10 @@ class Sightline:
             report (bool): default False: If true, prints the report from the fit.
             plot (bool): default False: If true, plots the data and the fit model.
             method (str): The method of fitting. default: leastsq
+            cache_frozen (bool): default True: If true, the continuum and lines that are
+                frozen are evaluated once instead of in every iteration of the fit.
+                Only applies when all components are multiplied. The result refers
+                to the full model either way.
 
         '''
         if data is None:
@@ -188,12 +334,18 @@ class Sightline:
             model = self.complete_model
             params = self.all_pars
 
-        self.result = model.fit(data=data,
-                                params=params,
-                                x=x,
-                                weights=weights,
-                                method=method,
-                                **kwargs)
+        fit_model = self._frozen_model(model, params, x) if cache_frozen else None
+        if fit_model is None:
+            fit_model = model
+
+        self.result = fit_model.fit(data=data,
+                                    params=params,
+                                    x=x,
+                                    weights=weights,
+                                    method=method,
+                                    **kwargs)
+        if fit_model is not model:
+            self.result = _full_result(model, self.result)
         if report:
             print(self.result.fit_report())
             self.result.params.pretty_print()
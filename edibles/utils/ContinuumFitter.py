@@ -105,10 +105,11 @@ class ContinuumFitter():
         continuum_model = ContinuumModel(n_anchors=n_anchors, verbose=0)
         pars_guess = continuum_model.guess(self.flux, x=self.wave)
 
-        result = continuum_model.fit(data=flux2fit,
-                                     params=pars_guess,
-                                     x=wave2fit,
-                                     weights=np.ones_like(wave2fit))
+        # The x anchors are fixed, so this is a linear least squares problem.
+        result = continuum_model.linear_fit(flux2fit,
+                                            x=wave2fit,
+                                            params=pars_guess,
+                                            weights=np.ones_like(wave2fit))
 
         # generate continuum and scipy.CubicSpline using the fitted parameters
         params2report = result.params
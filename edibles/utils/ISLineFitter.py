@@ -15,6 +15,7 @@ from lmfit.models import update_param_vals
 
 from edibles.utils.voigt_profile import voigt_absorption_line
 from edibles.models import ContinuumModel
+from edibles.utils.edibles_spectrum import measure_snr as _measure_snr
 
 from pathlib import Path
 from edibles import DATADIR
@@ -39,6 +40,7 @@ class ISLineFitter():
         self.wave2fit = wave
         self.flux2fit = flux
         self.SNR = 1.0
+        self._snr_cache = {}
 
         # attribute to archive model-fitting history
         self.model_all = []     # self.model_all[n] has n components in it
@@ -75,7 +77,12 @@ class ISLineFitter():
 
         self.wave2fit = self.wave[data_select == 1]
         self.flux2fit = self.flux[data_select == 1]
-        self.SNR = np.max(measure_snr(self.wave2fit, self.flux2fit, block_size=np.min([windowsize/3, 0.5])))
+        # The S/N only depends on the selected window, so it is computed once per window.
+        key = (tuple(lam_0.tolist()), windowsize)
+        if key not in self._snr_cache:
+            self._snr_cache[key] = np.max(measure_snr(self.wave2fit, self.flux2fit,
+                                                      block_size=np.min([windowsize/3, 0.5])))
+        self.SNR = self._snr_cache[key]
         return self.wave2fit, self.flux2fit
 
     def bayesianCriterion(self, criteria="BIC"):
@@ -647,22 +654,9 @@ def measure_snr(wave, flux, block_size=1.0):
     :type flux: ndarray
 
     :return: SNR, SNR of each of the block
-    :rtype: list
+    :rtype: ndarray
     """
-    # split in blocks of 1 Angstrom.
-    xmin = wave[0]
-    xmax = xmin + block_size
-    SNR = []
-    while xmin < wave[-1]:
-        flux_block = flux[np.where((wave > xmin) & (wave < xmax))]
-        if len(flux_block) == 1:
-            break
-        if (np.nanmean(flux_block) > 0.0):
-            sigma_block = np.nanmean(flux_block) / np.nanstd(flux_block)
-            SNR.append(sigma_block)
-        xmin = xmax.copy()
-        xmax = xmin + block_size
-    return SNR
+    return _measure_snr(wave, flux, block_size=block_size)[0]
 
 
 
@@ -5,13 +5,24 @@
 
 __all__ = [
     "atomic_line_tool",
+    "coadd",
     "continuum_guess",
+    "continuum_pipeline",
+    "continuum_sigma",
+    "continuum_store",
     "edibles_oracle",
     "edibles_spectrum",
     "file_search",
     "functions",
     "local_continuum_spline",
+    "obslog_db",
+    "obslog_index",
+    "order_merging",
     "rebin_spectrum",
+    "spectral_archive",
+    "spectrum_loader",
+    "superspectrum",
     "voigt",
-    "VoigtClass"
+    "VoigtClass",
+    "window_extraction"
 ]
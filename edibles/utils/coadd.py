@@ -0,0 +1,171 @@
+"""Weighted coaddition of many spectra on a common grid.
+
+All functions work on stacked arrays of shape (n_spectra, n_pixels), so the
+S/N estimate, the weighted mean, its uncertainty and the sigma-clipping are
+whole-array operations. NaN marks pixels without data. StreamingCoadd keeps
+running sums instead of the stack, for more epochs than fit in memory.
+"""
+
+import warnings
+
+import numpy as np
+
+
+def linear_snr(x, y):
+    """S/N of (nearly) flat data, relative to a straight-line fit.
+
+    The line is the closed-form least-squares solution, so many rows can be
+    handled at once. The S/N is the mean flux divided by the RMS of the
+    residuals; NaN values are ignored.
+
+    Args:
+        x (1darray or 2darray): Wavelength values, shape (n_pixels,) or (n_spectra, n_pixels)
+        y (1darray or 2darray): Flux values, same shape as x or (n_spectra, n_pixels)
+
+    Returns:
+        tuple: tuple containing:
+
+            float or 1darray: S/N of each row
+
+            1darray or 2darray: The best-fitting line, same shape as y
+
+    """
+    y = np.asarray(y, dtype=float)
+    x = np.broadcast_to(np.asarray(x, dtype=float), y.shape)
+    good = np.isfinite(y) & np.isfinite(x)
+    n = good.sum(axis=-1)
+
+    xg = np.where(good, x, 0.0)
+    yg = np.where(good, y, 0.0)
+    x_mean = xg.sum(axis=-1) / n
+    y_mean = yg.sum(axis=-1) / n
+    dx = np.where(good, x - x_mean[..., None], 0.0)
+    dy = np.where(good, y - y_mean[..., None], 0.0)
+
+    slope = (dx * dy).sum(axis=-1) / (dx * dx).sum(axis=-1)
+    y_fit = y_mean[..., None] + slope[..., None] * (x - x_mean[..., None])
+
+    resid = np.where(good, y - y_fit, 0.0)
+    rmse = np.sqrt((resid ** 2).sum(axis=-1) / n)
+    return y_mean / rmse, y_fit
+
+
+def coadd(flux, error=None, sigma=None, maxiters=5):
+    """Inverse-variance weighted mean of a stack of spectra.
+
+    Args:
+        flux (2darray): Flux, shape (n_spectra, n_pixels); NaN where there is no data
+        error (1darray or 2darray): 1-sigma uncertainties, per pixel (n_spectra, n_pixels)
+            or per spectrum (n_spectra,), default: equal weights
+        sigma (float): If given, iteratively reject points deviating more than
+            sigma times their uncertainty from the median of the remaining points
+        maxiters (int): Maximum number of clipping iterations
+
+    Returns:
+        tuple: tuple containing:
+
+            1darray: The weighted mean
+
+            1darray: The uncertainty of the weighted mean
+
+            2darray: Boolean mask of the points that were used
+
+    """
+    flux = np.asarray(flux, dtype=float)
+    if error is None:
+        error = np.ones_like(flux)
+    error = np.asarray(error, dtype=float)
+    if error.ndim == 1 and flux.ndim == 2:
+        error = error[:, None]
+    error = np.broadcast_to(error, flux.shape)
+
+    used = np.isfinite(flux) & np.isfinite(error) & (error > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv_var = np.where(used, 1.0 / error ** 2, 0.0)
+    values = np.where(used, flux, 0.0)
+
+    # The last pass only computes the mean, so it always belongs to the returned mask.
+    for iteration in range(maxiters + 1):
+        weights = np.where(used, inv_var, 0.0)
+        total = weights.sum(axis=0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = (weights * values).sum(axis=0) / total
+            mean_error = 1.0 / np.sqrt(total)
+        if sigma is None or iteration == maxiters:
+            break
+        # Clip around the median, which a single outlier cannot drag along.
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            centre = np.nanmedian(np.where(used, flux, np.nan), axis=0)
+            keep = used & (np.abs(values - centre) <= sigma * error)
+        if np.array_equal(keep, used):
+            break
+        used = keep
+
+    return mean, mean_error, used
+
+
+class StreamingCoadd:
+    """Accumulate a weighted mean one spectrum (or one stack) at a time.
+
+    Only the running sums are stored, so memory does not grow with the number
+    of spectra that are added.
+
+    Args:
+        n_pixels (int): Length of the common grid
+
+    """
+
+    def __init__(self, n_pixels):
+        self.sum_weights = np.zeros(n_pixels)
+        self.sum_weighted_flux = np.zeros(n_pixels)
+        self.n_spectra = 0
+
+    def add(self, flux, error=None):
+        """Add a spectrum, shape (n_pixels,), or a stack, shape (n_spectra, n_pixels).
+
+        Args:
+            flux (1darray or 2darray): Flux on the common grid; NaN where there is no data
+            error (float or 1darray or 2darray): 1-sigma uncertainties (per pixel, or per
+                spectrum for a stack), default: equal weights
+
+        """
+        flux = np.atleast_2d(np.asarray(flux, dtype=float))
+        if error is None:
+            error = 1.0
+        error = np.asarray(error, dtype=float)
+        if error.ndim == 1 and error.shape[0] == flux.shape[0] != flux.shape[1]:
+            error = error[:, None]
+        error = np.broadcast_to(error, flux.shape)
+
+        good = np.isfinite(flux) & np.isfinite(error) & (error > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = np.where(good, 1.0 / error ** 2, 0.0)
+        self.sum_weights += weights.sum(axis=0)
+        self.sum_weighted_flux += (weights * np.where(good, flux, 0.0)).sum(axis=0)
+        self.n_spectra += flux.shape[0]
+
+    @property
+    def mean(self):
+        """1darray: The weighted mean so far; NaN where no data was added"""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.sum_weighted_flux / self.sum_weights
+
+    @property
+    def error(self):
+        """1darray: The uncertainty of the weighted mean so far"""
+        with np.errstate(divide="ignore"):
+            return 1.0 / np.sqrt(self.sum_weights)
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng()
+    wave = np.linspace(6610, 6618, 400)
+    truth = 1 - 0.1 * np.exp(-0.5 * ((wave - 6614) / 0.4) ** 2)
+    noise = rng.uniform(0.005, 0.03, 20)
+    stack = truth + rng.normal(0, 1, (20, len(wave))) * noise[:, None]
+
+    snr, _ = linear_snr(wave[:30], stack[:, :30])
+    mean, mean_error, used = coadd(stack, error=1.0 / snr, sigma=4.0)
+    print("S/N of the individual spectra:", np.round(snr))
+    print("S/N of the coadd:", np.round(np.median(mean / mean_error)))
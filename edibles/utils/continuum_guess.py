@@ -0,0 +1,160 @@
+"""Unsupervised continuum estimates that need no initial guesses.
+
+envelope_continuum follows the top of the spectrum: the flux is reduced to a
+high percentile per bin (which rejects single hot pixels and cosmic rays), and
+the continuum is the upper convex hull of those points, i.e. the shape a string
+pulled tight over the spectrum would take. This is the alpha-shape of the data
+in the limit of a large alpha, and needs only a sort: O(n log n). A concave
+envelope is not forced on convex parts of the spectrum, so broad depressions
+are bridged instead of followed.
+
+polynomial_continuum fits a polynomial with asymmetric sigma-clipping. All
+spectra of a stack (n_spectra, n_pixels) are fit at once by solving the
+weighted normal equations of every row as one batched linear system.
+"""
+
+import numpy as np
+from scipy.special import ndtri
+
+
+def upper_hull(x, y):
+    """Indices of the vertices of the upper convex hull of points sorted by x.
+
+    Args:
+        x (1darray): Increasing x values
+        y (1darray): y values
+
+    Returns:
+        1darray: Indices of the hull vertices, from the first to the last point
+
+    """
+    hull = []
+    for i in range(len(x)):
+        # Drop the last vertex while it lies on or below the line to the new point.
+        while len(hull) >= 2:
+            i0, i1 = hull[-2], hull[-1]
+            cross = (x[i1] - x[i0]) * (y[i] - y[i0]) - (y[i1] - y[i0]) * (x[i] - x[i0])
+            if cross < 0:
+                break
+            hull.pop()
+        hull.append(i)
+    return np.array(hull, dtype=int)
+
+
+def envelope_continuum(x, y, n_bins=100, percentile=90.0, offset=True):
+    """Upper-envelope continuum of a spectrum.
+
+    Args:
+        x (1darray): Wavelengths
+        y (1darray): Flux
+        n_bins (int): Number of bins the flux is reduced to before taking the hull;
+            None: use every point
+        percentile (float): Percentile of the flux taken in each bin (and its mean
+            wavelength), which rejects outliers above the continuum
+        offset (bool): If true, shift the envelope down by the expected distance of the
+            percentile above the mean for Gaussian noise, so it runs through the noise
+            rather than over its peaks. The noise is estimated from the differences of
+            neighbouring pixels, which absorption lines hardly affect. Only applied
+            when the flux is binned
+
+    Returns:
+        1darray: The continuum at x
+
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    order = np.argsort(x, kind="stable")
+    xs, ys = x[order], y[order]
+    good = np.isfinite(xs) & np.isfinite(ys)
+    xs, ys = xs[good], ys[good]
+
+    binned = n_bins is not None and n_bins < len(xs)
+    if not binned:
+        bx, by = xs, ys
+    else:
+        edges = np.linspace(0, len(xs), n_bins + 1).astype(int)
+        bins = np.repeat(np.arange(n_bins), np.diff(edges))
+        # Sort the flux within each bin, then read off the percentile of each bin.
+        within = np.lexsort((ys, bins))
+        counts = np.diff(edges)
+        rank = edges[:-1] + np.round((counts - 1) * percentile / 100.0).astype(int)
+        by = ys[within][rank]
+        bx = np.add.reduceat(xs, edges[:-1]) / counts
+
+    vertices = upper_hull(bx, by)
+    continuum = np.interp(x, bx[vertices], by[vertices])
+    if offset and binned:
+        noise = np.median(np.abs(np.diff(ys))) / (0.6745 * np.sqrt(2.0))
+        continuum -= noise * ndtri(percentile / 100.0)
+    return continuum
+
+
+def polynomial_continuum(x, y, degree=3, lower=None, upper=None, maxiters=5):
+    """Polynomial continuum with asymmetric sigma-clipping, for one or many spectra.
+
+    Args:
+        x (1darray): Wavelengths, shared by all spectra
+        y (1darray or 2darray): Flux, shape (n_pixels,) or (n_spectra, n_pixels);
+            NaN values are ignored
+        degree (int): Degree of the polynomial
+        lower (float): Reject points more than lower standard deviations below the
+            fit, None: no rejection below
+        upper (float): Reject points more than upper standard deviations above the
+            fit, None: no rejection above
+        maxiters (int): Maximum number of clipping iterations
+
+    Returns:
+        tuple: tuple containing:
+
+            1darray or 2darray: The continuum, same shape as y
+
+            1darray or 2darray: Boolean mask of the points used in the final fit
+
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+
+    # Scaled x keeps the Vandermonde matrix well conditioned.
+    t = (x - x.mean()) / (np.ptp(x) / 2.0 if np.ptp(x) > 0 else 1.0)
+    vander = np.vander(t, degree + 1)
+    mask = np.isfinite(y)
+    y0 = np.where(mask, y, 0.0)
+
+    for iteration in range(maxiters + 1):
+        w = mask.astype(float)
+        normal = np.einsum("ni,kn,nj->kij", vander, w, vander)
+        rhs = np.einsum("ni,kn->ki", vander, w * y0)
+        coefs = np.linalg.solve(normal, rhs[..., None])[..., 0]
+        continuum = coefs @ vander.T
+        if iteration == maxiters or (lower is None and upper is None):
+            break
+        resid = np.where(mask, y0 - continuum, 0.0)
+        std = np.sqrt((resid ** 2).sum(axis=1) / np.maximum(mask.sum(axis=1) - 1, 1))[:, None]
+        keep = np.isfinite(y)
+        if lower is not None:
+            keep &= y0 >= continuum - lower * std
+        if upper is not None:
+            keep &= y0 <= continuum + upper * std
+        if np.array_equal(keep, mask):
+            break
+        mask = keep
+
+    if single:
+        return continuum[0], mask[0]
+    return continuum, mask
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    from edibles.utils.edibles_spectrum import EdiblesSpectrum
+
+    sp = EdiblesSpectrum("/HD170740/RED_860/HD170740_w860_redl_20140915_O12.fits")
+    plt.plot(sp.wave, sp.flux, color="0.5")
+    plt.plot(sp.wave, envelope_continuum(sp.wave, sp.flux), label="envelope")
+    plt.plot(sp.wave, polynomial_continuum(sp.wave, sp.flux, lower=1.0, upper=3.0)[0],
+             label="polynomial")
+    plt.legend()
+    plt.show()
@@ -0,0 +1,191 @@
+"""Fit spline continua to all single-order spectra of the survey.
+
+The single-order rows of the obslog are trimmed with the order-edge trims of
+order_merging (``data/order_trims.csv``) and shared out over a process pool.
+Every order gets a spline fit, followed by a refit to the points that are not
+more than one standard deviation below it (Continuum.clipped_spline), which
+keeps absorption lines from pulling the continuum down. The refit is saved.
+
+The workers only fit; the parent process writes the continuum csv files, so
+there is one writer per file. Each file is rewritten atomically (write to a
+temporary file, then rename), and the name of every finished spectrum is
+appended to a checkpoint file. A re-run skips all spectra in the checkpoint,
+so an interrupted run can simply be started again. A save that is already in
+its file (a crash between the save and the checkpoint) is not written again.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from edibles import DATADIR, PYTHONDIR
+from edibles.continuum import Continuum, format_save, parse_saves
+from edibles.utils.edibles_spectrum import EdiblesSpectrum
+from edibles.utils.order_merging import trimmed_ranges
+
+CHECKPOINT_FILE = "continuum_pipeline_done.txt"
+
+
+def default_outdir(datadir=DATADIR):
+    """The continuum folder next to the data folder, where EdiblesSpectrum looks for continua."""
+    return datadir.replace("/DR4/data", "/DR4/continuum").replace(r"\DR4\data", r"\DR4\continuum")
+
+
+def read_checkpoint(checkpoint):
+    """Set of the obslog filenames listed in a checkpoint file (empty if it does not exist)."""
+    if not os.path.isfile(checkpoint):
+        return set()
+    with open(checkpoint) as f:
+        return set(line.strip() for line in f if line.strip())
+
+
+def fit_order(filename, wave_min, wave_max, n_anchors=4, clip_iterations=1, datadir=DATADIR):
+    """Clipped spline continuum of one trimmed order.
+
+    Args:
+        filename (str): File name as in the obslog
+        wave_min (float): Blue end of the order after trimming
+        wave_max (float): Red end of the order after trimming
+        n_anchors (int): The number of anchor points in the spline
+        clip_iterations (int): Maximum number of clipping iterations, see
+            Continuum.clipped_spline
+        datadir (str): Data release folder
+
+    Returns:
+        tuple: (x_points, y_points) of the anchors of the clipped fit
+
+    """
+    sp = EdiblesSpectrum(datadir + filename, noDATADIR=True)
+    idx = np.where(np.logical_and(sp.wave > wave_min, sp.wave < wave_max))
+    sp.wave = sp.wave[idx]
+    sp.flux = sp.flux[idx]
+
+    # Reject the points well below the fit (absorption lines) and refit.
+    cont = Continuum(sp, method="clipped_spline", n_anchors=n_anchors, lower=1.0,
+                     maxiters=clip_iterations, plot=False, verbose=0)
+
+    x_points = [cont.result.params[xname].value for xname in cont.model.xnames]
+    y_points = [cont.result.params[yname].value for yname in cont.model.ynames]
+    return x_points, y_points
+
+
+def _fit_task(task, n_anchors, clip_iterations, datadir):
+    """Worker: fit one order, returning (filename, anchors or None, error message)."""
+    filename, wave_min, wave_max = task
+    try:
+        return filename, fit_order(filename, wave_min, wave_max, n_anchors=n_anchors,
+                                   clip_iterations=clip_iterations, datadir=datadir), ""
+    except Exception as e:
+        return filename, None, "%s: %s" % (type(e).__name__, e)
+
+
+def write_save(csv_file, text):
+    """Append a save to a continuum csv file, replacing the file atomically.
+
+    The save is not written if the file already has a save with the same method,
+    anchors, user and comments; only its datetime may differ.
+
+    Args:
+        csv_file (str): The continuum csv file
+        text (str): The save, see format_save
+
+    Returns:
+        bool: True if the save was written, False if it was already in the file
+
+    """
+    os.makedirs(os.path.dirname(csv_file), exist_ok=True)
+    old = ""
+    if os.path.isfile(csv_file):
+        with open(csv_file) as f:
+            old = f.read()
+        keys = ["method", "n_anchors", "user", "comments", "x", "y"]
+        new = [parse_saves(text.splitlines())[0][key] for key in keys]
+        for save in parse_saves(old.splitlines()):
+            if [save.get(key) for key in keys] == new:
+                return False
+    tmp_file = csv_file + ".%d.tmp" % os.getpid()
+    with open(tmp_file, "w") as f:
+        f.write(old + text)
+    os.replace(tmp_file, csv_file)
+    return True
+
+
+def run_pipeline(obslog=None, user="EDIBLES", comments="Initial fit of order", n_anchors=4,
+                 clip_iterations=1, max_workers=None, datadir=None, outdir=None, checkpoint=None,
+                 verbose=1):
+    """Fit and save the continuum of every single-order spectrum in the obslog.
+
+    Args:
+        obslog (pandas.DataFrame): Observations to process, default: the full obslog.
+            Merged spectra are skipped.
+        user (str): The name saved with each continuum
+        comments (str): The comment saved with each continuum
+        n_anchors (int): The number of anchor points in the spline
+        clip_iterations (int): Maximum number of clipping iterations; the default of
+            1 is a single refit without the points far below the first fit
+        max_workers (int): Number of worker processes; 1 fits in this process.
+            Default: number of CPUs
+        datadir (str): Data release folder, default: DATADIR
+        outdir (str): Folder for the continuum csv files, default: the continuum
+            folder next to datadir
+        checkpoint (str): Checkpoint file, default: outdir/continuum_pipeline_done.txt
+        verbose (int): If > 0, print progress
+
+    Returns:
+        pandas.DataFrame: One row per single-order spectrum, with columns Filename,
+        Status ('done', 'skipped' or 'failed') and Message
+
+    """
+    datadir = DATADIR if datadir is None else datadir
+    outdir = default_outdir(datadir) if outdir is None else outdir
+    checkpoint = os.path.join(outdir, CHECKPOINT_FILE) if checkpoint is None else checkpoint
+    if obslog is None:
+        obslog = pd.read_csv(PYTHONDIR + "/data/DR4_ObsLog.csv")
+
+    orders = trimmed_ranges(obslog[obslog.Order.astype(str) != "ALL"])
+    finished = read_checkpoint(checkpoint)
+    todo = orders[~orders.Filename.isin(finished)]
+    tasks = list(zip(todo.Filename, todo.TrimWaveMin, todo.TrimWaveMax))
+    status = {filename: ("skipped", "") for filename in orders.Filename if filename in finished}
+    if verbose > 0:
+        print("Fitting {} of {} orders".format(len(tasks), len(orders)))
+
+    fit = partial(_fit_task, n_anchors=n_anchors, clip_iterations=clip_iterations, datadir=datadir)
+    os.makedirs(os.path.dirname(os.path.abspath(checkpoint)), exist_ok=True)
+    pool = None
+    if max_workers == 1:
+        results = map(fit, tasks)
+    else:
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+        results = pool.map(fit, tasks, chunksize=16)
+    try:
+        with open(checkpoint, "a") as done:
+            for count, (filename, anchors, message) in enumerate(results, 1):
+                if anchors is None:
+                    status[filename] = ("failed", message)
+                    if verbose > 0:
+                        print("Failed: {} ({})".format(filename, message))
+                    continue
+                x_points, y_points = anchors
+                text = format_save("clipped_spline", n_anchors, x_points, y_points, user, comments)
+                write_save(outdir + filename.replace(".fits", ".csv"), text)
+                done.write(filename + "\n")
+                done.flush()
+                status[filename] = ("done", "")
+                if verbose > 0 and count % 100 == 0:
+                    print('Completed {} of {} splines'.format(count, len(tasks)))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    if verbose > 0:
+        print('Completed all {} splines'.format(len(tasks)))
+    return pd.DataFrame([(filename,) + status[filename] for filename in orders.Filename
+                         if filename in status], columns=["Filename", "Status", "Message"])
+
+
+if __name__ == "__main__":
+    run_pipeline(user="Klay Kulik", comments="Initial fit of order")
@@ -0,0 +1,242 @@
+"""Robust continuum level and noise from the histogram of the flux.
+
+Over a stretch of spectrum that is mostly continuum, the flux values pile up
+around the continuum level with the spread of the noise, while absorption (or
+emission) lines make a tail. The peak of the histogram and its width therefore
+give the continuum level and the noise, without fitting a continuum. The noise
+can also be measured on the derivative of the flux, as the scatter in the
+longest flat stretch of the spectrum (continuum_sigma).
+
+Everything works on stacks of shape (n_rows, n_values): the histograms are
+built with integer bin indices and one bincount for all rows, the centre and
+width of the peak come from a closed-form Gaussian fit (a weighted parabola
+through the logarithm of the counts), and an iterative least-squares fit is only
+done when asked for, as a refinement.
+rolling_continuum applies this to sliding windows of one spectrum, giving a
+continuum and noise map that can be used as fitting weights.
+"""
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.optimize import leastsq
+
+
+def _gaussian(p, x):
+    return p[0] * np.exp(-0.5 * ((x - p[1]) / p[2]) ** 2)
+
+
+def histogram_gaussian(values, n_bins=20, refine=False):
+    """Centre and width of the peak of the histogram of each row.
+
+    The bins around the peak are selected as in the EDIBLES superspectrum code:
+    the peak plus 4 bins on the side of the shorter tail and 8 bins on the side
+    of the longer tail (or 5 on either side if the tails are similar), with the
+    tails running from the peak to the nearest empty bins.
+
+    Args:
+        values (1darray or 2darray): Values, shape (n_values,) or (n_rows, n_values);
+            NaN values are ignored
+        n_bins (int): Number of histogram bins between the minimum and maximum of a row
+        refine (bool): If true, refine the closed-form estimate with a least-squares Gaussian fit
+            to the selected bins
+
+    Returns:
+        tuple: (centre, sigma), floats or 1darrays with one value per row
+
+    """
+    values = np.asarray(values, dtype=float)
+    single = values.ndim == 1
+    values = np.atleast_2d(values)
+    n_rows = values.shape[0]
+    good = np.isfinite(values)
+
+    lo = np.nanmin(np.where(good, values, np.nan), axis=1)
+    hi = np.nanmax(np.where(good, values, np.nan), axis=1)
+    width = (hi - lo) / n_bins
+    # A row of equal values falls in one bin of unit width centred on the value.
+    degenerate = ~(width > 0)
+    width[degenerate] = 1.0
+    lo[degenerate] -= 0.5
+
+    # Integer bin index of every value, and all histograms with one bincount.
+    index = np.clip(((values - lo[:, None]) / width[:, None]), 0, n_bins - 1)
+    index = np.where(good, index, 0).astype(int)
+    flat = (np.arange(n_rows)[:, None] * n_bins + index).ravel()
+    counts = np.bincount(flat, weights=good.ravel(), minlength=n_rows * n_bins)
+    counts = counts.reshape(n_rows, n_bins)
+    centres = lo[:, None] + (np.arange(n_bins) + 0.5) * width[:, None]
+
+    # Select the bins around the peak, more on the side of the longer tail.
+    bins = np.arange(n_bins)[None, :]
+    peak = np.argmax(counts, axis=1)[:, None]
+    empty = counts == 0
+    left = np.where(empty & (bins <= peak), bins, 0).max(axis=1)[:, None]
+    right = np.where(empty & (bins >= peak), bins, n_bins - 1).min(axis=1)[:, None]
+    total = np.maximum((right - peak) + (peak - left), 1)
+    ratio = (right - peak) / total
+    below = np.where(ratio >= 0.66, 8, np.where(ratio <= 0.33, 4, 5))
+    above = np.where(ratio >= 0.66, 4, np.where(ratio <= 0.33, 8, 5))
+    selected = (bins >= peak - below) & (bins <= peak + above)
+    c = np.where(selected, counts, 0.0)
+
+    # Closed-form moments of the selected histogram, with Sheppard's correction for the binning.
+    n = np.maximum(c.sum(axis=1), 1)
+    centre = (c * centres).sum(axis=1) / n
+    variance = (c * (centres - centre[:, None]) ** 2).sum(axis=1) / n - width ** 2 / 12.0
+    sigma = np.sqrt(np.maximum(variance, 0.0))
+
+    # The selection truncates the tails, so the moments underestimate the width. A
+    # Gaussian is a parabola in log(counts): fit that parabola in closed form, with
+    # weights counts**2 (Guo 2011), and keep the moments where it is not concave.
+    t = (centres - centre[:, None]) / width[:, None]
+    w = c ** 2
+    log_c = np.log(np.where(c > 0, c, 1.0))
+    powers = t[..., None] ** np.arange(3)
+    normal = np.einsum("kni,kn,knj->kij", powers, w, powers)
+    rhs = np.einsum("kni,kn->ki", powers, w * log_c)
+    solvable = (c > 0).sum(axis=1) >= 3
+    normal[~solvable] = np.eye(3)
+    coefs = np.linalg.solve(normal, rhs[..., None])[..., 0]
+    concave = solvable & (coefs[:, 2] < 0)
+    curvature = np.where(concave, coefs[:, 2], -1.0)
+    centre = np.where(concave, centre - width * coefs[:, 1] / (2 * curvature), centre)
+    sigma = np.where(concave, width * np.sqrt(-0.5 / curvature), sigma)
+
+    if refine:
+        def errfunc(p, x, y):
+            return y - _gaussian(p, x)
+
+        for row in range(n_rows):
+            sel = selected[row]
+            if sel.sum() >= 3 and sigma[row] > 0:
+                init = [counts[row, sel].max(), centre[row], sigma[row]]
+                p = leastsq(errfunc, init, args=(centres[row, sel], counts[row, sel]))[0]
+                centre[row], sigma[row] = p[1], abs(p[2])
+
+    if single:
+        return centre[0], sigma[0]
+    return centre, sigma
+
+
+def continuum_level(flux, n_bins=20, refine=False):
+    """Continuum level and noise of each row as the peak of its flux histogram.
+
+    Args:
+        flux (1darray or 2darray): Flux, shape (n_pixels,) or (n_spectra, n_pixels)
+        n_bins (int): Number of histogram bins
+        refine (bool): If true, refine with a Gaussian fit, see histogram_gaussian
+
+    Returns:
+        tuple: (level, sigma), floats or 1darrays with one value per spectrum
+
+    """
+    return histogram_gaussian(flux, n_bins=n_bins, refine=refine)
+
+
+def continuum_sigma(wave, flux, n_bins=20, min_length=5, refine=False):
+    """Noise of each spectrum, measured in its longest flat region.
+
+    Pixels where the derivative of the flux is within one sigma of the peak of
+    the derivative histogram are flat; the noise is the standard deviation of
+    the flux in the longest run of consecutive flat pixels.
+
+    Args:
+        wave (1darray): Wavelengths, shared by all spectra
+        flux (1darray or 2darray): Flux, shape (n_pixels,) or (n_spectra, n_pixels)
+        n_bins (int): Number of histogram bins
+        min_length (int): Minimum number of pixels in a flat region
+        refine (bool): If true, refine the derivative histogram with a Gaussian fit
+
+    Returns:
+        float or 1darray: The noise of each spectrum; NaN if it has no flat region
+
+    """
+    wave = np.asarray(wave, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+    single = flux.ndim == 1
+    flux = np.atleast_2d(flux)
+    n_rows, n_pixels = flux.shape
+
+    dydx = np.diff(flux, axis=1) / np.diff(wave)[None, :]
+    centre, sigma = histogram_gaussian(dydx, n_bins=n_bins, refine=refine)
+    flat = np.abs(dydx - centre[:, None]) <= sigma[:, None]
+    n_flat = n_pixels - 1
+
+    # Runs of flat pixels: pad every row with False so runs cannot cross rows.
+    padded = np.zeros((n_rows, n_flat + 1), dtype=bool)
+    padded[:, 1:] = flat
+    step = np.diff(np.concatenate([padded, np.zeros((n_rows, 1), dtype=bool)], axis=1)
+                   .astype(np.int8), axis=1)
+    starts = np.flatnonzero(step.ravel() == 1)
+    stops = np.flatnonzero(step.ravel() == -1)
+    row = starts // (n_flat + 1)
+    start = starts % (n_flat + 1)
+    length = stops - starts
+
+    # Longest run of each row.
+    order = np.lexsort((-length, row))
+    row, start, length = row[order], start[order], length[order]
+    first = np.r_[True, row[1:] != row[:-1]]
+    row, start, length = row[first], start[first], length[first]
+    keep = length >= min_length
+    row, start, length = row[keep], start[keep], length[keep]
+
+    # Standard deviation of the flux in each run from cumulative sums. Derivative
+    # index i lies between pixels i and i + 1; the run is taken as its right pixels.
+    cumsum = np.concatenate([np.zeros((n_rows, 1)), np.cumsum(flux, axis=1)], axis=1)
+    cumsum2 = np.concatenate([np.zeros((n_rows, 1)), np.cumsum(flux ** 2, axis=1)], axis=1)
+    stop = start + length
+    s1 = cumsum[row, stop + 1] - cumsum[row, start + 1]
+    s2 = cumsum2[row, stop + 1] - cumsum2[row, start + 1]
+    noise = np.full(n_rows, np.nan)
+    noise[row] = np.sqrt(np.maximum(s2 / length - (s1 / length) ** 2, 0.0))
+
+    if single:
+        return noise[0]
+    return noise
+
+
+def rolling_continuum(wave, flux, window=201, step=None, n_bins=20, refine=False):
+    """Continuum level, noise and S/N maps from sliding windows over a spectrum.
+
+    The histogram estimate of continuum_level is computed for all windows in
+    one call, and interpolated back onto the pixels from the window centres.
+
+    Args:
+        wave (1darray): Wavelengths
+        flux (1darray): Flux
+        window (int): Window length, in pixels
+        step (int): Distance between windows, in pixels, default: window // 4
+        n_bins (int): Number of histogram bins
+        refine (bool): If true, refine with a Gaussian fit, see histogram_gaussian
+
+    Returns:
+        tuple: (level, sigma, snr), each a 1darray with one value per pixel
+
+    """
+    wave = np.asarray(wave, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+    window = min(window, len(flux))
+    step = max(window // 4, 1) if step is None else step
+
+    windows = sliding_window_view(flux, window)[::step]
+    centres = sliding_window_view(wave, window)[::step].mean(axis=1)
+    level, sigma = continuum_level(windows, n_bins=n_bins, refine=refine)
+
+    level = np.interp(wave, centres, level)
+    sigma = np.interp(wave, centres, sigma)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        snr = level / sigma
+    return level, sigma, snr
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng()
+    wave = np.arange(3300, 3310, 0.02)
+    flux = 1 - 0.2 * np.exp(-0.5 * ((wave - 3302.4) / 0.05) ** 2)
+    stack = flux + rng.normal(0, 0.01, (50, len(wave)))
+
+    level, sigma = continuum_level(stack)
+    print("Continuum level: %.4f +- %.4f" % (level.mean(), level.std()))
+    print("Noise: %.4f (true 0.01)" % sigma.mean())
+    print("Noise in flat regions: %.4f" % np.nanmean(continuum_sigma(wave, stack)))
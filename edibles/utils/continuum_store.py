@@ -0,0 +1,250 @@
+"""SQLite store of saved continua.
+
+Each saved continuum is one row, keyed by the obslog filename of the spectrum
+and its save number (0, 1, ... in the order they were added, as in the
+continuum csv files). The anchors are stored as binary float64 arrays, so a
+lookup is one primary-key read and no text has to be parsed. The store uses
+SQLite's write-ahead log: any number of processes can read while one appends,
+and appends from several processes are serialized by the database lock.
+
+Table:
+
+    continua:  filename, save_num, method, n_anchors, datetime, user, comments,
+               x (BLOB), y (BLOB)
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from edibles import CACHEDIR, DATADIR
+from edibles.continuum import read_saves
+
+_COLUMNS = ["filename", "save_num", "method", "n_anchors", "datetime", "user", "comments", "x", "y"]
+_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def default_store_file():
+    """Location of the default store: CACHEDIR/edibles_continua.sqlite"""
+    return os.path.join(CACHEDIR, "edibles_continua.sqlite")
+
+
+def obslog_filename(filename, datadir=DATADIR):
+    """The obslog form of a spectrum file name: relative to datadir, starting with '/'."""
+    filename = str(filename)
+    if filename.startswith(datadir):
+        filename = filename[len(datadir):]
+    return "/" + filename.lstrip("/")
+
+
+def _to_blob(values):
+    return np.asarray(values, dtype=np.float64).tobytes()
+
+
+def _from_blob(blob):
+    return np.frombuffer(blob, dtype=np.float64)
+
+
+class ContinuumStore:
+    """Indexed store of saved continua.
+
+    Args:
+        db_file (str): SQLite file, created if it does not exist, default: default_store_file()
+
+    """
+
+    def __init__(self, db_file=None):
+        self.db_file = default_store_file() if db_file is None else db_file
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_file)), exist_ok=True)
+        self._local = threading.local()
+        with self.connection as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS continua (filename TEXT, "
+                               "save_num INTEGER, method TEXT, n_anchors INTEGER, datetime TEXT, "
+                               "user TEXT, comments TEXT, x BLOB, y BLOB, "
+                               "PRIMARY KEY (filename, save_num)) WITHOUT ROWID")
+
+    @property
+    def connection(self):
+        """sqlite3.Connection: The connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_file, timeout=60.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row_to_save(row):
+        save = dict(zip(_COLUMNS, row))
+        save["x"] = _from_blob(save["x"])
+        save["y"] = _from_blob(save["y"])
+        if save["datetime"] is not None:
+            save["datetime"] = datetime.strptime(save["datetime"], _DATETIME_FORMAT)
+        return save
+
+    def _insert(self, connection, filename, x_points, y_points, method, user, comments, date_time):
+        # Runs inside a write transaction, so the save number cannot be taken twice.
+        save_num = connection.execute("SELECT COALESCE(MAX(save_num) + 1, 0) FROM continua "
+                                      "WHERE filename = ?", (filename,)).fetchone()[0]
+        date_time = datetime.now() if date_time is None else date_time
+        connection.execute("INSERT INTO continua VALUES (?,?,?,?,?,?,?,?,?)",
+                           (filename, save_num, method, len(x_points),
+                            date_time.strftime(_DATETIME_FORMAT), user, comments,
+                            _to_blob(x_points), _to_blob(y_points)))
+        return save_num
+
+    def add(self, filename, x_points, y_points, method="spline", user="", comments="",
+            date_time=None):
+        """Append a saved continuum.
+
+        Args:
+            filename (str): File name of the spectrum as in the obslog
+            x_points (list): x values of the anchor points
+            y_points (list): y values of the anchor points
+            method (str): The method of fitting
+            user (str): The name of the person adding the data
+            comments (str): Any comments about the data
+            date_time (datetime): Time of the save, default: now
+
+        Returns:
+            int: The save number
+
+        """
+        assert len(x_points) == len(y_points), "x and y anchors must have the same length"
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            save_num = self._insert(connection, obslog_filename(filename), x_points, y_points,
+                                    method, user, comments, date_time)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return save_num
+
+    def count(self, filename):
+        """Number of saved continua of a spectrum."""
+        return self.connection.execute("SELECT COUNT(*) FROM continua WHERE filename = ?",
+                                       (obslog_filename(filename),)).fetchone()[0]
+
+    def get(self, filename, save_num=-1):
+        """One saved continuum.
+
+        Args:
+            filename (str): File name of the spectrum as in the obslog
+            save_num (int): Save number; negative numbers count from the last save
+
+        Returns:
+            dict: filename, save_num, method, n_anchors, datetime, user, comments and the
+            anchors x and y (1darrays); None if there is no such save
+
+        """
+        filename = obslog_filename(filename)
+        if save_num < 0:
+            save_num += self.count(filename)
+        row = self.connection.execute("SELECT %s FROM continua WHERE filename = ? AND save_num = ?"
+                                      % ", ".join(_COLUMNS), (filename, save_num)).fetchone()
+        return None if row is None else self._row_to_save(row)
+
+    def saves(self, filename):
+        """All saved continua of a spectrum, in save order (see get)."""
+        rows = self.connection.execute("SELECT %s FROM continua WHERE filename = ? ORDER BY save_num"
+                                       % ", ".join(_COLUMNS), (obslog_filename(filename),))
+        return [self._row_to_save(row) for row in rows]
+
+    def latest(self, filenames):
+        """The last saved continuum of many spectra, in one query.
+
+        Args:
+            filenames (list): File names as in the obslog
+
+        Returns:
+            dict: filename -> save (see get), for the spectra that have one
+
+        """
+        filenames = [obslog_filename(filename) for filename in filenames]
+        connection = self.connection
+        connection.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (filename TEXT PRIMARY KEY)")
+        connection.execute("BEGIN")
+        try:
+            connection.execute("DELETE FROM wanted")
+            connection.executemany("INSERT OR IGNORE INTO wanted VALUES (?)",
+                                   [(filename,) for filename in filenames])
+            rows = connection.execute(
+                "SELECT %s FROM continua c JOIN wanted USING (filename) WHERE c.save_num = "
+                "(SELECT MAX(save_num) FROM continua WHERE filename = c.filename)"
+                % ", ".join("c." + column for column in _COLUMNS)).fetchall()
+        finally:
+            connection.execute("COMMIT")
+        return {row[0]: self._row_to_save(row) for row in rows}
+
+    def import_csv(self, csv_file, filename=None, datadir=DATADIR):
+        """Add the saves of a continuum csv file that are not in the store yet.
+
+        Saves are matched on their datetime, so a file can be imported again
+        after new saves were appended to it.
+
+        Args:
+            csv_file (str): The continuum csv file
+            filename (str): File name of the spectrum as in the obslog, default: derived
+                from csv_file, which must then be in the continuum folder
+            datadir (str): Data release folder, to derive the file name
+
+        Returns:
+            int: Number of saves added
+
+        """
+        if filename is None:
+            continuum_dir = datadir.replace("/DR4/data", "/DR4/continuum")
+            filename = str(csv_file)[len(continuum_dir):].replace(".csv", ".fits")
+        filename = obslog_filename(filename)
+
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            known = set(row[0] for row in connection.execute(
+                "SELECT datetime FROM continua WHERE filename = ?", (filename,)))
+            added = 0
+            for save in read_saves(csv_file):
+                date_time = save.get("datetime")
+                if date_time is not None and date_time.strftime(_DATETIME_FORMAT) in known:
+                    continue
+                self._insert(connection, filename, save["x"], save["y"], save.get("method"),
+                             save.get("user"), save.get("comments"), date_time)
+                added += 1
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return added
+
+    def import_folder(self, continuum_dir=None, datadir=DATADIR):
+        """Import all continuum csv files below a folder, see import_csv.
+
+        Args:
+            continuum_dir (str): Folder to search, default: the continuum folder next to datadir
+            datadir (str): Data release folder
+
+        Returns:
+            int: Number of saves added
+
+        """
+        if continuum_dir is None:
+            continuum_dir = datadir.replace("/DR4/data", "/DR4/continuum")
+        added = 0
+        for path, dirs, files in os.walk(continuum_dir):
+            dirs.sort()
+            for file in sorted(files):
+                if file.endswith(".csv"):
+                    csv_file = os.path.join(path, file)
+                    added += self.import_csv(csv_file,
+                                             filename=csv_file[len(continuum_dir):].replace(".csv", ".fits"))
+        return added
+
+
+if __name__ == "__main__":
+    store = ContinuumStore()
+    print("Imported {} saved continua".format(store.import_folder()))
@@ -1,3 +1,8 @@
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -5,98 +10,439 @@ import matplotlib.pyplot as plt
 from pathlib import Path
 from edibles import DATADIR
 from edibles import PYTHONDIR
+from edibles import CACHEDIR
 from edibles.utils.edibles_spectrum import EdiblesSpectrum
+from edibles.utils.obslog_index import ObsLogIndex, SkyIndex, read_simbad_positions
+
+
+# Attribute name -> (file relative to the data folder, read_csv keywords, categorical columns)
+_LOG_FILES = {
+    "obslog": ("DR4_ObsLog.csv", {}, ["Object", "Order"]),
+    "ebvlog": ("sightline_data/Formatted_EBV.csv", {}, ["object"]),
+    "sptypelog": ("sightline_data/Formatted_SpType.csv", {}, ["object"]),
+    "nhilog": ("sightline_data/Formatted_LogN(HI).csv", {}, ["object"]),
+    "nhiilog": ("sightline_data/Formatted_LogN(H2).csv", {}, ["object"]),
+    "fh2log": ("sightline_data/Formatted_f(H2).csv", {}, ["object"]),
+    "rvlog": ("sightline_data/Formatted_RV.csv", {}, ["object"]),
+    "avlog": ("sightline_data/Formatted_AV.csv", {}, ["object"]),
+    "object_log": ("sightline_data/ObservedObjects.csv", {"names": ["object"], "header": 0}, []),
+}
+
+# Parameter name used in the filter keywords -> attribute holding its sightline table
+_PARAMETER_LOGS = {
+    "EBV": "ebvlog",
+    "SpType": "sptypelog",
+    "LogNHI": "nhilog",
+    "LogNHII": "nhiilog",
+    "fH2": "fh2log",
+    "RV": "rvlog",
+    "AV": "avlog",
+}
+_PARAMETER_KEYS = [name + suffix for name in _PARAMETER_LOGS
+                   for suffix in ("", "_min", "_max", "_reference")]
+# Cone search: Near is an object name or an (RA, DEC) tuple in degrees, Radius in degrees
+_SKY_KEYS = ["Near", "Radius"]
+_CONSTRAINT_KEYS = _PARAMETER_KEYS + _SKY_KEYS
+_QUERY_KEYS = ["object", "Wave", "WaveMin", "WaveMax", "MergedOnly", "OrdersOnly"] + _CONSTRAINT_KEYS
+_QUERY_CACHE_SIZE = 4096
+# Catalogue positions of the observed objects, preferred over the obslog headers
+_SIMBAD_FILE = PYTHONDIR + "/data/sightline_data/SIMBAD_query_observed_Oct06_2020.ascii"
+
+_CACHE_VERSION = 1
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+
+def _constraints(**keywords):
+    """The sightline and sky constraints that were given (not None), from all constraint keywords."""
+    assert set(keywords) == set(_CONSTRAINT_KEYS), "Constraint keywords out of sync with _CONSTRAINT_KEYS"
+    return {key: value for key, value in keywords.items() if value is not None}
+
+
+def _source_signature(folder):
+    """Name, modification time and size of every source CSV; the cache is valid while these match."""
+    signature = [_CACHE_VERSION]
+    for name, (relpath, _, _) in sorted(_LOG_FILES.items()):
+        stat = os.stat(folder / relpath)
+        signature.append((name, relpath, stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+def _read_logs(folder):
+    """Read all source CSVs into typed tables, with repeated strings as categoricals."""
+    tables = {}
+    for name, (relpath, kwargs, categorical) in _LOG_FILES.items():
+        table = pd.read_csv(folder / relpath, **kwargs)
+        for column in categorical:
+            table[column] = table[column].astype("category")
+        tables[name] = table
+    return tables
+
+
+def _load_logs(folder, cache_file=None):
+    """Return the tables from the binary cache if it is up to date, else read and cache them.
+
+    Args:
+        folder (Path): Folder holding the source CSVs
+        cache_file (str): Pickle file for the cache, None: do not cache
+
+    Returns:
+        dict: attribute name -> pandas.DataFrame
+
+    """
+    signature = _source_signature(folder)
+    if cache_file is not None and os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                cached = pickle.load(f)
+            if cached["signature"] == signature:
+                return cached["tables"]
+        except Exception:
+            # A corrupt or incompatible cache is simply rebuilt.
+            pass
+
+    tables = _read_logs(folder)
+    if cache_file is not None:
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp_file = cache_file + ".%d.tmp" % os.getpid()
+            with open(tmp_file, "wb") as f:
+                pickle.dump({"signature": signature, "tables": tables}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass
+    return tables
 
 
 class EdiblesOracle:
     """
     This class will process the EDIBLES obs log and target info files.
     Users can then query the oracle for observations matching specific criteria.
+
+    The CSV files are parsed once and stored in a binary cache in CACHEDIR, which
+    is rebuilt automatically when any of the CSV files changes. Use
+    EdiblesOracle.shared() to get one oracle per process instead of a new one.
+
+    With backend='sqlite' the queries are compiled to SQL against the shared
+    SQLite store of obslog_db instead, and the tables are only loaded into
+    memory if they are accessed directly (e.g. oracle.obslog).
+
+    Args:
+        verbose (bool): If true, print DATADIR on creation
+        cache (bool): If false, always read the CSV files and do not touch the cache
+        backend (str): 'pandas' (in-memory tables) or 'sqlite'
+        db_file (str): SQLite store for the sqlite backend, default: obslog_db.default_db_file()
+
     """
 
-    def __init__(self):
-        print(DATADIR)
-        
+    def __init__(self, verbose=False, cache=True, backend="pandas", db_file=None):
+        if verbose:
+            print(DATADIR)
+        assert backend in ("pandas", "sqlite"), "backend must be 'pandas' or 'sqlite'"
+
         folder = Path(PYTHONDIR+"/data")
-        filename=folder /"DR4_ObsLog.csv"
-        self.obslog = pd.read_csv(filename)
-        filename=folder /"sightline_data"/"Formatted_EBV.csv"
-        self.ebvlog = pd.read_csv(filename)
-        filename=folder /"sightline_data"/"Formatted_SpType.csv"
-        self.sptypelog = pd.read_csv(filename)
-        filename = folder /"sightline_data"/"Formatted_LogN(HI).csv"
-        self.nhilog = pd.read_csv(filename)
-        filename = folder /"sightline_data"/"Formatted_LogN(H2).csv"
-        self.nhiilog = pd.read_csv(filename)
-        filename = folder /"sightline_data"/"Formatted_f(H2).csv"
-        self.fh2log = pd.read_csv(filename)
-        filename = folder /"sightline_data"/"Formatted_RV.csv"
-        self.rvlog = pd.read_csv(filename)
-        filename = folder /"sightline_data"/"Formatted_AV.csv"
-        self.avlog = pd.read_csv(filename)
-        
-        filename = folder /"sightline_data"/"ObservedObjects.csv"
-        self.object_log = pd.read_csv(filename,names=["object"],header=0)
-        
-        
+        self._signature = _source_signature(folder)
+        self._query_cache = OrderedDict()
+        self.db = None
+        if backend == "sqlite":
+            from edibles.utils.obslog_db import ObsLogDB
+            self.db = ObsLogDB(db_file)
+        else:
+            cache_file = os.path.join(CACHEDIR, "oracle_tables.pkl") if cache else None
+            for name, table in _load_logs(folder, cache_file=cache_file).items():
+                setattr(self, name, table)
+
         #print(self.sptypelog.dtypes)
         # total_rows = len(self.ebvlog.index)
         # print(total_rows)
 
+    @classmethod
+    def shared(cls):
+        """Return the oracle shared by the whole process.
+
+        The oracle is created on first use and replaced when one of the source
+        CSV files changes. Its tables must be treated as read-only.
+
+        Returns:
+            EdiblesOracle: The shared oracle
+
+        """
+        global _SHARED
+        with _SHARED_LOCK:
+            folder = Path(PYTHONDIR+"/data")
+            if _SHARED is None or _SHARED._signature != _source_signature(folder):
+                _SHARED = cls()
+            return _SHARED
+
+    def __getattr__(self, name):
+        # With the sqlite backend, the tables are read from the store on first access.
+        if name in _LOG_FILES and self.__dict__.get("db") is not None:
+            table = self.db.table(name)
+            setattr(self, name, table)
+            return table
+        raise AttributeError("%r object has no attribute %r" % (type(self).__name__, name))
+
+    def _selectFiles(self, objects=None, wave=None, wave_min=None, wave_max=None,
+                     MergedOnly=False, OrdersOnly=False):
+        """Filenames of the obslog rows matching the criteria, from the index or the SQLite store."""
+        if self.db is not None:
+            return self.db.select_files(objects=objects, wave=wave, wave_min=wave_min,
+                                        wave_max=wave_max, MergedOnly=MergedOnly,
+                                        OrdersOnly=OrdersOnly)
+        ind = self.index.select(objects=objects, wave=wave, wave_min=wave_min, wave_max=wave_max,
+                                MergedOnly=MergedOnly, OrdersOnly=OrdersOnly)
+        return self.obslog.iloc[ind].Filename
+
+    @property
+    def index(self):
+        """ObsLogIndex: Interval and hash indexes on the obslog, built on first use"""
+        if getattr(self, "_index", None) is None:
+            self._index = ObsLogIndex(self.obslog)
+        return self._index
+
+    @property
+    def sky_index(self):
+        """SkyIndex: KD-tree of the object positions in the obslog, built on first use.
+
+        The SIMBAD positions in sightline_data are used where they exist.
+        """
+        if getattr(self, "_sky_index", None) is None:
+            positions = None
+            if os.path.isfile(_SIMBAD_FILE):
+                positions = read_simbad_positions(_SIMBAD_FILE)
+            self._sky_index = SkyIndex.from_obslog(self.obslog, positions=positions)
+        return self._sky_index
+
+    def _skyPosition(self, near):
+        """(RA, DEC) in degrees of an object name or an (RA, DEC) pair."""
+        if isinstance(near, str):
+            return self.sky_index.position(near)
+        ra, dec = near
+        return float(ra), float(dec)
+
     def _getObsListFilteredByObsLogParameters(self, object=None, Wave=None, WaveMin=None, WaveMax=None, MergedOnly=False, OrdersOnly=False):
         '''Filter all the observations in the ObsLog by the parameters
         contained in the obslog, i.e. by object (if specified), wavelength
         range or merged versus specific orders. '''
-        
-        # We will use Boolean matches for all filter criteria. 
-        
-        #print('Inside the function: object is', object)
-
-        bool_object_matches = np.zeros(len(self.obslog.index),dtype=bool)
-        #print(object.dtype)
-        if object is None:
-            bool_object_matches = np.ones(len(self.ebvlog.index),dtype=bool)
-        elif (isinstance(object, np.ndarray) | isinstance(object, list)):
-                for thisobject in object:
-                    #print("Object in loop:", thisobject)
-                    #print(self.obslog.Object == thisobject)
-                    bool_object_matches = (self.obslog.Object == thisobject) | (bool_object_matches)
-                    #print(bool_object_matches.sum())
-        else: 
-             bool_object_matches = self.ebvlog.object == object
-
-        #print('Inside the function: number of matches is ', bool_object_matches.sum())
 
+        # All criteria are answered by the obslog index: the object index gives the
+        # candidate rows, or the interval index if no object is specified.
+        if object is not None and not (isinstance(object, np.ndarray) | isinstance(object, list)):
+            object = [object]
 
         # Do we have to filter out merged or single-order spectra? Note that if both
         # MergedOnly and OrdersOnly are True, only the Merged spectra will be returned.
         if MergedOnly and OrdersOnly:
             print("EDIBLES Oracle WARNING: ONLY RETURNING MERGED SPECTRA")
 
-        bool_order_matches = self.obslog.Order != "Z"
-        if OrdersOnly is True:
-            bool_order_matches = self.obslog.Order != "ALL"
-        if MergedOnly is True:
-            bool_order_matches = self.obslog.Order == "ALL"
-
-        #print(bool_order_matches)
-        
-        bool_wave_matches = np.ones(len(self.obslog.index),dtype=bool)
-        if Wave: 
-            bool_wave_matches = (self.obslog.WaveMin < Wave) & (self.obslog.WaveMax > Wave)
-        if WaveMin: 
-            bool_wave_matches = (self.obslog.WaveMax > WaveMin) & (bool_wave_matches)
-        if WaveMax: 
-            bool_wave_matches = (self.obslog.WaveMin < WaveMax) & (bool_wave_matches)
-
-        ind = np.where(bool_object_matches & bool_order_matches & bool_wave_matches)
-        #print(ind)
+        files = self._selectFiles(objects=object, wave=Wave if Wave else None,
+                                  wave_min=WaveMin if WaveMin else None,
+                                  wave_max=WaveMax if WaveMax else None,
+                                  MergedOnly=MergedOnly, OrdersOnly=OrdersOnly)
         print("**Filtered File List**")
-        print(self.obslog.iloc[ind].Filename)
-        return self.obslog.iloc[ind].Filename            
-
+        print(files)
+        return files
+
+
+    @staticmethod
+    def _queryKey(query):
+        """Normalized, hashable form of one batch query; missing values become None."""
+        def given(value):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                return None
+            return value
+
+        def hashable(value):
+            # e.g. Near=[ra, dec] or a numpy array
+            if isinstance(value, np.ndarray):
+                value = value.tolist()
+            if isinstance(value, (list, tuple)):
+                return tuple(hashable(item) for item in value)
+            return value
+
+        unknown = set(query) - set(_QUERY_KEYS)
+        assert not unknown, "Unknown query keys: %s" % sorted(unknown)
+
+        objects = given(query.get("object"))
+        if objects is not None:
+            objects = (objects,) if isinstance(objects, str) else tuple(sorted(set(objects)))
+
+        wave = given(query.get("Wave"))
+        lo = [w for w in (wave, given(query.get("WaveMin"))) if w is not None]
+        hi = [w for w in (wave, given(query.get("WaveMax"))) if w is not None]
+        lo = float(max(lo)) if lo else None
+        hi = float(min(hi)) if hi else None
+
+        if given(query.get("MergedOnly")):
+            mode = "merged"
+        elif given(query.get("OrdersOnly")):
+            mode = "orders"
+        else:
+            mode = None
+
+        constraints = tuple((key, hashable(given(query.get(key)))) for key in _CONSTRAINT_KEYS
+                            if given(query.get(key)) is not None)
+        return objects, lo, hi, mode, constraints
+
+    def _buildSightlineTables(self):
+        """Build the wide table of preferred values and the long table of all values."""
+        wide = self.object_log[["object"]].astype(str)
+        long = []
+        for name, attribute in _PARAMETER_LOGS.items():
+            log = getattr(self, attribute)
+            # Objects with several preferred values get one row per value (a cross product).
+            preferred = log.loc[log.preferred_flag == 1, ["object", "value"]].astype({"object": str})
+            wide = wide.merge(preferred.rename(columns={"value": name}), on="object", how="left")
+            long.append(log.assign(parameter=name, object=log.object.astype(str)))
+        self._sightline_table = wide
+        self._parameter_table = pd.concat(long, ignore_index=True)[
+            ["object", "parameter", "value", "unc_lower", "unc_upper", "reference_id", "preferred_flag"]]
+
+    @property
+    def sightline_table(self):
+        """pandas.DataFrame: One column per sightline parameter with its preferred value;
+        one row per object and combination of preferred values"""
+        if getattr(self, "_sightline_table", None) is None:
+            self._buildSightlineTables()
+        return self._sightline_table
+
+    @property
+    def parameter_table(self):
+        """pandas.DataFrame: All values of all sightline parameters, with their references"""
+        if getattr(self, "_parameter_table", None) is None:
+            self._buildSightlineTables()
+        return self._parameter_table
+
+    def _objectsMatchingParameters(self, constraints):
+        """Set of observed objects that satisfy all sightline-parameter constraints.
+
+        Constraints on preferred values are one predicate on the columns of the wide
+        sightline table; constraints on other references are evaluated on the rows
+        of that parameter only and enter the predicate as an object membership.
+        This follows the FilterEngine rules: exact value, strict lower and upper
+        limits, and reference None (preferred), 'All' or a reference id. With the
+        sqlite backend the same rules are compiled to one SQL INTERSECT query.
+        A Near/Radius cone is answered by the sky index and intersected with the result.
+        """
+        constraints = dict(constraints)
+        near, radius = constraints.pop("Near", None), constraints.pop("Radius", None)
+        if near is not None or radius is not None:
+            assert near is not None and radius is not None, "Near and Radius must be given together"
+            rows, _ = self.sky_index.cone(*self._skyPosition(near), radius)
+            in_cone = set(self.sky_index.names[rows])
+            return self._objectsMatchingParameters(constraints) & in_cone
+        if self.db is not None:
+            return self.db.matching_objects(constraints)
+        wide = self.sightline_table
+        keep = np.ones(len(wide), dtype=bool)
+        for name, attribute in _PARAMETER_LOGS.items():
+            value, lower, upper, reference = [constraints.get(name + suffix)
+                                              for suffix in ("", "_min", "_max", "_reference")]
+            if value is None and lower is None and upper is None and reference is None:
+                continue
+            if reference is None:
+                column = wide[name]
+            else:
+                log = getattr(self, attribute)
+                if reference != 'All':
+                    log = log[log.reference_id == reference]
+                column = log.value
+            match = np.ones(len(column), dtype=bool)
+            if value is not None:
+                match &= (column == value).to_numpy()
+            if lower is not None:
+                match &= (column > lower).to_numpy()
+            if upper is not None:
+                match &= (column < upper).to_numpy()
+            if reference is None:
+                keep &= match
+            else:
+                keep &= wide.object.isin(log.object[match].astype(str)).to_numpy()
+        return set(wide.object[keep])
+
+    def _resolveQueries(self, keys):
+        """Row positions of the obslog matching each query key, resolved together."""
+        allowed = {constraints: self._objectsMatchingParameters(constraints)
+                   for constraints in set(key[4] for key in keys)}
+        results = {}
+
+        # Queries naming objects: one join of all (query, object) pairs with the obslog.
+        named = [key for key in keys if key[0] is not None]
+        if named:
+            pairs = pd.DataFrame([(i, obj) for i, key in enumerate(named) for obj in key[0]
+                                  if obj in allowed[key[4]]], columns=["query", "Object"])
+            rows = pd.DataFrame({"Object": self.obslog.Object.astype(str).to_numpy(),
+                                 "row": np.arange(len(self.obslog))})
+            joined = pairs.merge(rows, on="Object")
+            query, row = joined["query"].to_numpy(dtype=int), joined["row"].to_numpy(dtype=int)
+
+            lo = np.array([-np.inf if key[1] is None else key[1] for key in named])
+            hi = np.array([np.inf if key[2] is None else key[2] for key in named])
+            merged_only = np.array([key[3] == "merged" for key in named])
+            orders_only = np.array([key[3] == "orders" for key in named])
+
+            merged = self.index.merged[row]
+            keep = ((self.index.wave_max[row] > lo[query]) & (self.index.wave_min[row] < hi[query])
+                    & ~(merged_only[query] & ~merged) & ~(orders_only[query] & merged))
+            query, row = query[keep], row[keep]
+            order = np.lexsort((row, query))
+            query, row = query[order], row[order]
+            bounds = np.searchsorted(query, np.arange(len(named) + 1))
+            for i, key in enumerate(named):
+                results[key] = row[bounds[i]:bounds[i + 1]]
+
+        # Queries over all objects go through the interval index.
+        for key in keys:
+            if key[0] is None:
+                results[key] = self.index.select(objects=sorted(allowed[key[4]]), wave_min=key[1],
+                                                 wave_max=key[2], MergedOnly=key[3] == "merged",
+                                                 OrdersOnly=key[3] == "orders")
+        return results
+
+    def getFilteredObsTable(self, queries):
+        """Resolve many observation queries at once, without printing.
+
+        Each query is a dict (or a row of a DataFrame) with any of the keywords of
+        getFilteredObsList: object (a name or a list of names), Wave, WaveMin, WaveMax,
+        MergedOnly, OrdersOnly and the sightline-parameter constraints such as EBV_min
+        or SpType_reference. Missing keys and NaN mean "not specified". Identical
+        queries are resolved only once, and results are remembered between calls.
+
+        Args:
+            queries (list or pandas.DataFrame): The queries
+
+        Returns:
+            pandas.DataFrame: One row per matching observation, with the obslog columns
+            and a column 'query' holding the position (list) or index label (DataFrame)
+            of the query it matches
 
-    def FilterEngine(self, object, log, value, unc_lower, unc_upper, reference_id, filtername=None):
+        """
+        if isinstance(queries, pd.DataFrame):
+            labels = queries.index.to_numpy()
+            records = queries.to_dict("records")
+        else:
+            records = list(queries)
+            labels = np.arange(len(records))
+
+        keys = [self._queryKey(query) for query in records]
+        todo = [key for key in dict.fromkeys(keys) if key not in self._query_cache]
+        if todo:
+            self._query_cache.update(self._resolveQueries(todo))
+        rows = []
+        for key in keys:
+            self._query_cache.move_to_end(key)
+            rows.append(self._query_cache[key])
+        while len(self._query_cache) > max(_QUERY_CACHE_SIZE, len(set(keys))):
+            self._query_cache.popitem(last=False)
+
+        counts = [len(r) for r in rows]
+        positions = np.concatenate(rows) if rows else np.array([], dtype=int)
+        table = self.obslog.iloc[positions].reset_index(drop=True)
+        table.insert(0, "query", np.repeat(labels, counts))
+        return table
+
+    def FilterEngine(self, object, log, value, unc_lower, unc_upper, reference_id, filtername=None, verbose=True):
         # Generic function to filter through the list of objects. 
         # Note: object should be a list or a numpy array type!
 
@@ -109,9 +455,7 @@ class EdiblesOracle:
         if object is None:
              bool_object_matches = np.ones(len(log.index),dtype=bool)
         elif (isinstance(object, np.ndarray) | isinstance(object, list)):
-                for thisobject in object:
-                    bool_object_matches = (log.object == thisobject) | (bool_object_matches)
-                    #print(bool_object_matches.sum())
+                bool_object_matches = log.object.isin(list(object)).to_numpy()
         else: 
             print("EDIBLES Oracle is Panicking in FilterEngine: don't know what I'm dealing with!")
             
@@ -127,8 +471,9 @@ class EdiblesOracle:
         if unc_lower is not None:
             bool_value_matches = (log.value > unc_lower) & bool_value_matches
         if unc_upper is not None:
-            print(value)
-            print(unc_upper)
+            if verbose:
+                print(value)
+                print(unc_upper)
             bool_value_matches = (log.value < unc_upper) & bool_value_matches
         #print(bool_value_matches)
         #print(bool_value_matches.sum())
@@ -154,9 +499,10 @@ class EdiblesOracle:
         #matching_objects = log.object.values[ind]
         matching_objects_df = log.loc[bool_combined_matches, ['object','value']]
 
-        print('getFilteredObslist: Filter=',filtername,'; found a total of ', bool_object_matches.sum(), ' object match(es).')  
-        print('getFilteredObslist: Filter=',filtername,'; found a total of ', bool_value_matches.sum(), ' parameter match(es).')  
-        print('getFilteredObslist: Filter=',filtername,'; found a total of ', bool_combined_matches.sum(), ' combined match(es).')  
+        if verbose:
+            print('getFilteredObslist: Filter=',filtername,'; found a total of ', bool_object_matches.sum(), ' object match(es).')
+            print('getFilteredObslist: Filter=',filtername,'; found a total of ', bool_value_matches.sum(), ' parameter match(es).')
+            print('getFilteredObslist: Filter=',filtername,'; found a total of ', bool_combined_matches.sum(), ' combined match(es).')
         
         return matching_objects_df
 
@@ -168,83 +514,42 @@ class EdiblesOracle:
                            LogNHII_reference=None, fH2=None,fH2_min=None,fH2_max=None, \
                            fH2_reference=None, RV=None,RV_min=None,RV_max=None, \
                            RV_reference=None, AV=None,AV_min=None,AV_max=None, \
-                           AV_reference=None):
+                           AV_reference=None, Near=None, Radius=None):
         
         '''This method will provide a filtered list of objects that match 
         the specified criteria on sightline/target parameters as well as
         on observational criteria (e.g. wavelength range). This function consists
         of two steps: 
 
-        | 1. Find all targets that match specified target parameters. This is done
-           for each parameter using the FilterEngine function. 
-        | 2. Find the objects that match all target specifications. '''
-        # STEP 1: Filter objects for each of the parameters -- but only if parameters are specified!
-        if (EBV or EBV_min or EBV_max or EBV_reference) is not None:
-            print("EBV")
-            matching_objects_ebv = self.FilterEngine(object, self.ebvlog, EBV, EBV_min, EBV_max, EBV_reference)
-        else:
-            matching_objects_ebv = self.object_log
-        
-        if (SpType or SpType_min or SpType_max or SpType_reference) is not None:
-            print("SP_TYPE")
-            matching_objects_sptype = self.FilterEngine(object, self.sptypelog, SpType, SpType_min, SpType_max, SpType_reference)
-        else:
-            matching_objects_sptype = self.object_log
-            
-        if (LogNHI or LogNHI_min or LogNHI_max or LogNHI_reference) is not None:
-            print("LogN(HI)")
-            matching_objects_lognhi = self.FilterEngine(object, self.nhilog, LogNHI, LogNHI_min, LogNHI_max, LogNHI_reference)
-        else:
-            matching_objects_lognhi = self.object_log
-        
-        if (LogNHII or LogNHII_min or LogNHII_max or LogNHII_reference) is not None:
-            print("LogN(HII)")
-            matching_objects_lognhii = self.FilterEngine(object, self.nhiilog, LogNHII, LogNHII_min, LogNHII_max, LogNHII_reference)
-        else:
-            matching_objects_lognhii = self.object_log
-        
-        if (fH2 or fH2_min or fH2_max or fH2_reference) is not None:
-            print("fH2")
-            matching_objects_fh2 = self.FilterEngine(object, self.fh2log, fH2, fH2_min, fH2_max, fH2_reference)
-        else:
-            matching_objects_fh2 = self.object_log
-            
-        if (RV or RV_min or RV_max or RV_reference) is not None:
-            print("RV")
-            matching_objects_rv = self.FilterEngine(object, self.rvlog, RV, RV_min, RV_max, RV_reference)
-        else:
-            matching_objects_rv = self.object_log
-        
-        if (AV or AV_min or AV_max or AV_reference) is not None:
-            print("AV")
-            matching_objects_av = self.FilterEngine(object, self.avlog, AV, AV_min, AV_max, AV_reference)
-        else:
-            matching_objects_av = self.object_log
-            
-        
-     
-        # STEP 2: Find the common objects
-        ebv_objects = matching_objects_ebv['object']
-        sptype_objects = matching_objects_sptype['object']
-        lognhi_objects = matching_objects_lognhi['object']
-        lognhii_objects = matching_objects_lognhii['object']
-        fh2_objects = matching_objects_fh2['object']
-        rv_objects = matching_objects_rv['object']
-        av_objects = matching_objects_av['object']
-        
-        #print(lognhi_objects.tolist())
-        #print(ebv_objects.tolist())
-        #print(sptype_objects.tolist())
-        ##################
+        | 1. Find all targets that match specified target parameters. All parameters
+           are evaluated together on the sightline tables (see sightline_table),
+           with the same rules as the FilterEngine function. 
+        | 2. Find the objects that match all target specifications. 
+
+        Near (an object name or an (RA, DEC) tuple, in degrees) and Radius (in
+        degrees) restrict the objects to a cone on the sky, see getObjectsNear. '''
+        constraints = _constraints(
+            EBV=EBV, EBV_min=EBV_min, EBV_max=EBV_max, EBV_reference=EBV_reference,
+            SpType=SpType, SpType_min=SpType_min, SpType_max=SpType_max,
+            SpType_reference=SpType_reference,
+            LogNHI=LogNHI, LogNHI_min=LogNHI_min, LogNHI_max=LogNHI_max,
+            LogNHI_reference=LogNHI_reference,
+            LogNHII=LogNHII, LogNHII_min=LogNHII_min, LogNHII_max=LogNHII_max,
+            LogNHII_reference=LogNHII_reference,
+            fH2=fH2, fH2_min=fH2_min, fH2_max=fH2_max, fH2_reference=fH2_reference,
+            RV=RV, RV_min=RV_min, RV_max=RV_max, RV_reference=RV_reference,
+            AV=AV, AV_min=AV_min, AV_max=AV_max, AV_reference=AV_reference,
+            Near=Near, Radius=Radius)
+
+        # STEP 1 and 2: evaluate all constraints at once on the sightline tables.
+        matching_objects = self._objectsMatchingParameters(constraints)
+
         if object is None:
             search_list = self.object_log["object"].to_list()
         else:
-            search_list = object
-        
-        common_objects_set = set(search_list).intersection(ebv_objects.to_list(),sptype_objects.to_list(),lognhi_objects.to_list(),lognhii_objects.to_list(),fh2_objects.to_list(),rv_objects.to_list(),av_objects.to_list())
-        
-        ###################
-        common_objects_list= list(common_objects_set)
+            search_list = [object] if isinstance(object, str) else object
+
+        common_objects_list = [obj for obj in dict.fromkeys(search_list) if obj in matching_objects]
         print("***Common Objects***")
         if len(common_objects_list) == 0:
             print("None")
@@ -262,95 +567,49 @@ class EdiblesOracle:
                            LogNHII_reference=None, fH2=None,fH2_min=None,fH2_max=None, \
                            fH2_reference=None, RV=None,RV_min=None,RV_max=None, \
                            RV_reference=None, AV=None,AV_min=None,AV_max=None, \
-                           AV_reference=None):
+                           AV_reference=None, Near=None, Radius=None):
         
         '''This method will provide a filtered list of observations that match 
         the specified criteria on sightline/target parameters as well as
         on observational criteria (e.g. wavelength range). This function consists
         of three steps: 
 
-        | 1. Find all targets that match specified target parameters. This is done
-           for each parameter using the FilterEngine function. 
+        | 1. Find all targets that match specified target parameters. All parameters
+           are evaluated together on the sightline tables (see sightline_table),
+           with the same rules as the FilterEngine function. 
         | 2. Find the objects that match all target specifications. 
-        | 3. Find the observations that match specified parameters for only these targets. '''
-
-        #print(getFilteredObslist.__dict__)
+        | 3. Find the observations that match specified parameters for only these targets. 
+
+        Near (an object name or an (RA, DEC) tuple, in degrees) and Radius (in
+        degrees) restrict the objects to a cone on the sky, see getObjectsNear. '''
+        constraints = _constraints(
+            EBV=EBV, EBV_min=EBV_min, EBV_max=EBV_max, EBV_reference=EBV_reference,
+            SpType=SpType, SpType_min=SpType_min, SpType_max=SpType_max,
+            SpType_reference=SpType_reference,
+            LogNHI=LogNHI, LogNHI_min=LogNHI_min, LogNHI_max=LogNHI_max,
+            LogNHI_reference=LogNHI_reference,
+            LogNHII=LogNHII, LogNHII_min=LogNHII_min, LogNHII_max=LogNHII_max,
+            LogNHII_reference=LogNHII_reference,
+            fH2=fH2, fH2_min=fH2_min, fH2_max=fH2_max, fH2_reference=fH2_reference,
+            RV=RV, RV_min=RV_min, RV_max=RV_max, RV_reference=RV_reference,
+            AV=AV, AV_min=AV_min, AV_max=AV_max, AV_reference=AV_reference,
+            Near=Near, Radius=Radius)
+
+        # STEP 1 and 2: evaluate all constraints at once on the sightline tables.
+        matching_objects = self._objectsMatchingParameters(constraints)
 
-        # STEP 1: Filter objects for each of the parameters -- but only if parameters are specified!
-        if (EBV or EBV_min or EBV_max or EBV_reference) is not None:
-            print(EBV, EBV_min, EBV_max)
-            matching_objects_ebv = self.FilterEngine(object, self.ebvlog, EBV, EBV_min, EBV_max, EBV_reference, filtername='EBV')
-        else:
-            matching_objects_ebv = self.object_log
-        
-        if (SpType or SpType_min or SpType_max or SpType_reference) is not None:
-            print("SP_TYPE")
-            matching_objects_sptype = self.FilterEngine(object, self.sptypelog, SpType, SpType_min, SpType_max, SpType_reference)
-        else:
-            matching_objects_sptype = self.object_log
-            
-        if (LogNHI or LogNHI_min or LogNHI_max or LogNHI_reference) is not None:
-            print("LogN(HI)")
-            matching_objects_lognhi = self.FilterEngine(object, self.nhilog, LogNHI, LogNHI_min, LogNHI_max, LogNHI_reference)
-        else:
-            matching_objects_lognhi = self.object_log
-        
-        if (LogNHII or LogNHII_min or LogNHII_max or LogNHII_reference) is not None:
-            print("LogN(HII)")
-            matching_objects_lognhii = self.FilterEngine(object, self.nhiilog, LogNHII, LogNHII_min, LogNHII_max, LogNHII_reference)
-        else:
-            matching_objects_lognhii = self.object_log
-        
-        if (fH2 or fH2_min or fH2_max or fH2_reference) is not None:
-            print("fH2")
-            matching_objects_fh2 = self.FilterEngine(object, self.fh2log, fH2, fH2_min, fH2_max, fH2_reference)
-        else:
-            matching_objects_fh2 = self.object_log
-            
-        if (RV or RV_min or RV_max or RV_reference) is not None:
-            print("RV")
-            matching_objects_rv = self.FilterEngine(object, self.rvlog, RV, RV_min, RV_max, RV_reference)
-        else:
-            matching_objects_rv = self.object_log
-        
-        if (AV or AV_min or AV_max or AV_reference) is not None:
-            print("AV")
-            matching_objects_av = self.FilterEngine(object, self.avlog, AV, AV_min, AV_max, AV_reference)
-        else:
-            matching_objects_av = self.object_log
-            
-        
-     
-        # STEP 2: Find the common objects
-        
-        
-        ebv_objects = matching_objects_ebv['object']
-        sptype_objects = matching_objects_sptype['object']
-        lognhi_objects = matching_objects_lognhi['object']
-        lognhii_objects = matching_objects_lognhii['object']
-        fh2_objects = matching_objects_fh2['object']
-        rv_objects = matching_objects_rv['object']
-        av_objects = matching_objects_av['object']
-        
-        #print(lognhi_objects.tolist())
-        #print(ebv_objects.tolist())
-        #print(sptype_objects.tolist())
-        ##################
         if object is None:
             search_list = self.object_log["object"].to_list()
         else:
-            search_list = object
-        
-        common_objects_set = set(search_list).intersection(ebv_objects.to_list(),sptype_objects.to_list(),lognhi_objects.to_list(),lognhii_objects.to_list(),fh2_objects.to_list(),rv_objects.to_list(),av_objects.to_list())
-        
-        ###################
-        common_objects_list= list(common_objects_set)
+            search_list = [object] if isinstance(object, str) else object
+
+        common_objects_list = [obj for obj in dict.fromkeys(search_list) if obj in matching_objects]
         print("***Common Objects***")
         if len(common_objects_list) == 0:
             print("None")
         else:
             print(common_objects_list)
-        
+
         # STEP 3
         # Now push this list of objects through for further filtering based on obs log
         FilteredObsList = self._getObsListFilteredByObsLogParameters(object=common_objects_list, Wave=Wave, WaveMin=WaveMin, WaveMax=WaveMax, MergedOnly=MergedOnly, OrdersOnly=OrdersOnly)
@@ -380,10 +639,9 @@ class EdiblesOracle:
 
         """
 
-        # Boolean matches for wavelength.
+        # Coverage of the wavelength is answered by the interval index.
         if wave is None:
             wave = 5000
-        bool_wave_matches = (self.obslog.WaveMin < wave) & (self.obslog.WaveMax > wave)
 
         # Do we have to filter out merged or single-order spectra? Note that if both
         # MergedOnly and OrdersOnly are True, only the Merged spectra will be returned.
@@ -391,15 +649,7 @@ class EdiblesOracle:
         if MergedOnly and OrdersOnly:
             print("EDIBLES Oracle: ONLY RETURNING MERGED SPECTRA")
 
-        bool_order = self.obslog.Order != "Z"
-        if OrdersOnly is True:
-            bool_order = self.obslog.Order != "ALL"
-        if MergedOnly is True:
-            bool_order = self.obslog.Order == "ALL"
-
-        ind = np.where(bool_wave_matches & bool_order)
-        # print(ind)
-        return self.obslog.iloc[ind].Filename
+        return self._selectFiles(wave=wave, MergedOnly=MergedOnly, OrdersOnly=OrdersOnly)
         
 
     def getObsListByTarget(self, target=None, MergedOnly=False, OrdersOnly=False):
@@ -419,25 +669,75 @@ class EdiblesOracle:
 
         """
         
-        # Boolean matches for wavelength.
+        # Matches for the target come from the object index.
         if target is None:
             target = 'HD164073'
-        bool_target_matches = (self.obslog.Object == target)
-        
+
         # Do we have to filter out merged or single-order spectra? Note that if both
         # MergedOnly and OrdersOnly are True, only the Merged spectra will be returned.
 
         if MergedOnly and OrdersOnly:
             print("EDIBLES Oracle: ONLY RETURNING MERGED SPECTRA")
 
-        bool_order = self.obslog.Order != "Z"
-        if OrdersOnly is True:
-            bool_order = self.obslog.Order != "ALL"
-        if MergedOnly is True:
-            bool_order = self.obslog.Order == "ALL"
+        return self._selectFiles(objects=[target], MergedOnly=MergedOnly, OrdersOnly=OrdersOnly)
 
-        ind = np.where(bool_target_matches & bool_order)
-        return self.obslog.iloc[ind].Filename
+    def getObjectsNear(self, near, radius=None, k=None):
+        """Objects within a radius of a position, or its k nearest neighbours.
+
+        Positions are the SIMBAD coordinates in sightline_data where available,
+        else the mean direction of the observations of the object in the obslog
+        (see SkyIndex.from_obslog). The results can be passed on as the object list of
+        getFilteredObsList, or use its Near/Radius keywords directly.
+
+        Args:
+            near (str or tuple): Object name, or (RA, DEC) in degrees. An object is
+                not returned as its own neighbour when k is given.
+            radius (float): Radius of the cone, in degrees
+            k (int): Number of nearest neighbours (within radius, if given)
+
+        Returns:
+            pandas.DataFrame: Columns object, RA, DEC and separation (in degrees),
+            nearest first
+
+        """
+        assert radius is not None or k is not None, "Specify a radius and/or k"
+        ra, dec = self._skyPosition(near)
+        if k is None:
+            rows, separation = self.sky_index.cone(ra, dec, radius)
+        else:
+            skip = 1 if isinstance(near, str) else 0
+            rows, separation = self.sky_index.nearest(ra, dec, k=k + skip, radius=radius)
+            if skip:
+                keep = self.sky_index.names[rows] != near
+                rows, separation = rows[keep][:k], separation[keep][:k]
+        return pd.DataFrame({"object": self.sky_index.names[rows].astype(str),
+                             "RA": self.sky_index.ra[rows], "DEC": self.sky_index.dec[rows],
+                             "separation": separation})
+
+    def getObsMetadata(self, filename):
+        """Obslog entry of one observation, without opening the FITS file.
+
+        Obslogs written by edibles_create_obslist also hold the barycentric
+        correction (VBary), exposure time, wavelength solution and continuum file.
+
+        Args:
+            filename (str): File name as in the obslog (relative to DATADIR), or the
+                full path of the file
+
+        Returns:
+            dict: Column name -> value, or None if the file is not in the obslog
+
+        """
+        if getattr(self, "_obslog_rows", None) is None:
+            self._obslog_rows = dict(zip(self.obslog.Filename.astype(str), range(len(self.obslog))))
+        filename = str(filename)
+        if filename.startswith(DATADIR):
+            filename = filename[len(DATADIR):]
+        row = self._obslog_rows.get(filename)
+        if row is None:
+            return None
+        return {key: (value.item() if isinstance(value, np.generic) else value)
+                for key, value in self.obslog.iloc[row].items()}
 
 
 if __name__ == "__main__":
@@ -18,6 +18,28 @@ from edibles import DATADIR
 from edibles.utils.functions import make_grid
 
 
+_GLOBAL_GRID = None
+
+
+def global_grid():
+    """Return the interpolation grid shared by every spectrum in this process.
+
+    The grid covers 3000-10500 AA at R=80000 with an oversampling of 2. It is
+    computed on first use only and flagged read-only, so spectra can keep a
+    reference to it instead of a private copy.
+
+    Returns:
+        1darray: The shared, read-only interpolation grid
+
+    """
+    global _GLOBAL_GRID
+    if _GLOBAL_GRID is None:
+        grid = make_grid(3000, 10500, resolution=80000, oversample=2)
+        grid.flags.writeable = False
+        _GLOBAL_GRID = grid
+    return _GLOBAL_GRID
+
+
 class EdiblesSpectrum:
     """
     This class takes a spectrum file from EDIBLES,
@@ -41,7 +63,8 @@ class EdiblesSpectrum:
             will not be updated by the functions
         raw_flux (1darray): The flux data for the spectrum,
             will not be updated by the functions
-        raw_grid (1darray): A grid covering the entire spectral range used for interpolation
+        raw_grid (1darray): A grid covering the entire spectral range used for interpolation,
+            shared (read-only) between all spectra
         raw_sky_wave (1darray): Telluric transmission data covering the entire spectral range
         raw_sky_flux (1darray): Telluric transmission data covering the entire spectral range
         wave (1darray): The wavelength data for the spectrum, geocentric reference frame,
@@ -75,13 +98,14 @@ class EdiblesSpectrum:
         """Filename is relative to the EDIBLES_DATADIR environment variable
 
         """
-        if filename.startswith('/'):
-            filename = filename[1:]
-        self.filename = Path(DATADIR) / filename
-        self.fully_featured = fully_featured
-
         if noDATADIR is True:
             self.filename = filename
+        else:
+            if filename.startswith('/'):
+                filename = filename[1:]
+            self.filename = Path(DATADIR) / filename
+        self.fully_featured = fully_featured
+        self._snr_cache = {}
 
         self._loadSpectrum()
         self._spec_grid()
@@ -102,8 +126,6 @@ class EdiblesSpectrum:
             cdelt1 = self.header["CDELT1"]
             lenwave = len(self.flux)
             grid = np.arange(0, lenwave, 1)
-            self.wave = (grid) * cdelt1 + crval1
-            self.bary_wave = self.wave + (self.v_bary / cst.c.to("km/s").value) * self.wave
 
             self.raw_wave = (grid) * cdelt1 + crval1
             self.raw_bary_wave = self.raw_wave + \
@@ -112,6 +134,11 @@ class EdiblesSpectrum:
 
             self.raw_flux = hdulist[0].data
 
+            # The working arrays start out as references to the raw arrays; all
+            # methods below rebind them rather than modifying them in place.
+            self.wave = self.raw_wave
+            self.bary_wave = self.raw_bary_wave
+
             self.wave_units = "AA"
             self.flux_units = "arbitrary"
 
@@ -122,11 +149,10 @@ class EdiblesSpectrum:
                 self.continuum_filename = csv_file
 
     def _spec_grid(self):
-        '''Creates a grid used for interpolation.
+        '''Attaches the shared (read-only) grid used for interpolation.
 
         '''
-        grid = make_grid(3000, 10500, resolution=80000, oversample=2)
-        self.raw_grid = grid
+        self.raw_grid = global_grid()
 
     def _sky_transmission(self):
         '''A function that adds the telluric transmission data to the EdiblesSpectrum model.
@@ -311,34 +337,263 @@ class EdiblesSpectrum:
         self._corrected_spectrum()
         self.fully_featured = True
 
+    def measureSNR(self, block_size=1.0, method="std"):
+        """Block-wise S/N of the raw spectrum, computed once per block size and method.
+
+        Args:
+            block_size (float): Size of the blocks, in AA
+            method (str): 'std' or 'der_snr', see measure_snr
 
-def measure_snr(wave, flux, block_size=1.0, do_plot=False):
+        Returns:
+            tuple: (SNR, LAM) as returned by measure_snr
+
+        """
+        key = (block_size, method)
+        if key not in self._snr_cache:
+            self._snr_cache[key] = measure_snr(self.raw_wave, self.raw_flux,
+                                               block_size=block_size, method=method)
+        return self._snr_cache[key]
+
+    @staticmethod
+    def metadata(filename):
+        """Header metadata of a spectrum from the obslog, without reading the FITS file.
+
+        Args:
+            filename (str): File name as in the obslog, or the full path of the file
+
+        Returns:
+            dict: See EdiblesOracle.getObsMetadata; None if the file is not in the obslog
+
+        """
+        from edibles.utils.edibles_oracle import EdiblesOracle
+        return EdiblesOracle.shared().getObsMetadata(filename)
+
+    def compact(self):
+        """Return a CompactSpectrum that shares the raw arrays of this spectrum.
+
+        Returns:
+            CompactSpectrum: A slots-based view of the raw (unwindowed) spectrum
+
+        """
+        continuum_filename = getattr(self, "continuum_filename", None)
+        return CompactSpectrum(self.raw_wave, self.raw_flux, v_bary=self.v_bary,
+                               target=self.target, date=self.date,
+                               filename=self.filename,
+                               continuum_filename=continuum_filename)
+
+
+class CompactSpectrum:
     """
-    Estimate SNR of given spectral data
-    :param wave: wavelength grid
+    A memory-lean representation of a single EDIBLES spectrum.
+
+    Only the geocentric wavelength and flux arrays are stored, and they are
+    stored as given (no copy is made). Frame-specific axes are derived on
+    request, and the interpolation grid is the process-wide one returned by
+    global_grid(). This makes it practical to keep thousands of orders in
+    memory, e.g. for coadds.
+
+    Args:
+        wave (1darray): Geocentric wavelength data, in increasing order
+        flux (1darray): Flux data
+        v_bary (float): Barycentric velocity of the target star, in km/s
+        target (str): The name of the target
+        date (str): The DATE-OBS of the observation
+        filename (str): The file the data was read from, if any
+        continuum_filename (str): Name of file with continuum points, if any
+
+    """
+
+    __slots__ = ("wave", "flux", "v_bary", "target", "date", "filename",
+                 "continuum_filename")
+
+    FRAMES = ("geocentric", "barycentric")
+
+    def __init__(self, wave, flux, v_bary=0.0, target=None, date=None, filename=None,
+                 continuum_filename=None):
+        self.wave = np.asarray(wave)
+        self.flux = np.asarray(flux)
+        assert self.wave.shape == self.flux.shape, "wave and flux must have the same shape"
+        self.v_bary = v_bary
+        self.target = target
+        self.date = date
+        self.filename = filename
+        self.continuum_filename = continuum_filename
+
+    @classmethod
+    def from_arrays(cls, wave, flux, v_bary=0.0, **kwargs):
+        """Wrap in-memory arrays without copying them.
+
+        Args:
+            wave (1darray): Geocentric wavelength data, in increasing order
+            flux (1darray): Flux data
+            v_bary (float): Barycentric velocity, in km/s
+            **kwargs: Passed on to CompactSpectrum (target, date, filename, ...)
+
+        Returns:
+            CompactSpectrum: A spectrum referencing the input arrays
+
+        """
+        return cls(wave, flux, v_bary=v_bary, **kwargs)
+
+    @classmethod
+    def from_file(cls, filename, noDATADIR=False):
+        """Read a spectrum from a FITS file, relative to DATADIR.
+
+        Args:
+            filename (str): Name of the file, starting with the target
+            noDATADIR (bool): If true, DATADIR will not be added to the front of the filename
+
+        Returns:
+            CompactSpectrum: The spectrum in the file
+
+        """
+        if noDATADIR is False:
+            filename = Path(DATADIR) / filename.lstrip("/")
+
+        with fits.open(filename, memmap=False) as hdulist:
+            header = hdulist[0].header
+            flux = hdulist[0].data
+            wave = np.arange(len(flux)) * header["CDELT1"] + header["CRVAL1"]
+
+            return cls(wave, flux, v_bary=header["HIERARCH ESO QC VRAD BARYCOR"],
+                       target=header["OBJECT"], date=header["DATE-OBS"],
+                       filename=filename)
+
+    @property
+    def datetime(self):
+        """datetime.datetime: The date of the target observation"""
+        return datetime.strptime(self.date, '%Y-%m-%dT%H:%M:%S.%f')
+
+    @property
+    def bary_wave(self):
+        """1darray: The wavelength data in the barycentric reference frame"""
+        return self.wave + (self.v_bary / cst.c.to("km/s").value) * self.wave
+
+    def frame_wave(self, frame="geocentric"):
+        """Return the wavelength axis in the requested reference frame.
+
+        Args:
+            frame (str): 'geocentric' or 'barycentric'
+
+        Returns:
+            1darray: The wavelength data; a reference for the geocentric frame
+
+        """
+        assert frame in self.FRAMES, "frame must be one of " + str(self.FRAMES)
+        if frame == "geocentric":
+            return self.wave
+        return self.bary_wave
+
+    @property
+    def grid(self):
+        """1darray: Read-only view of the global grid covering this spectrum"""
+        raw_grid = global_grid()
+        lo, hi = np.searchsorted(raw_grid, [self.wave[0], self.wave[-1]])
+        return raw_grid[lo:hi]
+
+    def getSpectrum(self, xmin, xmax, frame="geocentric"):
+        """Return the data within (xmin, xmax) in the requested frame.
+
+        Args:
+            xmin (float): Minimum wavelength
+            xmax (float): Maximum wavelength
+            frame (str): 'geocentric' or 'barycentric'
+
+        Returns:
+            tuple: (wave, flux); the flux is always a view of the stored array
+
+        """
+        assert xmin < xmax, "xmin must be less than xmax"
+        wave = self.frame_wave(frame)
+        lo = np.searchsorted(wave, xmin, side="right")
+        hi = np.searchsorted(wave, xmax, side="left")
+        return wave[lo:hi], self.flux[lo:hi]
+
+    def interpolate(self, xmin, xmax, frame="geocentric"):
+        """Linearly interpolate the flux onto the global grid within (xmin, xmax).
+
+        Args:
+            xmin (float): Minimum wavelength
+            xmax (float): Maximum wavelength
+            frame (str): 'geocentric' or 'barycentric'
+
+        Returns:
+            tuple: (grid, interpolated flux); the grid is a read-only view
+
+        """
+        wave = self.frame_wave(frame)
+        xmin = max(xmin, wave[0])
+        xmax = min(xmax, wave[-1])
+        raw_grid = global_grid()
+        lo = np.searchsorted(raw_grid, xmin, side="right")
+        hi = np.searchsorted(raw_grid, xmax, side="left")
+        grid = raw_grid[lo:hi]
+        return grid, np.interp(grid, wave, self.flux)
+
+
+def _block_median(values, starts, counts):
+    """NaN-aware median of consecutive blocks along the last axis, via a padded index matrix."""
+    offsets = np.arange(counts.max())
+    valid = offsets[None, :] < counts[:, None]
+    index = np.where(valid, starts[:, None] + offsets[None, :], 0)
+    padded = np.where(valid, values[..., index], np.nan)
+    return np.nanmedian(padded, axis=-1)
+
+
+def measure_snr(wave, flux, block_size=1.0, do_plot=False, method="std"):
+    """
+    Estimate SNR of given spectral data, in blocks of given size
+
+    All blocks (and all spectra of a stack) are handled at once: the block
+    boundaries are found with one pass over the wavelength grid and the block
+    statistics are computed with np.add.reduceat.
+
+    :param wave: wavelength grid, increasing
     :type wave: ndarray
-    :param flux: flux
+    :param flux: flux, one spectrum or a stack of shape (n_spectra, len(wave))
     :type flux: ndarray
+    :param block_size: size of the blocks, in AA
+    :type block_size: float
     :param do_plot: if set, make SNR plot
     :type  do_plot: bool
+    :param method: 'std' for mean / standard deviation of each block, 'der_snr' for
+        the robust DER_SNR estimate (median / noise from second differences)
+    :type method: str
 
-    :return: SNR, LAM, SNR and median flux of each of the 1A block
-    :rtype: list
+    :return: SNR, LAM, SNR and central wavelength of each block; blocks with fewer than
+        two points or a non-positive signal are dropped (NaN for a stack)
+    :rtype: tuple
     """
-    # split in blocks of given size
-    xmin = wave[0]
-    xmax = xmin + block_size
-    SNR, LAM = [], []
-    while xmin < wave[-1]:
-        flux_block = flux[np.where((wave > xmin) & (wave < xmax))]
-        if len(flux_block) == 1:
-            break
-        if (np.nanmean(flux_block) > 0.0):
-            sigma_block = np.nanmean(flux_block) / np.nanstd(flux_block)
-            SNR.append(sigma_block)
-            LAM.append(xmin + (xmax - xmin) / 2.0)
-        xmin = xmax.copy()
-        xmax = xmin + block_size
+    assert method in ("std", "der_snr"), "method must be 'std' or 'der_snr'"
+    wave = np.asarray(wave, dtype=float)
+    flux = np.asarray(flux, dtype=float)
+
+    block = np.floor((wave - wave[0]) / block_size).astype(int)
+    starts = np.flatnonzero(np.r_[True, block[1:] != block[:-1]])
+    counts = np.diff(np.r_[starts, len(wave)])
+    LAM = wave[0] + (block[starts] + 0.5) * block_size
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method == "std":
+            good = np.isfinite(flux)
+            values = np.where(good, flux, 0.0)
+            n = np.add.reduceat(good, starts, axis=-1)
+            signal = np.add.reduceat(values, starts, axis=-1) / n
+            deviation = np.where(good, flux - np.repeat(signal, counts, axis=-1), 0.0)
+            noise = np.sqrt(np.add.reduceat(deviation ** 2, starts, axis=-1) / n)
+        else:
+            second_diff = np.full(flux.shape, np.nan)
+            second_diff[..., 2:-2] = np.abs(2.0 * flux[..., 2:-2] - flux[..., :-4] - flux[..., 4:])
+            signal = _block_median(flux, starts, counts)
+            noise = 1.482602 / np.sqrt(6.0) * _block_median(second_diff, starts, counts)
+        SNR = signal / noise
+
+    keep = (counts > 1) & (signal > 0.0)
+    if flux.ndim == 1:
+        SNR, LAM = SNR[keep], LAM[keep]
+    else:
+        SNR = np.where(keep, SNR, np.nan)
+
     if (do_plot == True):
         plt.plot(LAM, SNR)
         plt.plot(LAM, np.convolve(SNR, np.ones(10) / 10, mode='same'))
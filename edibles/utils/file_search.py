@@ -1,28 +1,75 @@
+import numpy as np
 import pandas as pd
 from edibles import PYTHONDIR, DATARELEASE
+from edibles.utils.obslog_index import ObsLogIndex
+
+_FULL_LOG = None
+
+# FilterDR column -> column of the SQLite store
+_SQL_COLUMNS = {"Object": "Star", "Order": "OrderNum", "DateObs": "DateObs"}
+
+
+def _parse_dates(dates):
+    """Vectorized parse_time: 2014-10-29T07:01:33.557 -> 20141029"""
+    return dates.astype(str).str.split("T").str[0].str.replace("-", "")
+
+
+def _typed_columns(df):
+    """Columns the filters are evaluated on, as plain arrays."""
+    return {"Object": df.Object.to_numpy(dtype=str),
+            "Order": df.Order.to_numpy(),
+            "Date": _parse_dates(df.DateObs).to_numpy(dtype=str),
+            "WaveMin": df.WaveMin.to_numpy(dtype=float),
+            "WaveMax": df.WaveMax.to_numpy(dtype=float)}
+
+
+def _full_log():
+    """The formatted obslog of the data release, its typed columns and its index.
+
+    Read once per process. The order number comes from the Order column of the
+    obslog (-1 for merged spectra), which matches the _O<n> part of the filename.
+    """
+    global _FULL_LOG
+    if _FULL_LOG is None:
+        df = pd.read_csv(PYTHONDIR + "/data/" + DATARELEASE + "_ObsLog.csv")
+        df.Object = df.Object.str.replace(" ", "")  # HD 123456 -> HD123456
+        order = df.Order.astype(str)
+        df["Order"] = np.where(order == "ALL", "-1", order).astype("int32")
+        index = ObsLogIndex(df.assign(Order=order))
+        _FULL_LOG = (df, _typed_columns(df), index)
+    return _FULL_LOG
 
 
 class FilterDR(object):
-    def __init__(self, init_df=None):
+    """
+    Chainable filters on the observations of the data release.
+
+    Filters and sorts are only recorded when they are called; the plan runs once,
+    when the result is requested (df, getDataFrame, getAllFileNames, ...). All
+    filters are then evaluated together over precomputed typed columns (parsed
+    date, integer order), starting from the obslog index when possible.
+
+    If db is given (an ObsLogDB, or True for the default store), the plan is
+    compiled to a single SQL query against the SQLite store instead.
+    """
+
+    def __init__(self, init_df=None, db=None):
+        if db is True:
+            from edibles.utils.obslog_db import ObsLogDB
+            db = ObsLogDB()
+        self.db = db
+        self._filters, self._sorts = [], []
+        self._result = None
         if init_df is None:
-            self.df = pd.read_csv(
-                PYTHONDIR + "/edibles/data/" + DATARELEASE + "_ObsLog.csv"
-            )
-            self.df.Object = self.df.Object.apply(
-                lambda x: x.replace(" ", "")
-            )  # HD 123456 -> HD123456
-
-            self.df["Order"] = self.df.Filename.apply(
-                lambda x: int(x.split("_O")[1][:-5]) if "_O" in x else -1
-            )
-            self.df.Order = self.df.Order.astype("int32")
+            self._base, self._columns, self._index = _full_log() if db is None else (None, None, None)
         else:
-            self.df = init_df
+            self._base, self._columns, self._index = init_df, None, None
 
     def reset_index(func):
         """
-        when you put in this decorator, it will automatically return an
-        instance of the object and reset the index
+        when you put in this decorator, the call is recorded in the plan and the
+        instance is returned, with the result (and its index) recomputed on the
+        next access
 
         allows this:
         FilterDR().filterStar('HD170740').filterOrder(order=[12, 13])
@@ -30,13 +77,97 @@ class FilterDR(object):
 
         def reset(self, *args, **kwargs):
             func(self, *args, **kwargs)
-            self.df = self.df.reset_index(drop=True)
+            self._result = None
             return self
 
         return reset
 
+    @property
+    def df(self):
+        """The result of the plan, computed on first access"""
+        if self._result is None:
+            self._result = self._runSQL() if self.db is not None else self._run()
+        return self._result
+
+    @df.setter
+    def df(self, df):
+        # Assigning a table starts a new plan on top of it.
+        self._base, self._columns, self._index = df, None, None
+        self._filters, self._sorts = [], []
+        self._result = df
+
+    def _run(self):
+        if self._columns is None:
+            self._columns = _typed_columns(self._base)
+        columns = self._columns
+
+        # Start from the smallest candidate set the index can give.
+        rows = None
+        if self._index is not None:
+            for kind, arg in self._filters:
+                if kind == "star":
+                    rows = self._index.rows_for_objects(arg)
+                    break
+            if rows is None:
+                for kind, arg in self._filters:
+                    if kind == "range":
+                        rows = np.unique(np.concatenate([self._index.covering(w) for w in arg]))
+                        break
+        if rows is None:
+            rows = np.arange(len(self._base))
+
+        for kind, arg in self._filters:
+            if kind == "star":
+                rows = rows[columns["Object"][rows] == arg]
+            elif kind == "date":
+                rows = rows[columns["Date"][rows] == arg]
+            elif kind == "range":
+                wave_min = columns["WaveMin"][rows][:, None]
+                wave_max = columns["WaveMax"][rows][:, None]
+                rows = rows[np.any((wave_min < arg) & (wave_max > arg), axis=1)]
+            elif kind == "order":
+                rows = rows[np.isin(columns["Order"][rows], arg)]
+            elif kind == "combined":
+                rows = rows[columns["Order"][rows] == -1]
+            elif kind == "orders":
+                rows = rows[columns["Order"][rows] != -1]
+
+        # Later sorts take precedence; ties keep the obslog order.
+        for by in self._sorts:
+            keys = [self._base[c].to_numpy()[rows] for c in reversed(by)]
+            rows = rows[np.lexsort(keys)]
+        return self._base.iloc[rows].reset_index(drop=True)
+
+    def _runSQL(self):
+        where, params = [], []
+        for kind, arg in self._filters:
+            if kind == "star":
+                where.append("Star = ?")
+                params.append(arg)
+            elif kind == "date":
+                where.append("Date = ?")
+                params.append(arg)
+            elif kind == "range":
+                where.append(" OR ".join(["(WaveMin < ? AND WaveMax > ?)"] * len(arg)))
+                params += [float(w) for wave in arg for w in (wave, wave)]
+            elif kind == "order":
+                where.append("OrderNum IN (%s)" % ",".join("?" * len(arg)))
+                params += [int(o) for o in arg]
+            elif kind == "combined":
+                where.append("OrderNum = -1")
+            elif kind == "orders":
+                where.append("OrderNum != -1")
+        order_by = [_SQL_COLUMNS[c] for by in reversed(self._sorts) for c in by]
+        sql = ('SELECT Star AS Object, RA, DEC, DateObs, Setting, OrderNum AS "Order", '
+               'WaveMin, WaveMax, Filename FROM obslog WHERE '
+               + (" AND ".join("(%s)" % c for c in where) or "1")
+               + " ORDER BY " + ", ".join(order_by + ["rowid"]))
+        df = self.db.query(sql, params)
+        df.Order = df.Order.astype("int32")
+        return df
+
     def __str__(self):
-        pd.set_option("max_colwidth", -1)
+        pd.set_option("display.max_colwidth", None)
         return self.df.to_string()
 
     @staticmethod
@@ -80,52 +211,39 @@ class FilterDR(object):
 
     @reset_index
     def filterStar(self, star):
-        self.df = self.df[self.df.Object == star]
+        self._filters.append(("star", star))
 
     @reset_index
     def filterRange(self, lab_wavelength):
-        if type(lab_wavelength) == list:
-            wave1 = lab_wavelength[0]
-            filt = (self.df.WaveMax > wave1) & (self.df.WaveMin < wave1)
-            for wave in lab_wavelength[1:]:
-                filt = filt | ((self.df.WaveMax > wave) & (self.df.WaveMin < wave))
-            self.df = self.df[filt]
-        else:
-            self.df = self.df[
-                (self.df.WaveMax > lab_wavelength) & (self.df.WaveMin < lab_wavelength)
-            ]
+        self._filters.append(("range", np.atleast_1d(np.asarray(lab_wavelength, dtype=float))))
 
     @reset_index
     def filterOrder(self, order=[], combined=False):
-        assert not (combined and len(order) > 0), "Contradicting inputs"
         if type(order) == int:
             order = [order]
-        order = [str(o) for o in order]
-        # bit convoluted but it works
+        assert not (combined and len(order) > 0), "Contradicting inputs"
         if len(order) > 0:
-            self.df = self.df[self.df.Order.isin(order)]
+            self._filters.append(("order", [int(o) for o in order]))
         elif combined:
-            self.df = self.df[self.df.Order == -1]
+            self._filters.append(("combined", None))
         else:
-            self.df = self.df[self.df.Order != -1]
+            self._filters.append(("orders", None))
 
     @reset_index
     def filterDate(self, date):
-        df2 = self.df.copy()
-        df2.DateObs = df2.DateObs.apply(self.parse_time)  # format date
-        self.df = self.df[(df2.DateObs == date)]
+        self._filters.append(("date", date))
 
     @reset_index
     def sortOrder(self):
-        self.df.sort_values(by=["Order"], inplace=True)
+        self.sort("order")
 
     @reset_index
     def sortDate(self):
-        self.df.sort_values(by="DateObs", inplace=True)
+        self.sort("date")
 
     @reset_index
     def sortStar(self):
-        self.df.sort_values(by="Object", inplace=True)
+        self.sort("star")
 
     @reset_index
     def sort(self, columns):
@@ -135,14 +253,16 @@ class FilterDR(object):
 
         dic = {"order": "Order", "date": "DateObs", "star": "Object"}
 
-        columns = [dic[s] for s in columns]
-        self.df.sort_values(by=columns, inplace=True)
+        self._sorts.append([dic[s] for s in columns])
 
     def getCopy(self):
         """
         Returns copy of FilterDR object.
         """
-        return FilterDR(self.df)
+        copy = FilterDR.__new__(FilterDR)
+        copy.__dict__.update(self.__dict__)
+        copy._filters, copy._sorts = list(self._filters), list(self._sorts)
+        return copy
 
     def getAllFileNames(self):
         return list(self.df.Filename)
@@ -177,7 +297,7 @@ class FilterDR(object):
         ['20150626', '20170701', '20150424', '20160613', '20140916',
         '20170705', '20160505', '20160612', '20140915']
         """
-        return list(set(self.df.DateObs.apply(self.parse_time)))
+        return list(set(_parse_dates(self.df.DateObs)))
 
     def getStars(self):
         """
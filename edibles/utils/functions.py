@@ -245,6 +245,28 @@ def make_grid(lambda_start, lambda_end, resolution=None, oversample=None):
     return grid
 
 
+def filename_arm(filename):
+    """
+    Determine the spectrograph arm of an EDIBLES file from its name.
+
+    Single orders carry the arm in the name (_blue_, _redl_, _redu_), merged
+    spectra end in _B, _L or _U.
+
+    :param filename: Name of the FITS file
+    :type filename: str
+
+    :return: 'blue', 'redl' or 'redu'
+    :rtype: str
+
+    """
+    basename = os.path.basename(str(filename))
+    for arm in ("blue", "redl", "redu"):
+        if "_" + arm + "_" in basename:
+            return arm
+    merged_arms = {"B": "blue", "L": "redl", "U": "redu"}
+    return merged_arms[os.path.splitext(basename)[0].split("_")[-1]]
+
+
 def param_convert(params):
     """
     Function to convert voigt parameteres from astronomical
@@ -2,13 +2,85 @@ import numpy as np
 import matplotlib.pyplot as plt
 
 
+def _window_masks(wave, positions, windows):
+    """Boolean masks (n_sets, n_pixels) of the pixels within the windows of each anchor set."""
+    n_sets = len(positions)
+    counts = [len(anchors) for anchors in positions]
+    anchors = np.concatenate([np.asarray(a, dtype=float) for a in positions])
+    widths = np.concatenate([np.broadcast_to(np.asarray(w, dtype=float).ravel(), (n,))
+                             if np.size(w) in (1, n) else np.full(n, np.nan)
+                             for w, n in zip(windows, counts)])
+    assert np.all(np.isfinite(widths)), "windows needs to be length 1 or same length as positions"
+    owner = np.repeat(np.arange(n_sets), counts)
+
+    # Pixels with anchor - width / 2 < wave < anchor + width / 2, as index ranges.
+    start = np.searchsorted(wave, anchors - widths / 2.0, side="right")
+    stop = np.searchsorted(wave, anchors + widths / 2.0, side="left")
+    edges = np.zeros((n_sets, len(wave) + 1), dtype=int)
+    np.add.at(edges, (owner, start), 1)
+    np.add.at(edges, (owner, stop), -1)
+    return np.cumsum(edges[:, :-1], axis=1) > 0
+
+
+def local_continuum_batch(wave, flux, positions, windows=1.0, spline_order=1):
+    """Fit local polynomial continua for many anchor sets and many spectra at once.
+
+    Each anchor set (e.g. one per line window) selects the pixels within its
+    windows; the windows are found by binary search on the wavelength grid. A
+    polynomial of order spline_order is fit to the selected pixels of every
+    spectrum, and all fits are solved as one batched least squares problem.
+
+    Args:
+        wave (1darray): Increasing wavelength grid shared by all spectra
+        flux (1darray or 2darray): Flux, shape (n_pixels,) or (n_spectra, n_pixels);
+            NaN values are ignored
+        positions (list): Anchor sets, each a list of anchor wavelengths
+        windows (float or list): Window size around each anchor point (in Angstrom):
+            one value for all, or one value or list per anchor set
+        spline_order (int): Order (s) of polynomial fit
+
+    Returns:
+        tuple: tuple containing:
+
+            3darray: Normalised flux, shape (n_sets, n_spectra, n_pixels)
+
+            3darray: Continuum flux, shape (n_sets, n_spectra, n_pixels)
+
+    """
+    wave = np.asarray(wave, dtype=float)
+    flux = np.atleast_2d(np.asarray(flux, dtype=float))
+    if np.isscalar(windows):
+        windows = [windows] * len(positions)
+
+    masks = _window_masks(wave, positions, windows)
+
+    # Centre and scale the wavelengths of each set for a well-conditioned fit.
+    n_selected = np.maximum(masks.sum(axis=1), 1)
+    centre = (masks * wave).sum(axis=1) / n_selected
+    scale = np.array([np.ptp(wave[m]) / 2.0 if m.sum() > 1 else 1.0 for m in masks])
+    scale[scale == 0] = 1.0
+    t = (wave[None, :] - centre[:, None]) / scale[:, None]
+    vander = t[..., None] ** np.arange(spline_order, -1, -1)
+
+    good = np.isfinite(flux)
+    weights = masks[:, None, :] & good[None, :, :]
+    values = np.where(good, flux, 0.0)
+    normal = np.einsum("skn,sni,snj->skij", weights, vander, vander)
+    rhs = np.einsum("skn,sni,kn->ski", weights, vander, values)
+    coefs = np.linalg.solve(normal, rhs[..., None])[..., 0]
+
+    continuum = np.einsum("ski,sni->skn", coefs, vander)
+    return flux[None, :, :] / continuum, continuum
+
+
 def local_continuum(data, positions=None, windows=1.0, spline_order=1, silent=True):
     """A function that will fit a local continuum spline to a "spectrum" using a
     list of anchor points. Each anchor point has a "continuum" window (or the
     same single value for all anchor points). A spline (order s) is fit to the
     "continuum" data points. The continumm is then created on the input
     "wavelength" grid. The input data tuple (wave, flux) is then normalised
-    giving (wave, normalised_flux).
+    giving (wave, normalised_flux). See local_continuum_batch to normalise many
+    spectra or windows in one call.
 
     Args:
         data (tuple): In the form (wave, flux)
@@ -28,34 +100,16 @@ def local_continuum(data, positions=None, windows=1.0, spline_order=1, silent=Tr
 
     wave, flux = data
 
-    if len(windows) == 1:
-        # replicate windows to same length as positions; creat n-element array
-        # with single value in each element
-        win = np.ones(len(positions))
-        win = win * windows[0]
-
     # error if now 'windows' list not has same length as 'positions' list
-    if len(win) != len(positions):
+    if np.size(windows) not in (1, len(positions)):
         print(
             "error -- windows needs to be length 1 or same length as \
             positions (nr achnor points)"
         )
 
-    # use list of anchor points and window sizes to
-    # sub-select the continuum points
-    idx_continuum = []
-    for anchor, windows in zip(positions, win):
-        idx_c = np.where((wave > anchor - win / 2.0) & (wave < anchor + win / 2.0))
-        idx_continuum = idx_continuum + idx_c
-
-    cont_wave = wave[idx_continuum]
-    cont_flux = flux[idx_continuum]
-
-    c1 = np.polyfit(cont_wave, cont_flux, spline_order)
-    p1 = np.poly1d(c1)
-    continuum = p1(wave)
-
-    normalised_flux = flux / continuum
+    normalised_flux, continuum = local_continuum_batch(wave, flux, [positions], windows=[windows],
+                                                       spline_order=spline_order)
+    normalised_flux, continuum = normalised_flux[0, 0], continuum[0, 0]
 
     if silent is False:
         plt.plot(wave, flux)
@@ -0,0 +1,292 @@
+"""SQLite store of the obslog and the sightline parameters.
+
+The obslog and the Formatted_*.csv sightline tables are loaded into one local
+SQLite file (by default in CACHEDIR), with indexes on the columns the oracle and
+FilterDR filter on. Queries are compiled to SQL, so any number of processes can
+share the indexed store instead of each holding its own copy of the tables. The
+store is rebuilt automatically when one of the source CSV files changes.
+
+Tables:
+
+    obslog:      the obslog columns, plus Star (object name without spaces),
+                 OrderNum (order as integer, -1 for merged spectra) and
+                 Date (observing date as YYYYMMDD); rowid - 1 is the obslog row
+    parameters:  object, parameter, value, unc_lower, unc_upper, reference_id,
+                 preferred_flag; one row per value of every sightline parameter
+    objects:     the observed objects (ObservedObjects.csv)
+    meta:        the source signature the store was built from
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import closing
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from edibles import PYTHONDIR, CACHEDIR
+from edibles.utils.edibles_oracle import _LOG_FILES, _PARAMETER_LOGS, _read_logs, _source_signature
+
+_INDEXES = [
+    "CREATE INDEX obslog_object ON obslog (Object)",
+    "CREATE INDEX obslog_star ON obslog (Star)",
+    'CREATE INDEX obslog_order ON obslog ("Order")',
+    "CREATE INDEX obslog_ordernum ON obslog (OrderNum)",
+    "CREATE INDEX obslog_setting ON obslog (Setting)",
+    "CREATE INDEX obslog_dateobs ON obslog (DateObs)",
+    "CREATE INDEX obslog_date ON obslog (Date)",
+    "CREATE INDEX obslog_wave ON obslog (WaveMin, WaveMax)",
+    "CREATE INDEX parameters_value ON parameters (parameter, value)",
+    "CREATE INDEX parameters_reference ON parameters (parameter, reference_id)",
+    "CREATE INDEX parameters_object ON parameters (object)",
+]
+
+_PARAMETER_COLUMNS = ["object", "value", "unc_lower", "unc_upper", "reference_id", "preferred_flag"]
+
+
+def default_db_file():
+    """Location of the shared store: CACHEDIR/edibles_obslog.sqlite"""
+    return os.path.join(CACHEDIR, "edibles_obslog.sqlite")
+
+
+def _read_only_uri(db_file):
+    """SQLite URI opening db_file read-only; the path is percent-encoded, so it may contain '?' or '#'."""
+    return Path(db_file).absolute().as_uri() + "?mode=ro"
+
+
+def _signature_string(folder):
+    return repr(_source_signature(Path(folder)))
+
+
+def build_database(db_file=None, folder=None):
+    """Build the store from the CSV files, replacing any existing file atomically.
+
+    Args:
+        db_file (str): SQLite file to write, default: default_db_file()
+        folder (str): Folder holding DR4_ObsLog.csv and sightline_data/, default: PYTHONDIR/data
+
+    Returns:
+        str: The path of the store
+
+    """
+    db_file = default_db_file() if db_file is None else db_file
+    folder = Path(PYTHONDIR + "/data") if folder is None else Path(folder)
+    tables = _read_logs(folder)
+
+    obslog = tables["obslog"].astype({"Object": str, "Order": str})
+    obslog = obslog.assign(
+        Star=obslog.Object.str.replace(" ", ""),
+        OrderNum=np.where(obslog.Order == "ALL", "-1", obslog.Order).astype(int),
+        Date=obslog.DateObs.str.split("T").str[0].str.replace("-", ""))
+
+    parameters = pd.concat([tables[attribute][_PARAMETER_COLUMNS].astype({"object": str})
+                            .assign(parameter=name)
+                            for name, attribute in _PARAMETER_LOGS.items()], ignore_index=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(db_file)), exist_ok=True)
+    tmp_file = db_file + ".%d.tmp" % os.getpid()
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    # closing() closes the connection (the context manager of a connection only
+    # commits), so the file is no longer open when it is renamed.
+    with closing(sqlite3.connect(tmp_file)) as connection, connection:
+        connection.execute('CREATE TABLE obslog (Object TEXT, RA REAL, DEC REAL, DateObs TEXT, '
+                           'Setting INTEGER, "Order" TEXT, WaveMin REAL, WaveMax REAL, '
+                           'Filename TEXT, Star TEXT, OrderNum INTEGER, Date TEXT)')
+        # value has no declared type: SpType values are text, all others are numbers.
+        connection.execute("CREATE TABLE parameters (object TEXT, parameter TEXT, value, "
+                           "unc_lower REAL, unc_upper REAL, reference_id INTEGER, "
+                           "preferred_flag INTEGER)")
+        connection.execute("CREATE TABLE objects (object TEXT PRIMARY KEY)")
+        connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        columns = ["Object", "RA", "DEC", "DateObs", "Setting", "Order", "WaveMin", "WaveMax",
+                   "Filename", "Star", "OrderNum", "Date"]
+        connection.executemany("INSERT INTO obslog VALUES (%s)" % ",".join("?" * len(columns)),
+                               obslog[columns].astype(object).itertuples(index=False, name=None))
+        columns = ["object", "parameter", "value", "unc_lower", "unc_upper", "reference_id",
+                   "preferred_flag"]
+        rows = parameters[columns].astype(object).where(parameters[columns].notna(), None)
+        connection.executemany("INSERT INTO parameters VALUES (?,?,?,?,?,?,?)",
+                               rows.itertuples(index=False, name=None))
+        connection.executemany("INSERT OR IGNORE INTO objects VALUES (?)",
+                               [(obj,) for obj in tables["object_log"]["object"].astype(str)])
+        connection.execute("INSERT INTO meta VALUES ('signature', ?)", (_signature_string(folder),))
+        for statement in _INDEXES:
+            connection.execute(statement)
+    os.replace(tmp_file, db_file)
+    return db_file
+
+
+def _where_obslog(objects=None, wave=None, wave_min=None, wave_max=None,
+                  MergedOnly=False, OrdersOnly=False):
+    """SQL condition and parameters selecting obslog rows, with the oracle's semantics."""
+    clauses, params = [], []
+    if objects is not None:
+        objects = [objects] if isinstance(objects, str) else list(objects)
+        clauses.append("Object IN (%s)" % ",".join("?" * len(objects)) if objects else "0")
+        params += objects
+    if wave is not None:
+        clauses.append("WaveMin < ? AND WaveMax > ?")
+        params += [wave, wave]
+    if wave_min is not None:
+        clauses.append("WaveMax > ?")
+        params.append(wave_min)
+    if wave_max is not None:
+        clauses.append("WaveMin < ?")
+        params.append(wave_max)
+    if MergedOnly:
+        clauses.append('"Order" = \'ALL\'')
+    elif OrdersOnly:
+        clauses.append('"Order" != \'ALL\'')
+    return " AND ".join("(%s)" % c for c in clauses) or "1", params
+
+
+def _parameter_condition(name, value=None, lower=None, upper=None, reference=None):
+    """SQL sub-query of the objects matching one parameter constraint (FilterEngine rules)."""
+    clauses, params = ["parameter = ?"], [name]
+    if value is not None:
+        clauses.append("value = ?")
+        params.append(value)
+    if lower is not None:
+        clauses.append("value > ?")
+        params.append(lower)
+    if upper is not None:
+        clauses.append("value < ?")
+        params.append(upper)
+    if reference is None:
+        clauses.append("preferred_flag = 1")
+    elif reference != "All":
+        clauses.append("reference_id = ?")
+        params.append(reference)
+    return "SELECT object FROM parameters WHERE " + " AND ".join(clauses), params
+
+
+class ObsLogDB:
+    """Read-only connection to the SQLite store.
+
+    Each thread gets its own connection; the store itself can be shared by any
+    number of processes.
+
+    Args:
+        db_file (str): SQLite file, default: default_db_file()
+        rebuild (bool): If true, (re)build the store when it is missing or out of date
+
+    """
+
+    def __init__(self, db_file=None, rebuild=True):
+        self.db_file = default_db_file() if db_file is None else db_file
+        if rebuild and not self.is_current():
+            build_database(self.db_file)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def is_current(self, folder=None):
+        """True if the store exists and was built from the current CSV files."""
+        folder = PYTHONDIR + "/data" if folder is None else folder
+        if not os.path.isfile(self.db_file):
+            return False
+        try:
+            with closing(sqlite3.connect(_read_only_uri(self.db_file), uri=True)) as connection:
+                row = connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        except sqlite3.DatabaseError:
+            return False
+        return row is not None and row[0] == _signature_string(folder)
+
+    @property
+    def connection(self):
+        """sqlite3.Connection: The read-only connection of the calling thread"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Not restricted to this thread, so close() can be called from any thread.
+            connection = sqlite3.connect(_read_only_uri(self.db_file), uri=True, check_same_thread=False)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        """Close the connections of all threads; later queries open new ones."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def query(self, sql, params=()):
+        """Run a SELECT statement and return the result as a DataFrame."""
+        return pd.read_sql_query(sql, self.connection, params=list(params))
+
+    def table(self, name):
+        """One of the oracle tables (obslog, ebvlog, ..., object_log), as read from the CSV files."""
+        assert name in _LOG_FILES, "Unknown table: %s" % name
+        if name == "obslog":
+            table = self.query('SELECT Object, RA, DEC, DateObs, Setting, "Order", WaveMin, '
+                               'WaveMax, Filename FROM obslog ORDER BY rowid')
+            return table.astype({"Object": "category", "Order": "category"})
+        if name == "object_log":
+            return self.query("SELECT object FROM objects ORDER BY rowid")
+        parameter = {attribute: name for name, attribute in _PARAMETER_LOGS.items()}[name]
+        table = self.query("SELECT %s FROM parameters WHERE parameter = ? ORDER BY rowid"
+                           % ", ".join(_PARAMETER_COLUMNS), [parameter])
+        return table.astype({"object": "category"})
+
+    def select_files(self, objects=None, wave=None, wave_min=None, wave_max=None,
+                     MergedOnly=False, OrdersOnly=False):
+        """Filenames of the obslog rows matching the criteria, in obslog order.
+
+        Args:
+            objects (str or list): Object name(s), None: all objects
+            wave (float): Wavelength that must be covered
+            wave_min (float): Files must extend beyond this wavelength
+            wave_max (float): Files must start below this wavelength
+            MergedOnly (bool): Only merged spectra; takes precedence over OrdersOnly
+            OrdersOnly (bool): Only single orders
+
+        Returns:
+            pandas.Series: Filenames, indexed by obslog row
+
+        """
+        where, params = _where_obslog(objects=objects, wave=wave, wave_min=wave_min,
+                                      wave_max=wave_max, MergedOnly=MergedOnly,
+                                      OrdersOnly=OrdersOnly)
+        rows = self.connection.execute("SELECT rowid - 1, Filename FROM obslog WHERE %s ORDER BY rowid"
+                                       % where, params).fetchall()
+        index = [row[0] for row in rows]
+        return pd.Series([row[1] for row in rows], index=index, name="Filename", dtype=str)
+
+    def matching_objects(self, constraints):
+        """Observed objects satisfying all sightline-parameter constraints.
+
+        Args:
+            constraints (dict): Keywords as in EdiblesOracle.getFilteredObsList, e.g.
+                {'EBV_min': 0.2, 'SpType_reference': 'All'}
+
+        Returns:
+            set: The matching object names
+
+        """
+        constraints = dict(constraints)
+        queries, params = ["SELECT object FROM objects"], []
+        for name in _PARAMETER_LOGS:
+            args = [constraints.get(name + suffix) for suffix in ("", "_min", "_max", "_reference")]
+            if any(arg is not None for arg in args):
+                sql, sql_params = _parameter_condition(name, *args)
+                queries.append(sql)
+                params += sql_params
+        rows = self.connection.execute(" INTERSECT ".join(queries), params).fetchall()
+        return set(row[0] for row in rows)
+
+
+if __name__ == "__main__":
+    import time
+
+    db = ObsLogDB()
+    start = time.time()
+    files = db.select_files(objects=["HD 170740"], wave=6614.0, MergedOnly=True)
+    print(files)
+    print("%.2f ms" % (1000 * (time.time() - start)))
+    print(sorted(db.matching_objects({"EBV_min": 0.2, "EBV_max": 0.8})))
@@ -0,0 +1,286 @@
+"""Indexes on the obslog for fast coverage, object and order queries.
+
+Wavelength coverage: within each group of similar files (one setting, merged
+spectra or single orders) the rows are sorted by WaveMin, and the longest
+interval of the group is recorded. A file covers wavelength w only if
+w - longest < WaveMin < w, so a query only has to look at one contiguous
+slice of each group, found with two binary searches.
+
+Objects and orders: a hash index from each value to the (sorted) row positions.
+
+All queries return sorted row positions into the obslog the index was built
+from, so they can be intersected with each other and passed to obslog.iloc.
+"""
+
+import warnings
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class ObsLogIndex:
+    """Interval and hash indexes on an obslog.
+
+    Args:
+        obslog (pandas.DataFrame): Table with (at least) columns Object, Setting,
+            Order, WaveMin and WaveMax
+
+    """
+
+    def __init__(self, obslog):
+        self.n_rows = len(obslog)
+        self.wave_min = obslog.WaveMin.to_numpy(dtype=float)
+        self.wave_max = obslog.WaveMax.to_numpy(dtype=float)
+        order = obslog.Order.astype(str).to_numpy()
+        self.merged = order == "ALL"
+
+        self.objects = self._hash_index(obslog.Object.astype(str).to_numpy())
+        self.orders = self._hash_index(order)
+
+        # One sorted interval list per setting and per merged/single-order files.
+        self.groups = []
+        group_key = obslog.Setting.astype(str).to_numpy() + np.where(self.merged, "_ALL", "_O")
+        for rows in self._hash_index(group_key).values():
+            rows = rows[np.argsort(self.wave_min[rows], kind="stable")]
+            longest = np.max(self.wave_max[rows] - self.wave_min[rows])
+            self.groups.append((self.wave_min[rows], rows, longest))
+
+    @staticmethod
+    def _hash_index(values):
+        """Value -> sorted array of the row positions holding that value."""
+        order = np.argsort(values, kind="stable")
+        keys, starts = np.unique(values[order], return_index=True)
+        return dict(zip(keys.tolist(), np.split(order, starts[1:])))
+
+    def overlapping(self, wave_min=None, wave_max=None):
+        """Rows with WaveMax > wave_min and WaveMin < wave_max.
+
+        Args:
+            wave_min (float): Lower limit, None: no limit
+            wave_max (float): Upper limit, None: no limit
+
+        Returns:
+            1darray: Sorted row positions
+
+        """
+        lo = -np.inf if wave_min is None else wave_min
+        hi = np.inf if wave_max is None else wave_max
+        selected = []
+        for sorted_min, rows, longest in self.groups:
+            first = np.searchsorted(sorted_min, lo - longest, side="right")
+            last = np.searchsorted(sorted_min, hi, side="left")
+            candidates = rows[first:last]
+            selected.append(candidates[self.wave_max[candidates] > lo])
+        return np.sort(np.concatenate(selected)) if selected else np.array([], dtype=int)
+
+    def covering(self, wave):
+        """Rows with WaveMin < wave < WaveMax."""
+        return self.overlapping(wave, wave)
+
+    def rows_for_objects(self, objects):
+        """Sorted row positions of all observations of the given object(s)."""
+        if isinstance(objects, str):
+            objects = [objects]
+        found = [self.objects[obj] for obj in set(objects) if obj in self.objects]
+        return np.sort(np.concatenate(found)) if found else np.array([], dtype=int)
+
+    def select(self, objects=None, wave=None, wave_min=None, wave_max=None,
+               MergedOnly=False, OrdersOnly=False):
+        """Rows matching all of the given criteria.
+
+        Starts from the smallest index (objects if given, else the interval index)
+        and checks the remaining criteria on the candidate rows only.
+
+        Args:
+            objects (str or list): Object name(s), None: all objects
+            wave (float): Wavelength that must be covered
+            wave_min (float): Files must extend beyond this wavelength (WaveMax > wave_min)
+            wave_max (float): Files must start below this wavelength (WaveMin < wave_max)
+            MergedOnly (bool): Only merged spectra; takes precedence over OrdersOnly
+            OrdersOnly (bool): Only single orders
+
+        Returns:
+            1darray: Sorted row positions
+
+        """
+        lo = [w for w in (wave, wave_min) if w is not None]
+        hi = [w for w in (wave, wave_max) if w is not None]
+        lo = max(lo) if lo else None
+        hi = min(hi) if hi else None
+
+        if objects is not None:
+            rows = self.rows_for_objects(objects)
+            if lo is not None:
+                rows = rows[self.wave_max[rows] > lo]
+            if hi is not None:
+                rows = rows[self.wave_min[rows] < hi]
+        elif lo is not None or hi is not None:
+            rows = self.overlapping(lo, hi)
+        else:
+            rows = np.arange(self.n_rows)
+
+        if MergedOnly:
+            rows = rows[self.merged[rows]]
+        elif OrdersOnly:
+            rows = rows[~self.merged[rows]]
+        return rows
+
+
+def unit_vectors(ra, dec):
+    """Cartesian unit vectors of sky positions.
+
+    Args:
+        ra (float or 1darray): Right ascension, in degrees
+        dec (float or 1darray): Declination, in degrees
+
+    Returns:
+        2darray: Shape (n, 3)
+
+    """
+    ra = np.radians(np.atleast_1d(np.asarray(ra, dtype=float)))
+    dec = np.radians(np.atleast_1d(np.asarray(dec, dtype=float)))
+    return np.column_stack((np.cos(dec) * np.cos(ra), np.cos(dec) * np.sin(ra), np.sin(dec)))
+
+
+def read_simbad_positions(filename):
+    """Positions of the objects in a SIMBAD query result, as in data/sightline_data.
+
+    Args:
+        filename (str): The '|'-separated ascii file, with the typed identifier in the
+            second and the sexagesimal ICRS coordinates in the fifth column
+
+    Returns:
+        dict: object -> (ra, dec), in degrees
+
+    """
+    positions = {}
+    with open(filename) as f:
+        for line in f:
+            fields = line.split("|")
+            if len(fields) < 5 or not fields[0].strip().isdigit():
+                continue
+            coords = fields[4].split()
+            if len(coords) != 6:
+                continue
+            hours, minutes, seconds = (float(value) for value in coords[:3])
+            sign = -1.0 if coords[3].startswith("-") else 1.0
+            degrees, arcmin, arcsec = abs(float(coords[3])), float(coords[4]), float(coords[5])
+            positions[fields[1].strip()] = (15.0 * (hours + minutes / 60.0 + seconds / 3600.0),
+                                            sign * (degrees + arcmin / 60.0 + arcsec / 3600.0))
+    return positions
+
+
+def _chord_to_degrees(chord):
+    return np.degrees(2.0 * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0)))
+
+
+def _degrees_to_chord(radius):
+    return 2.0 * np.sin(np.radians(min(radius, 180.0)) / 2.0)
+
+
+class SkyIndex:
+    """KD-tree of sightline positions for cone searches and nearest neighbours.
+
+    Args:
+        names (list): Name of each sightline
+        ra (1darray): Right ascension of each sightline, in degrees
+        dec (1darray): Declination of each sightline, in degrees
+
+    """
+
+    def __init__(self, names, ra, dec):
+        self.names = np.asarray(names, dtype=object)
+        self.ra = np.asarray(ra, dtype=float)
+        self.dec = np.asarray(dec, dtype=float)
+        self.tree = cKDTree(unit_vectors(self.ra, self.dec))
+        self._positions = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_obslog(cls, obslog, positions=None, max_spread=5.0 / 60.0):
+        """One position per object.
+
+        The position of an object is taken from positions if it is there, else it
+        is the mean direction of its observations (the normalised mean of their
+        unit vectors, which is safe across RA = 0).
+
+        Args:
+            obslog (pandas.DataFrame): Table with columns Object, RA and DEC
+            positions (dict): Optional catalogue positions, object -> (ra, dec) in degrees,
+                e.g. from read_simbad_positions
+            max_spread (float): Warn about objects without a catalogue position whose
+                observations are further than this from their mean position, in degrees
+
+        Returns:
+            SkyIndex: The index of all objects in the obslog
+
+        """
+        objects = obslog.Object.astype(str).to_numpy()
+        names, group = np.unique(objects, return_inverse=True)
+        vectors = unit_vectors(obslog.RA.to_numpy(dtype=float), obslog.DEC.to_numpy(dtype=float))
+        mean = np.zeros((len(names), 3))
+        np.add.at(mean, group, vectors)
+        mean /= np.linalg.norm(mean, axis=1)[:, None]
+
+        ra = np.degrees(np.arctan2(mean[:, 1], mean[:, 0])) % 360.0
+        dec = np.degrees(np.arcsin(np.clip(mean[:, 2], -1.0, 1.0)))
+        catalogued = np.zeros(len(names), dtype=bool)
+        if positions:
+            for i, name in enumerate(names):
+                if name in positions:
+                    ra[i], dec[i] = positions[name]
+                    catalogued[i] = True
+
+        # Only the objects that rely on the obslog headers are checked.
+        spread = np.zeros(len(names))
+        np.maximum.at(spread, group, _chord_to_degrees(np.linalg.norm(vectors - mean[group], axis=1)))
+        scattered = (spread > max_spread) & ~catalogued
+        if np.any(scattered):
+            warnings.warn("Observations spread over more than %.1f arcmin: %s" % (
+                max_spread * 60.0, ", ".join("%s (%.1f deg)" % (name, value) for name, value
+                                              in zip(names[scattered], spread[scattered]))))
+        return cls(names.tolist(), ra, dec)
+
+    def position(self, name):
+        """(ra, dec) of a sightline, in degrees."""
+        i = self._positions[name]
+        return self.ra[i], self.dec[i]
+
+    def cone(self, ra, dec, radius):
+        """Sightlines within a radius, nearest first.
+
+        Args:
+            ra (float): Right ascension of the centre, in degrees
+            dec (float): Declination of the centre, in degrees
+            radius (float): Radius of the cone, in degrees
+
+        Returns:
+            tuple: (positions, separations in degrees) of the sightlines in the cone
+
+        """
+        centre = unit_vectors(ra, dec)[0]
+        rows = np.array(self.tree.query_ball_point(centre, _degrees_to_chord(radius)), dtype=int)
+        chord = np.linalg.norm(self.tree.data[rows] - centre, axis=1)
+        order = np.lexsort((rows, chord))
+        return rows[order], _chord_to_degrees(chord[order])
+
+    def nearest(self, ra, dec, k=1, radius=None):
+        """The k sightlines closest to a position, nearest first.
+
+        Args:
+            ra (float): Right ascension, in degrees
+            dec (float): Declination, in degrees
+            k (int): Number of neighbours
+            radius (float): Only return neighbours within this radius, in degrees
+
+        Returns:
+            tuple: (positions, separations in degrees) of the neighbours
+
+        """
+        k = min(k, len(self.names))
+        if k < 1:
+            return np.array([], dtype=int), np.array([])
+        bound = np.inf if radius is None else _degrees_to_chord(radius) * (1 + 1e-12)
+        chord, rows = self.tree.query(unit_vectors(ra, dec)[0], k=list(range(1, k + 1)),
+                                      distance_upper_bound=bound)
+        found = np.isfinite(chord)
+        return rows[found].astype(int), _chord_to_degrees(chord[found])
@@ -0,0 +1,209 @@
+"""Stitch the single-order spectra of one exposure into a merged spectrum.
+
+The noisy edges of every order are cut using the trim fractions in
+``data/order_trims.csv`` (one row per setting, arm and order). The trimmed
+orders are rebinned onto a common grid with the flux-conserving operator from
+rebin_spectrum, and overlapping orders are combined with inverse-variance
+weights. The variance of a pixel is estimated from the noise level of its order
+and scaled with the flux, so the low-count ends of an order get less weight
+than the centre of the neighbouring order.
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from edibles import DATARELEASE, PYTHONDIR
+from edibles.utils.functions import filename_arm
+from edibles.utils.rebin_spectrum import rebin_spectrum
+from edibles.utils.spectrum_loader import load_spectra
+
+
+def read_order_trims(filename=None):
+    """Read the table of order-edge trims.
+
+    Args:
+        filename (str): CSV file with columns Setting, Arm, Order, TrimMin, TrimMax,
+            default: data/order_trims.csv
+
+    Returns:
+        pandas.DataFrame: The trim table
+
+    """
+    if filename is None:
+        filename = PYTHONDIR + "/data/order_trims.csv"
+    trims = pd.read_csv(filename, dtype={"Arm": str})
+    trims["Order"] = trims["Order"].astype(str)
+    return trims
+
+
+def trimmed_ranges(obslog, trims=None):
+    """Add the trimmed wavelength range of every single-order observation.
+
+    TrimMin and TrimMax are fractions of the order length cut from the blue
+    and red end respectively. Merged spectra (Order == 'ALL') and orders not
+    in the trim table are not trimmed.
+
+    Args:
+        obslog (pandas.DataFrame): Rows of the obslog
+        trims (pandas.DataFrame): The trim table, default: read_order_trims()
+
+    Returns:
+        pandas.DataFrame: obslog with extra columns Arm, TrimMin, TrimMax,
+            TrimWaveMin and TrimWaveMax, in the same order as the input
+
+    """
+    if trims is None:
+        trims = read_order_trims()
+
+    obslog = obslog.assign(Arm=obslog.Filename.map(filename_arm),
+                           Order=obslog.Order.astype(str))
+    merged = obslog.merge(trims, on=["Setting", "Arm", "Order"], how="left")
+    merged.index = obslog.index
+    merged[["TrimMin", "TrimMax"]] = merged[["TrimMin", "TrimMax"]].fillna(0.0)
+
+    length = merged.WaveMax - merged.WaveMin
+    merged["TrimWaveMin"] = merged.WaveMin + length * merged.TrimMin
+    merged["TrimWaveMax"] = merged.WaveMax - length * merged.TrimMax
+    return merged
+
+
+def exposure_id(filename):
+    """Name shared by all order files of one exposure, e.g. HD170740_w860_redl_20140915."""
+    return os.path.basename(str(filename)).split("_O")[0]
+
+
+def exposure_groups(obslog):
+    """Group the single-order files of the obslog by exposure.
+
+    Args:
+        obslog (pandas.DataFrame): Rows of the obslog
+
+    Returns:
+        dict: exposure id -> list of order filenames
+
+    """
+    orders = obslog[obslog.Order.astype(str) != "ALL"]
+    return {key: group.Filename.tolist()
+            for key, group in orders.groupby(orders.Filename.map(exposure_id), sort=True)}
+
+
+def order_noise(flux):
+    """Robust noise estimate of each row, from second differences (as in DER_SNR).
+
+    Args:
+        flux (2darray): Flux, one order per row, NaN outside the order
+
+    Returns:
+        1darray: 1-sigma noise per row
+
+    """
+    diff = np.abs(2.0 * flux[:, 2:-2] - flux[:, :-4] - flux[:, 4:])
+    return 1.482602 / np.sqrt(6.0) * np.nanmedian(diff, axis=1)
+
+
+def merge_arrays(waves, fluxes, grid=None):
+    """Merge overlapping (already trimmed) orders onto one grid.
+
+    Args:
+        waves (list): Increasing wavelength array of each order
+        fluxes (list): Flux array of each order
+        grid (1darray): Grid to merge onto, default: linear grid spanning all
+            orders with the smallest pixel size of the input
+
+    Returns:
+        tuple: (wave, flux, error) of the merged spectrum; NaN where no order has data
+
+    """
+    if grid is None:
+        step = min(np.median(np.diff(wave)) for wave in waves)
+        grid = np.arange(min(wave[0] for wave in waves), max(wave[-1] for wave in waves), step)
+
+    stack = np.vstack([rebin_spectrum(wave, flux, grid) for wave, flux in zip(waves, fluxes)])
+
+    noise = order_noise(stack)
+    level = np.nanmedian(stack, axis=1)
+    variance = noise[:, None] ** 2 * np.clip(stack / level[:, None], 1e-3, None)
+    weights = np.where(np.isfinite(stack), 1.0 / variance, 0.0)
+    weights[~np.isfinite(weights)] = 0.0
+
+    total = weights.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        flux = np.nansum(weights * np.nan_to_num(stack), axis=0) / total
+        error = 1.0 / np.sqrt(total)
+    flux[total == 0] = np.nan
+    error[total == 0] = np.nan
+    return grid, flux, error
+
+
+def merge_orders(filenames, obslog=None, grid=None, trims=None, cache_dir=None, noDATADIR=False):
+    """Merge the order files of one exposure into a single spectrum.
+
+    Args:
+        filenames (list): Obslog filenames of the orders of one exposure
+        obslog (pandas.DataFrame): Obslog containing these files, default: the full obslog
+        grid (1darray): Grid to merge onto, see merge_arrays
+        trims (pandas.DataFrame): The trim table, default: read_order_trims()
+        cache_dir (str): If given, the merged product is stored in (and read back
+            from) <cache_dir>/<exposure id>_<key>_merged.npz, where key is a hash of
+            the files, the grid and the trims, so other grids or trims are merged anew
+        noDATADIR (bool): If true, DATADIR will not be added to the front of the filenames
+
+    Returns:
+        tuple: (wave, flux, error) of the merged spectrum
+
+    """
+    filenames = list(filenames)
+    ids = set(exposure_id(f) for f in filenames)
+    assert len(ids) == 1, "all files must belong to the same exposure"
+
+    if trims is None:
+        trims = read_order_trims()
+
+    cache_file = None
+    if cache_dir is not None:
+        key = hashlib.sha1(repr(sorted(filenames)).encode())
+        key.update(b"default grid" if grid is None
+                   else np.ascontiguousarray(grid, dtype=float).tobytes())
+        key.update(pd.util.hash_pandas_object(trims, index=False).to_numpy().tobytes())
+        cache_file = os.path.join(cache_dir, "%s_%s_merged.npz" % (ids.pop(), key.hexdigest()[:12]))
+        if os.path.isfile(cache_file):
+            with np.load(cache_file) as cached:
+                return cached["wave"], cached["flux"], cached["error"]
+
+    if obslog is None:
+        obslog = pd.read_csv(PYTHONDIR + "/data/" + DATARELEASE + "_ObsLog.csv")
+    rows = obslog.set_index("Filename").loc[filenames].reset_index()
+    rows = trimmed_ranges(rows, trims=trims)
+
+    waves, fluxes = [], []
+    for sp, row in zip(load_spectra(filenames, compact=True, noDATADIR=noDATADIR),
+                       rows.itertuples(index=False)):
+        wave, flux = sp.getSpectrum(row.TrimWaveMin, row.TrimWaveMax)
+        waves.append(wave)
+        fluxes.append(flux)
+
+    wave, flux, error = merge_arrays(waves, fluxes, grid=grid)
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_file = cache_file[:-len(".npz")] + ".tmp.npz"
+        np.savez(tmp_file, wave=wave, flux=flux, error=error)
+        os.replace(tmp_file, cache_file)
+
+    return wave, flux, error
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+    from edibles.utils.edibles_oracle import EdiblesOracle
+
+    pythia = EdiblesOracle.shared()
+    groups = exposure_groups(pythia.obslog[pythia.obslog.Object == "HD 170740"])
+    exposure, files = next(iter(groups.items()))
+    wave, flux, error = merge_orders(files)
+    plt.plot(wave, flux)
+    plt.title(exposure)
+    plt.show()
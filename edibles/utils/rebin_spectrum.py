@@ -0,0 +1,136 @@
+"""Flux-conserving rebinning of spectra onto a new wavelength grid.
+
+Each pixel is treated as a bin of constant flux density, with bin edges
+halfway between neighbouring pixels. The value in a new bin is the overlap-
+weighted mean of the old bins it covers, so the integrated flux is conserved.
+Because the weights only depend on the two grids, they are collected once in a
+sparse operator; regridding a stack of spectra is a single sparse product, and
+operators for grid pairs that are used repeatedly are cached.
+"""
+
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+_OPERATOR_CACHE = OrderedDict()
+_OPERATOR_CACHE_SIZE = 32
+
+
+def bin_edges(wave):
+    """Edges of the bins centred on the pixels of a wavelength grid.
+
+    Args:
+        wave (1darray): Increasing wavelength grid, at least two points
+
+    Returns:
+        1darray: The len(wave) + 1 bin edges
+
+    """
+    wave = np.asarray(wave, dtype=float)
+    assert wave.ndim == 1 and len(wave) > 1, "wave must be a 1D grid of at least two points"
+    mid = 0.5 * (wave[1:] + wave[:-1])
+    return np.concatenate(([wave[0] - (mid[0] - wave[0])], mid, [wave[-1] + (wave[-1] - mid[-1])]))
+
+
+def _grid_key(wave):
+    wave = np.ascontiguousarray(wave, dtype=float)
+    return len(wave), hashlib.sha1(wave.tobytes()).hexdigest()
+
+
+def _build_operator(wave, new_wave):
+    old_edges = bin_edges(wave)
+    new_edges = bin_edges(new_wave)
+    n_old, n_new = len(wave), len(new_wave)
+
+    lo, hi = new_edges[:-1], new_edges[1:]
+    first = np.clip(np.searchsorted(old_edges, lo, side="right") - 1, 0, n_old - 1)
+    last = np.clip(np.searchsorted(old_edges, hi, side="left") - 1, 0, n_old - 1)
+    counts = np.maximum(last - first + 1, 0)
+
+    rows = np.repeat(np.arange(n_new), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = np.repeat(first, counts) + offsets
+
+    overlap = (np.minimum(old_edges[cols + 1], hi[rows]) - np.maximum(old_edges[cols], lo[rows]))
+    overlap = np.clip(overlap, 0, None)
+    weights = overlap / (hi - lo)[rows]
+
+    operator = sparse.csr_matrix((weights, (rows, cols)), shape=(n_new, n_old))
+    operator.eliminate_zeros()
+
+    # New bins that stick out of the old grid have no well-defined mean flux.
+    covered = (lo >= old_edges[0]) & (hi <= old_edges[-1])
+    return operator, covered
+
+
+def rebin_operator(wave, new_wave):
+    """Return the (cached) sparse operator that rebins data from wave onto new_wave.
+
+    Args:
+        wave (1darray): Increasing wavelength grid of the input data
+        new_wave (1darray): Increasing wavelength grid to rebin onto
+
+    Returns:
+        tuple: tuple containing:
+
+            scipy.sparse.csr_matrix: Operator of shape (len(new_wave), len(wave))
+
+            1darray: Boolean mask of the new bins fully covered by the old grid
+
+    """
+    key = (_grid_key(wave), _grid_key(new_wave))
+    if key in _OPERATOR_CACHE:
+        _OPERATOR_CACHE.move_to_end(key)
+        return _OPERATOR_CACHE[key]
+
+    result = _build_operator(np.asarray(wave, dtype=float), np.asarray(new_wave, dtype=float))
+    _OPERATOR_CACHE[key] = result
+    if len(_OPERATOR_CACHE) > _OPERATOR_CACHE_SIZE:
+        _OPERATOR_CACHE.popitem(last=False)
+    return result
+
+
+def rebin_spectrum(wave, flux, new_wave, error=None, fill_value=np.nan):
+    """Rebin one spectrum, or a stack of spectra sharing a grid, onto a new grid.
+
+    Args:
+        wave (1darray): Increasing wavelength grid of the input data
+        flux (1darray or 2darray): Flux, shape (n_pixels,) or (n_spectra, n_pixels)
+        new_wave (1darray): Increasing wavelength grid to rebin onto
+        error (1darray or 2darray): Optional 1-sigma uncertainties, same shape as flux
+        fill_value (float): Value for new bins not fully covered by the input grid
+
+    Returns:
+        1darray or 2darray: The rebinned flux; (flux, error) if error is given
+
+    """
+    operator, covered = rebin_operator(wave, new_wave)
+
+    flux = np.asarray(flux, dtype=float)
+    assert flux.shape[-1] == len(wave), "last axis of flux must match wave"
+
+    new_flux = (operator @ flux.T).T
+    new_flux[..., ~covered] = fill_value
+    if error is None:
+        return new_flux
+
+    error = np.asarray(error, dtype=float)
+    assert error.shape == flux.shape, "error must have the same shape as flux"
+    new_error = np.sqrt((operator.multiply(operator) @ (error ** 2).T).T)
+    new_error[..., ~covered] = fill_value
+    return new_flux, new_error
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    wave = np.linspace(6600, 6630, 1500)
+    flux = 1 - 0.5 * np.exp(-0.5 * ((wave - 6614) / 0.3) ** 2)
+    new_wave = np.linspace(6601, 6629, 200)
+
+    plt.plot(wave, flux, label="Input")
+    plt.step(new_wave, rebin_spectrum(wave, flux, new_wave), where="mid", label="Rebinned")
+    plt.legend()
+    plt.show()
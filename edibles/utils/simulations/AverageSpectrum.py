@@ -7,9 +7,10 @@ is computed too. The resulting profile is for a given DIB, in a range of (DIB-4,
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from edibles.utils.simulations.SRC.Functions import Signal_Noise_Calculator, weighted_average
+from edibles.utils.simulations.SRC.Functions import Signal_Noise_Calculator
+from edibles.utils.coadd import coadd
 from edibles.utils.edibles_oracle import EdiblesOracle
-from edibles.utils.edibles_spectrum import EdiblesSpectrum
+from edibles.utils.spectrum_loader import load_spectra
 
 
 def CreateAverageSpectrum(DIB, Target, save_to_file=False, save_figure=False, verbose=True):
@@ -33,7 +34,7 @@ def CreateAverageSpectrum(DIB, Target, save_to_file=False, save_figure=False, ve
             Resulting average profile in the form of (wavelength, intensity).
     """
     # Get Edibles files of that sightline.
-    oracle = EdiblesOracle()
+    oracle = EdiblesOracle.shared()
     List = oracle.getFilteredObsList([Target], Wave=DIB, MergedOnly=True)
 
     # Dataframe to save the data.
@@ -47,11 +48,8 @@ def CreateAverageSpectrum(DIB, Target, save_to_file=False, save_figure=False, ve
         print("Sightline files not found!")
         return np.array([[0], [0]])
 
-    # Iterate over found datafiles.
-    for file in List:
-
-        # Get Edibles data.
-        sp = EdiblesSpectrum(file)
+    # Iterate over found datafiles, read concurrently.
+    for sp in load_spectra(List):
 
         # Get target observation date and print it.
         target_date = str(sp.datetime.date()).replace('-', '_')
@@ -62,8 +60,8 @@ def CreateAverageSpectrum(DIB, Target, save_to_file=False, save_figure=False, ve
         sp.getSpectrum(xmin=DIB-4, xmax=DIB+4)
 
         # Get wavelenth and flux
-        DIB_wavelength = np.asarray(sp.grid.byteswap().newbyteorder(), dtype='float64')
-        DIB_flux = np.asarray(sp.interp_bary_flux.byteswap().newbyteorder(), dtype='float64')
+        DIB_wavelength = np.asarray(sp.grid, dtype='float64')
+        DIB_flux = np.asarray(sp.interp_bary_flux, dtype='float64')
         DIB_flux = DIB_flux/np.max(DIB_flux)
 
         # Select datapoints to compute SN ratio.
@@ -90,21 +88,14 @@ def CreateAverageSpectrum(DIB, Target, save_to_file=False, save_figure=False, ve
             plt.plot(DIB_wavelength, DIB_flux+offset, label=target_date)
             offset = offset+0.05
 
-    # List to save stacking results.
-    weig_avg = []
-    weig_avg_err = []
-
     # Print all the data obtained.
     if verbose:
         print(df)
 
-    # Compute weighted average.
-    for i in range(len(df.index)):
-        values = df[df.columns[::2]].iloc[i].values
-        error = df[df.columns[1::2]].iloc[i].values
-        avg_weig = weighted_average(values, error)
-        weig_avg.append(avg_weig[0])
-        weig_avg_err.append(avg_weig[1])
+    # Compute weighted average over all epochs at once.
+    values = df[df.columns[::2]].to_numpy().T
+    error = df[df.columns[1::2]].to_numpy().T
+    weig_avg, weig_avg_err, _ = coadd(values, error)
 
     # Normalization
     weig_avg = weig_avg/np.max(weig_avg)
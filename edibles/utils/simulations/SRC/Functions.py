@@ -1,8 +1,9 @@
 """Python script to hold all of the little functions that get used throughout this project."""
-from lmfit.models import LinearModel
 import numpy as np
 import pandas as pd
 
+from edibles.utils.coadd import linear_snr
+
 
 def Signal_Noise_Calculator(x_vals, y_vals):
     """Calculate the signal to noise ratio (S/N).
@@ -24,17 +25,9 @@ def Signal_Noise_Calculator(x_vals, y_vals):
             through the input spectrum.
 
     """
-    # Fit a linear model through the inpit x_vals and y_vals
-    lin_fit = LinearModel()
-    lin_fit_pars = lin_fit.guess(y_vals, x=x_vals)
-    lin_fit_out = lin_fit.fit(y_vals, lin_fit_pars, x=x_vals)
-    y_fit = lin_fit_out.best_fit
-    # Find the residuals of the best fit.
-    resid = lin_fit_out.residual
-    # Calculate the S/N using the Root Mean Squared Error(RMSE)
-    resid_square = [r**2 for r in resid]
-    resid_error = np.sqrt(np.sum(resid_square)/len(resid_square))
-    SN = np.mean(y_vals)/resid_error
+    # Fit a linear model through the inpit x_vals and y_vals, in closed form,
+    # and calculate the S/N using the Root Mean Squared Error(RMSE) of the residuals.
+    SN, y_fit = linear_snr(x_vals, y_vals)
 
     return (SN, y_fit)
 
@@ -0,0 +1,211 @@
+"""A packed, compressed copy of the EDIBLES spectral archive.
+
+Opening ~30000 individual FITS files costs a file-open and a header parse per
+spectrum. ``pack_archive`` instead writes the spectra of one setting/arm
+(e.g. 564/redl) into a single file. The flux of each spectrum is stored as
+zlib-compressed chunks of ``chunk_pixels`` pixels, preceded by a small table of
+the compressed chunk sizes. One index (``archive_index.csv``) maps every obslog
+filename to its pack file, byte offset and wavelength solution, so a reader
+only decompresses the chunks that overlap a requested window.
+"""
+
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+
+from edibles import DATADIR, DATARELEASE, PYTHONDIR
+from edibles.utils.edibles_spectrum import CompactSpectrum
+from edibles.utils.functions import filename_arm
+from edibles.utils.spectrum_loader import iter_spectra
+
+INDEX_NAME = "archive_index.csv"
+
+
+def _read_fits(filename):
+    """Read the flux and the header keywords the index needs from one FITS file."""
+    with fits.open(filename, memmap=False) as hdulist:
+        header = hdulist[0].header
+        keywords = {
+            "Object": header["OBJECT"],
+            "DateObs": header["DATE-OBS"],
+            "VBary": header["HIERARCH ESO QC VRAD BARYCOR"],
+            "CRVAL1": header["CRVAL1"],
+            "CDELT1": header["CDELT1"],
+        }
+        return keywords, np.asarray(hdulist[0].data, dtype="<f4")
+
+
+def pack_archive(outdir, obslog=None, datadir=None, chunk_pixels=2048, level=6, max_workers=8):
+    """Pack the FITS files listed in the obslog into one file per setting/arm.
+
+    Args:
+        outdir (str): Directory to write the pack files and the index to
+        obslog (pandas.DataFrame): Observations to pack, default: the full obslog
+        datadir (str): Directory the obslog filenames are relative to, default: DATADIR
+        chunk_pixels (int): Number of pixels per compressed chunk
+        level (int): zlib compression level
+        max_workers (int): Number of threads reading FITS files
+
+    Returns:
+        pandas.DataFrame: The index that was written
+
+    """
+    if obslog is None:
+        obslog = pd.read_csv(PYTHONDIR + "/data/" + DATARELEASE + "_ObsLog.csv")
+    if datadir is None:
+        datadir = DATADIR
+    os.makedirs(outdir, exist_ok=True)
+
+    obslog = obslog.assign(Arm=obslog.Filename.map(filename_arm))
+
+    index = []
+    for (setting, arm), group in obslog.groupby(["Setting", "Arm"], sort=True):
+        pack_name = "{}_{}_{}.pack".format(DATARELEASE, setting, arm)
+        full_names = [os.path.join(datadir, f.lstrip("/")) for f in group.Filename]
+        orders = dict(zip(full_names, zip(group.Filename, group.Order)))
+
+        with open(os.path.join(outdir, pack_name), "wb") as f:
+            for full_name, (keywords, flux) in iter_spectra(full_names, reader=_read_fits,
+                                                            max_workers=max_workers):
+                chunks = [zlib.compress(flux[i:i + chunk_pixels].tobytes(), level)
+                          for i in range(0, len(flux), chunk_pixels)]
+                sizes = np.array([len(chunk) for chunk in chunks], dtype="<u8")
+
+                offset = f.tell()
+                f.write(sizes.tobytes())
+                for chunk in chunks:
+                    f.write(chunk)
+
+                filename, order = orders[full_name]
+                index.append({
+                    "Filename": filename,
+                    "Setting": setting,
+                    "Arm": arm,
+                    "Order": order,
+                    **keywords,
+                    "NAXIS1": len(flux),
+                    "WaveMin": keywords["CRVAL1"],
+                    "WaveMax": keywords["CRVAL1"] + keywords["CDELT1"] * (len(flux) - 1),
+                    "PackFile": pack_name,
+                    "Offset": offset,
+                    "NChunks": len(chunks),
+                    "ChunkPixels": chunk_pixels,
+                })
+
+    index = pd.DataFrame(index)
+    tmp_name = os.path.join(outdir, INDEX_NAME + ".tmp")
+    index.to_csv(tmp_name, index=False)
+    os.replace(tmp_name, os.path.join(outdir, INDEX_NAME))
+    return index
+
+
+class SpectralArchive:
+    """
+    Reader for an archive written by pack_archive.
+
+    Args:
+        directory (str): Directory holding the pack files and archive_index.csv
+
+    Attributes:
+        index (pandas.DataFrame): One row per packed spectrum
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = pd.read_csv(os.path.join(directory, INDEX_NAME))
+        self._rows = {filename: i for i, filename in enumerate(self.index.Filename)}
+
+    def __contains__(self, filename):
+        return filename in self._rows
+
+    def __len__(self):
+        return len(self.index)
+
+    def _read(self, f, row, first=0, last=None):
+        """Decompress chunks first..last (inclusive) of the spectrum in row."""
+        n_chunks = int(row.NChunks)
+        if last is None:
+            last = n_chunks - 1
+
+        f.seek(int(row.Offset))
+        sizes = np.frombuffer(f.read(8 * n_chunks), dtype="<u8").astype(np.int64)
+        starts = np.concatenate(([0], np.cumsum(sizes)))
+        f.seek(int(row.Offset) + 8 * n_chunks + int(starts[first]))
+        raw = f.read(int(starts[last + 1] - starts[first]))
+
+        local = starts[first:last + 2] - starts[first]
+        flux = np.concatenate([np.frombuffer(zlib.decompress(raw[local[i]:local[i + 1]]),
+                                             dtype="<f4")
+                               for i in range(last - first + 1)])
+        pixels = np.arange(first * int(row.ChunkPixels), first * int(row.ChunkPixels) + len(flux))
+        wave = pixels * row.CDELT1 + row.CRVAL1
+        return wave, flux
+
+    def _spectrum(self, row, wave, flux):
+        return CompactSpectrum.from_arrays(wave, flux, v_bary=row.VBary, target=row.Object,
+                                           date=row.DateObs, filename=row.Filename)
+
+    def getSpectrum(self, filename, xmin=None, xmax=None):
+        """Read one spectrum, optionally restricted to the window (xmin, xmax).
+
+        Only the chunks that overlap the (geocentric) window are decompressed.
+
+        Args:
+            filename (str): The obslog filename of the spectrum
+            xmin (float): Minimum wavelength, default: start of the spectrum
+            xmax (float): Maximum wavelength, default: end of the spectrum
+
+        Returns:
+            CompactSpectrum: The requested data
+
+        """
+        row = self.index.iloc[self._rows[filename]]
+        n_pix, chunk_pixels = int(row.NAXIS1), int(row.ChunkPixels)
+
+        first, last = 0, int(row.NChunks) - 1
+        if xmin is not None:
+            pix = int(np.floor((xmin - row.CRVAL1) / row.CDELT1))
+            first = min(max(pix, 0), n_pix - 1) // chunk_pixels
+        if xmax is not None:
+            pix = int(np.ceil((xmax - row.CRVAL1) / row.CDELT1))
+            last = min(max(pix, 0), n_pix - 1) // chunk_pixels
+
+        with open(os.path.join(self.directory, row.PackFile), "rb") as f:
+            wave, flux = self._read(f, row, first, last)
+
+        lo = 0 if xmin is None else np.searchsorted(wave, xmin, side="right")
+        hi = len(wave) if xmax is None else np.searchsorted(wave, xmax, side="left")
+        return self._spectrum(row, wave[lo:hi], flux[lo:hi])
+
+    def iter_spectra(self, setting=None, arm=None):
+        """Sequentially read every spectrum of the archive, pack file by pack file.
+
+        Args:
+            setting (int): Only read this setting, default: all
+            arm (str): Only read this arm ('blue', 'redl' or 'redu'), default: all
+
+        Yields:
+            tuple: (filename, CompactSpectrum)
+
+        """
+        index = self.index
+        if setting is not None:
+            index = index[index.Setting == setting]
+        if arm is not None:
+            index = index[index.Arm == arm]
+
+        for pack_name, group in index.groupby("PackFile", sort=True):
+            with open(os.path.join(self.directory, pack_name), "rb") as f:
+                for row in group.sort_values("Offset").itertuples(index=False):
+                    wave, flux = self._read(f, row)
+                    yield row.Filename, self._spectrum(row, wave, flux)
+
+
+if __name__ == "__main__":
+    import sys
+
+    pack_archive(sys.argv[1])
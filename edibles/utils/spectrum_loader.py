@@ -0,0 +1,123 @@
+"""Concurrent loading of many EDIBLES spectra.
+
+Reading FITS files is dominated by I/O latency, so the files are read by a
+pool of threads while the caller consumes the spectra that are already
+available. At most ``prefetch`` files are in flight at any time, which bounds
+the memory held by spectra that have been read but not yet consumed.
+"""
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from functools import partial
+
+import pandas as pd
+
+from edibles.utils.edibles_spectrum import EdiblesSpectrum, CompactSpectrum
+
+
+def _as_filename_list(filenames):
+    """Accept an oracle result (Series), an obslog (DataFrame) or any iterable of names."""
+    if isinstance(filenames, pd.DataFrame):
+        filenames = filenames["Filename"]
+    if isinstance(filenames, pd.Series):
+        return filenames.tolist()
+    if isinstance(filenames, str):
+        return [filenames]
+    return list(filenames)
+
+
+def _read(filename, compact=False, fully_featured=False, noDATADIR=False):
+    if compact:
+        return CompactSpectrum.from_file(filename, noDATADIR=noDATADIR)
+    return EdiblesSpectrum(filename, fully_featured=fully_featured, noDATADIR=noDATADIR)
+
+
+def iter_spectra(filenames, compact=False, ordered=True, max_workers=8, prefetch=None,
+                 fully_featured=False, noDATADIR=False, reader=None):
+    """Read spectra concurrently and yield them one at a time.
+
+    Args:
+        filenames (list or pandas.Series or pandas.DataFrame): Names of the files, relative
+            to DATADIR, e.g. the result of EdiblesOracle.getFilteredObsList
+        compact (bool): If true, yield CompactSpectrum instead of EdiblesSpectrum objects
+        ordered (bool): If true, yield in input order; otherwise as soon as a file is read
+        max_workers (int): Number of reader threads
+        prefetch (int): Maximum number of files read ahead of the consumer,
+            default: 2 * max_workers
+        fully_featured (bool): Passed on to EdiblesSpectrum
+        noDATADIR (bool): If true, DATADIR will not be added to the front of the filenames
+        reader (callable): Optional function that reads one file and returns what is yielded;
+            replaces the EdiblesSpectrum/CompactSpectrum reader
+
+    Yields:
+        tuple: (filename, spectrum)
+
+    """
+    filenames = _as_filename_list(filenames)
+    if prefetch is None:
+        prefetch = 2 * max_workers
+    assert prefetch >= 1, "prefetch must be at least 1"
+
+    if reader is None:
+        read = partial(_read, compact=compact, fully_featured=fully_featured, noDATADIR=noDATADIR)
+    else:
+        read = reader
+    remaining = iter(filenames)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = deque()
+
+        def submit():
+            for filename in remaining:
+                in_flight.append((filename, pool.submit(read, filename)))
+                return True
+            return False
+
+        while len(in_flight) < prefetch and submit():
+            pass
+
+        if ordered:
+            while in_flight:
+                filename, future = in_flight.popleft()
+                spectrum = future.result()
+                submit()
+                yield filename, spectrum
+        else:
+            while in_flight:
+                done, _ = wait([future for _, future in in_flight], return_when=FIRST_COMPLETED)
+                for item in [item for item in in_flight if item[1] in done]:
+                    in_flight.remove(item)
+                    submit()
+                    yield item[0], item[1].result()
+
+
+def load_spectra(filenames, compact=False, max_workers=8, prefetch=None,
+                 fully_featured=False, noDATADIR=False):
+    """Read spectra concurrently and return them in input order.
+
+    Args:
+        filenames (list or pandas.Series or pandas.DataFrame): Names of the files, relative
+            to DATADIR, e.g. the result of EdiblesOracle.getFilteredObsList
+        compact (bool): If true, return CompactSpectrum instead of EdiblesSpectrum objects
+        max_workers (int): Number of reader threads
+        prefetch (int): Maximum number of files read ahead, default: 2 * max_workers
+        fully_featured (bool): Passed on to EdiblesSpectrum
+        noDATADIR (bool): If true, DATADIR will not be added to the front of the filenames
+
+    Returns:
+        list: The spectra, in the same order as filenames
+
+    """
+    return [spectrum for _, spectrum in iter_spectra(filenames, compact=compact, ordered=True,
+                                                     max_workers=max_workers, prefetch=prefetch,
+                                                     fully_featured=fully_featured,
+                                                     noDATADIR=noDATADIR)]
+
+
+if __name__ == "__main__":
+    from edibles.utils.edibles_oracle import EdiblesOracle
+
+    pythia = EdiblesOracle.shared()
+    List = pythia.getFilteredObsList(object=["HD 170740"], MergedOnly=True, Wave=6614)
+    for filename, sp in iter_spectra(List, compact=True, ordered=False):
+        print(filename, sp.target, sp.date)
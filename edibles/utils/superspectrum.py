@@ -0,0 +1,206 @@
+"""Average many sightlines into superspectra in several rest frames at once.
+
+A superspectrum is the weighted mean of the (normalized) spectra of many
+sightlines, after shifting them into a common rest frame: the geocentric frame
+(telluric features line up), the stellar frame (stellar lines line up) or the
+interstellar frame (DIBs and interstellar lines line up). All frames are built
+in one pass over the data: each spectrum is read once, normalized once and
+interpolated onto the shared grid for all frames in a single call, and then
+added to one StreamingCoadd per frame. Only the running sums are kept, so
+memory does not depend on the number of sightlines.
+"""
+
+import numpy as np
+import astropy.constants as cst
+
+from edibles.utils.coadd import StreamingCoadd
+from edibles.utils.order_merging import order_noise
+from edibles.utils.spectrum_loader import iter_spectra
+
+FRAMES = ("geocentric", "stellar", "ism")
+
+
+def doppler_factors(v_bary, v_star=0.0, v_ism=0.0, frames=FRAMES):
+    """Factor by which observed (geocentric) wavelengths are multiplied to go to each frame.
+
+    Args:
+        v_bary (float): Barycentric correction, in km/s
+        v_star (float): Barycentric radial velocity of the star, in km/s
+        v_ism (float): Barycentric radial velocity of the interstellar cloud, in km/s
+        frames (tuple): Frames to compute, from 'geocentric', 'barycentric', 'stellar', 'ism'
+
+    Returns:
+        1darray: One factor per frame
+
+    """
+    c = cst.c.to("km/s").value
+    bary = 1.0 + v_bary / c
+    factors = {"geocentric": 1.0,
+               "barycentric": bary,
+               "stellar": bary * (1.0 - v_star / c),
+               "ism": bary * (1.0 - v_ism / c)}
+    return np.array([factors[frame] for frame in frames])
+
+
+def doppler_regrid(wave, flux, grid, factors):
+    """Interpolate one spectrum onto a grid in several frames with a single call.
+
+    Args:
+        wave (1darray): Increasing observed wavelengths
+        flux (1darray): Flux
+        grid (1darray): Wavelength grid of the output frames
+        factors (1darray): Doppler factor of each frame, see doppler_factors
+
+    Returns:
+        2darray: Flux of shape (len(factors), len(grid)); NaN outside the spectrum
+
+    """
+    factors = np.asarray(factors, dtype=float)
+    # A grid point in a frame corresponds to grid / factor in the observed frame.
+    observed = np.asarray(grid)[None, :] / factors[:, None]
+    return np.interp(observed.ravel(), wave, flux, left=np.nan, right=np.nan).reshape(observed.shape)
+
+
+def normalize(wave, flux, degree=2):
+    """Divide a spectrum by a least-squares polynomial fit of the given degree."""
+    good = np.isfinite(flux)
+    x = wave - wave.mean()
+    return flux / np.polyval(np.polyfit(x[good], flux[good], degree), x)
+
+
+class SuperSpectrum:
+    """Streaming superspectra in several rest frames on one wavelength grid.
+
+    Args:
+        grid (1darray): Wavelength grid shared by all frames, in AA
+        frames (tuple): Frames to build, from 'geocentric', 'barycentric', 'stellar', 'ism'
+        degree (int): Degree of the polynomial each spectrum is divided by, None: no normalization
+
+    """
+
+    def __init__(self, grid, frames=FRAMES, degree=2):
+        self.grid = np.asarray(grid, dtype=float)
+        self.frames = tuple(frames)
+        self.degree = degree
+        self.coadds = {frame: StreamingCoadd(len(self.grid)) for frame in self.frames}
+        self.targets = []
+
+    def add(self, wave, flux, v_bary, v_star=0.0, v_ism=0.0, noise=None, target=None):
+        """Add one spectrum to all frames.
+
+        Args:
+            wave (1darray): Increasing observed (geocentric) wavelengths
+            flux (1darray): Flux
+            v_bary (float): Barycentric correction, in km/s
+            v_star (float): Barycentric radial velocity of the star, in km/s
+            v_ism (float): Barycentric radial velocity of the interstellar cloud, in km/s
+            noise (float): 1-sigma noise of the normalized spectrum, default: estimated
+                from the data
+            target (str): Name of the sightline, kept in self.targets
+
+        """
+        wave = np.asarray(wave, dtype=float)
+        flux = np.asarray(flux, dtype=float)
+        if self.degree is not None:
+            flux = normalize(wave, flux, degree=self.degree)
+        if noise is None:
+            noise = order_noise(flux[None, :])[0]
+
+        factors = doppler_factors(v_bary, v_star=v_star, v_ism=v_ism, frames=self.frames)
+        regridded = doppler_regrid(wave, flux, self.grid, factors)
+        for frame, row in zip(self.frames, regridded):
+            self.coadds[frame].add(row, noise)
+        self.targets.append(target)
+
+    def result(self, frame):
+        """The superspectrum in one frame.
+
+        Args:
+            frame (str): One of self.frames
+
+        Returns:
+            tuple: (wave, flux, error) of the superspectrum; NaN where no spectrum covers the grid
+
+        """
+        coadd = self.coadds[frame]
+        return self.grid, coadd.mean, coadd.error
+
+
+def build_superspectra(targets, grid, v_star=None, v_ism=None, frames=FRAMES, degree=2,
+                       oracle=None, MergedOnly=False, OrdersOnly=True, max_workers=8):
+    """Build superspectra of all observations of the targets that cover the grid.
+
+    The observations are selected from the obslog with one vectorized filter and
+    read concurrently; every spectrum contributes to all frames.
+
+    Args:
+        targets (list): Object names as in the obslog, e.g. ['HD 170740', 'HD 147889']
+        grid (1darray): Wavelength grid shared by all frames, in AA
+        v_star (dict): Object name as in the obslog -> stellar radial velocity in km/s;
+            if given, it must hold every target. Default: 0 for all targets
+        v_ism (dict): Object name as in the obslog -> interstellar radial velocity in km/s;
+            if given, it must hold every target. Default: 0 for all targets
+        frames (tuple): Frames to build, from 'geocentric', 'barycentric', 'stellar', 'ism'
+        degree (int): Degree of the polynomial each spectrum is divided by, None: no normalization
+        oracle (EdiblesOracle): Oracle holding the obslog, default: the shared oracle
+        MergedOnly (bool): Only use merged spectra
+        OrdersOnly (bool): Only use single orders
+        max_workers (int): Number of threads reading FITS files
+
+    Returns:
+        SuperSpectrum: The accumulated superspectra, see SuperSpectrum.result
+
+    """
+    if oracle is None:
+        from edibles.utils.edibles_oracle import EdiblesOracle
+        oracle = EdiblesOracle.shared()
+    v_star = {} if v_star is None else dict(v_star)
+    v_ism = {} if v_ism is None else dict(v_ism)
+
+    grid = np.asarray(grid, dtype=float)
+    targets = list(targets)
+    for name, given in (("v_star", v_star), ("v_ism", v_ism)):
+        missing = [target for target in targets if given and target not in given]
+        if missing:
+            raise ValueError("No %s for: %s" % (name, ", ".join(missing)))
+    velocities = [abs(v) for v in list(v_star.values()) + list(v_ism.values())]
+    c = cst.c.to("km/s").value
+    margin = grid[-1] * (max(velocities, default=0.0) + 35.0) / c
+
+    # An observation contributes if it overlaps the grid in any of the frames.
+    obslog = oracle.obslog
+    selection = (obslog.Object.isin(targets)
+                 & (obslog.WaveMin < grid[-1] + margin) & (obslog.WaveMax > grid[0] - margin))
+    if MergedOnly:
+        selection &= obslog.Order == "ALL"
+    elif OrdersOnly:
+        selection &= obslog.Order != "ALL"
+    meta = obslog[selection]
+    # The velocities are looked up by the obslog name, not the FITS OBJECT ('HD170740').
+    objects = dict(zip(meta.Filename, meta.Object.astype(str)))
+
+    superspectrum = SuperSpectrum(grid, frames=frames, degree=degree)
+    for filename, sp in iter_spectra(meta.Filename, compact=True, max_workers=max_workers):
+        wave, flux = sp.getSpectrum(grid[0] - margin, grid[-1] + margin)
+        if len(wave) < 10:
+            continue
+        target = objects[filename]
+        superspectrum.add(wave, flux, sp.v_bary, v_star=v_star.get(target, 0.0),
+                          v_ism=v_ism.get(target, 0.0), target=target)
+    return superspectrum
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    targets = ["HD 147889", "HD 170740", "HD 185418", "HD 149757"]
+    v_ism = {"HD 147889": -8.896, "HD 170740": -10.712, "HD 185418": -11.619, "HD 149757": -14.851}
+    v_star = {"HD 147889": -19.98, "HD 170740": -20.79, "HD 185418": -10.82, "HD 149757": 72.33}
+
+    grid = np.arange(3070, 3090, 0.02)
+    superspectrum = build_superspectra(targets, grid, v_star=v_star, v_ism=v_ism)
+    for offset, frame in enumerate(superspectrum.frames):
+        wave, flux, error = superspectrum.result(frame)
+        plt.plot(wave, flux + 0.05 * offset, label=frame)
+    plt.legend()
+    plt.show()
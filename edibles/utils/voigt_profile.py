@@ -675,7 +675,7 @@ if __name__ == "__main__":
         v_rad = 18.9
         v_resolution = 5.75
 
-        pythia = EdiblesOracle()
+        pythia = EdiblesOracle.shared()
         List = pythia.getFilteredObsList(
             object=["HD 145502"], MergedOnly=True, Wave=3302.0
         )
@@ -721,7 +721,7 @@ if __name__ == "__main__":
         v_rad = [1.0, 8.0, 22.0]
         v_resolution = 5.75
 
-        pythia = EdiblesOracle()
+        pythia = EdiblesOracle.shared()
         List = pythia.getFilteredObsList(object=["HD 183143"], MergedOnly=True, Wave=3302.0)
         test = List.values.tolist()
         filename = test[0]
@@ -0,0 +1,94 @@
+"""Extract the same spectral window from many observations at once.
+
+Most DIB and interstellar-line analyses start from the same matrix: every
+observation of a set of targets that covers a line, cut to a window around the
+line and put on a common velocity grid. extract_windows builds that matrix in
+one pass: the observations are selected from the obslog with one vectorized
+filter, read concurrently, and each is interpolated exactly once onto the
+shared grid.
+"""
+
+import numpy as np
+import astropy.constants as cst
+
+from edibles.utils.rebin_spectrum import rebin_spectrum
+from edibles.utils.spectrum_loader import iter_spectra
+
+
+def extract_windows(targets, rest_wave, v_halfwidth, frame="barycentric", dv=1.0,
+                    oracle=None, MergedOnly=True, OrdersOnly=False, rebin=False,
+                    max_workers=8):
+    """Stack all observations of the targets around a line on a shared velocity grid.
+
+    Args:
+        targets (list): Object names as in the obslog, e.g. ['HD 170740', 'HD 147889']
+        rest_wave (float): Rest wavelength of the line, in AA
+        v_halfwidth (float): Half-width of the window, in km/s
+        frame (str): Frame of the velocity grid, 'geocentric' or 'barycentric'
+        dv (float): Step of the velocity grid, in km/s
+        oracle (EdiblesOracle): Oracle holding the obslog, default: the shared oracle
+        MergedOnly (bool): Only use merged spectra
+        OrdersOnly (bool): Only use single orders
+        rebin (bool): If true, use flux-conserving rebinning instead of linear interpolation
+        max_workers (int): Number of threads reading FITS files
+
+    Returns:
+        tuple: tuple containing:
+
+            1darray: The velocity grid, in km/s
+
+            2darray: Flux, shape (n_observations, n_pixels); NaN where an observation
+            does not cover the grid
+
+            pandas.DataFrame: One row of obslog metadata per observation, plus VBary
+
+    """
+    if oracle is None:
+        from edibles.utils.edibles_oracle import EdiblesOracle
+        oracle = EdiblesOracle.shared()
+
+    assert frame in ("geocentric", "barycentric"), "frame must be geocentric or barycentric"
+
+    c = cst.c.to("km/s").value
+    velocity = np.arange(-v_halfwidth, v_halfwidth + 0.5 * dv, dv)
+    wave_grid = rest_wave * (1.0 + velocity / c)
+
+    # The window may shift by the barycentric correction (< 30 km/s) between frames.
+    margin = rest_wave * 35.0 / c
+    xmin, xmax = wave_grid[0] - margin, wave_grid[-1] + margin
+
+    obslog = oracle.obslog
+    selection = (obslog.Object.isin(list(targets))
+                 & (obslog.WaveMin < xmin) & (obslog.WaveMax > xmax))
+    if MergedOnly:
+        selection &= obslog.Order == "ALL"
+    elif OrdersOnly:
+        selection &= obslog.Order != "ALL"
+    meta = obslog[selection].reset_index(drop=True)
+
+    flux = np.full((len(meta), len(velocity)), np.nan)
+    v_bary = np.zeros(len(meta))
+    for i, (_, sp) in enumerate(iter_spectra(meta.Filename, compact=True,
+                                             max_workers=max_workers)):
+        wave, window_flux = sp.getSpectrum(xmin, xmax)
+        if frame == "barycentric":
+            wave = wave + (sp.v_bary / c) * wave
+        v_bary[i] = sp.v_bary
+        if rebin:
+            flux[i] = rebin_spectrum(wave, window_flux, wave_grid)
+        else:
+            flux[i] = np.interp(wave_grid, wave, window_flux, left=np.nan, right=np.nan)
+
+    meta["VBary"] = v_bary
+    return velocity, flux, meta
+
+
+if __name__ == "__main__":
+    import matplotlib.pyplot as plt
+
+    velocity, flux, meta = extract_windows(["HD 170740", "HD 147889"], 6613.62, 200.0)
+    for row, (obj, date) in zip(flux, zip(meta.Object, meta.DateObs)):
+        plt.plot(velocity, row / np.nanmedian(row), label=obj + " " + date[:10])
+    plt.xlabel("Velocity (km/s)")
+    plt.legend()
+    plt.show()
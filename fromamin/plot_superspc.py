@@ -1,7 +1,7 @@
 import numpy as np
 from astropy.io import fits
 from scipy import interpolate
-from continuum_sigma import continuum_sigma
+from edibles.utils.continuum_sigma import continuum_sigma
 import matplotlib.pylab as plt
 
 #loc_dr4 = '/Users/amin/DR4/'
@@ -35,17 +35,16 @@ def average_spec(wave, flux):
     # interpolate all spectra into a portion of grid
     wave_gridded = []
     flux_gridded = []
-    sigma_grid = []
     for lop in range(len(wave)):
         tmp_wvl = wave[lop]
         tmp_flx = flux[lop]
         f = interpolate.interp1d(wave[lop], np.array(flux[lop]), kind='cubic') #
         flux_temp = f(grid)
-
-        # print lop
-        sigma = continuum_sigma(grid, flux_temp, plot=None)
         flux_gridded.append(flux_temp)
-        sigma_grid.append(1.0/sigma)  # (np.std(flux_temp))  sigma**2
+
+    # noise of all gridded spectra in one call
+    sigma = continuum_sigma(grid, np.array(flux_gridded))
+    sigma_grid = 1.0/sigma  # (np.std(flux_temp))  sigma**2
 
 
     wave_av = grid.copy()
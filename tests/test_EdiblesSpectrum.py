@@ -1,7 +1,7 @@
 import astropy
 import datetime
 import numpy as np
-from edibles.utils.edibles_spectrum import EdiblesSpectrum
+from edibles.utils.edibles_spectrum import EdiblesSpectrum, CompactSpectrum, global_grid, measure_snr
 
 
 def testEdiblesSpectrum(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
@@ -99,6 +99,61 @@ def testEdiblesSpectrum(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
     assert np.max(sp.sky_wave) < sp.xmax
 
 
+def testCompactSpectrum(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
+
+    sp = EdiblesSpectrum(filename=filename, noDATADIR=True)
+    assert sp.raw_grid is global_grid()
+    assert not sp.raw_grid.flags.writeable
+
+    compact = CompactSpectrum.from_file(filename, noDATADIR=True)
+    assert not hasattr(compact, "__dict__")
+    assert compact.target == sp.target
+    assert compact.datetime == sp.datetime
+    assert np.allclose(compact.wave, sp.raw_wave)
+    assert np.allclose(compact.bary_wave, sp.raw_bary_wave)
+
+    # from_arrays and compact() must not copy the data
+    shared = CompactSpectrum.from_arrays(sp.raw_wave, sp.raw_flux, v_bary=sp.v_bary)
+    assert np.shares_memory(shared.flux, sp.raw_flux)
+    assert np.shares_memory(sp.compact().wave, sp.raw_wave)
+
+    wave, flux = compact.getSpectrum(7660, 7680)
+    assert np.shares_memory(flux, compact.flux)
+    assert np.min(wave) > 7660
+    assert np.max(wave) < 7680
+
+    sp.getSpectrum(xmin=7660, xmax=7680)
+    grid, interp_bary_flux = compact.interpolate(7660, 7680, frame="barycentric")
+    assert np.array_equal(grid, sp.grid)
+    assert np.allclose(interp_bary_flux, sp.interp_bary_flux)
+
+
+def testMeasureSNR(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
+
+    sp = EdiblesSpectrum(filename=filename, noDATADIR=True)
+    wave, flux = sp.raw_wave, sp.raw_flux.astype(float)
+
+    # blocks agree with a straightforward loop over the blocks
+    SNR, LAM = measure_snr(wave, flux, block_size=1.0)
+    block = np.floor((wave - wave[0]) / 1.0)
+    for snr, lam in zip(SNR[:5], LAM[:5]):
+        flux_block = flux[block == np.floor(lam - wave[0])]
+        assert np.isclose(snr, np.mean(flux_block) / np.std(flux_block))
+
+    # a stack is handled in one call, row by row
+    stack = np.vstack([flux, 2 * flux])
+    SNR_stack, _ = measure_snr(wave, stack, block_size=1.0)
+    assert SNR_stack.shape == (2, len(np.unique(block)))
+    assert np.allclose(SNR_stack[1][np.isfinite(SNR_stack[1])], SNR)
+
+    # the robust estimate is not lowered by the lines and slopes within a block
+    DER, _ = measure_snr(wave, flux, block_size=1.0, method="der_snr")
+    assert len(DER) == len(SNR) and np.median(DER) > np.median(SNR)
+
+    # the result is cached per observation
+    assert sp.measureSNR(block_size=1.0) is sp.measureSNR(block_size=1.0)
+
+
 if __name__ == "__main__":
 
     filename = "HD170740_w860_redl_20140915_O12.fits"
@@ -0,0 +1,49 @@
+import numpy as np
+
+from edibles.utils.coadd import linear_snr, coadd, StreamingCoadd
+from edibles.utils.simulations.SRC.Functions import weighted_average
+
+
+def testCoadd():
+
+    rng = np.random.default_rng(1)
+    wave = np.linspace(6610, 6618, 300)
+    noise = rng.uniform(0.005, 0.03, 12)
+    stack = 1 + rng.normal(0, 1, (12, len(wave))) * noise[:, None]
+    error = np.broadcast_to(noise[:, None], stack.shape)
+
+    # closed-form S/N agrees with a straight polyfit per row
+    snr, fit = linear_snr(wave, stack)
+    for row, s in zip(stack, snr):
+        line = np.polyval(np.polyfit(wave, row, 1), wave)
+        assert np.isclose(s, np.mean(row) / np.sqrt(np.mean((row - line) ** 2)))
+    assert fit.shape == stack.shape
+
+    # the vectorized coadd matches the per-pixel weighted average
+    mean, mean_error, used = coadd(stack, error)
+    for i in (0, 150, 299):
+        avg, avg_err = weighted_average(stack[:, i], error[:, i])
+        assert np.isclose(mean[i], avg) and np.isclose(mean_error[i], avg_err)
+    assert used.all()
+
+    # missing data and outliers
+    stack[3, :50] = np.nan
+    stack[5, 100] = 10.0
+    clipped, _, used = coadd(stack, noise, sigma=5.0)
+    assert not used[5, 100] and not used[3, :50].any()
+    assert abs(clipped[100] - 1) < 0.05
+
+    # with a single clipping iteration the mean still belongs to the returned mask
+    clipped, clipped_error, used = coadd(stack, noise, sigma=5.0, maxiters=1)
+    assert not used[5, 100]
+    expected, expected_error, _ = coadd(np.where(used, stack, np.nan), noise)
+    assert np.allclose(clipped, expected, equal_nan=True)
+    assert np.allclose(clipped_error, expected_error, equal_nan=True)
+
+    # streaming accumulation gives the same result as the stack
+    stream = StreamingCoadd(len(wave))
+    for row, n in zip(stack, noise):
+        stream.add(row, n)
+    mean, mean_error, _ = coadd(stack, noise)
+    assert stream.n_spectra == 12
+    assert np.allclose(stream.mean, mean) and np.allclose(stream.error, mean_error)
@@ -0,0 +1,41 @@
+import numpy as np
+from scipy.spatial import ConvexHull
+
+from edibles.utils.continuum_guess import envelope_continuum, polynomial_continuum, upper_hull
+
+
+def testUpperHull():
+
+    rng = np.random.default_rng(0)
+    x = np.sort(rng.uniform(0, 10, 500))
+    y = rng.normal(size=500)
+    hull = upper_hull(x, y)
+    assert hull[0] == 0 and hull[-1] == len(x) - 1
+    assert set(hull) <= set(ConvexHull(np.column_stack([x, y])).vertices)
+    # no point lies above the hull
+    assert np.all(y <= np.interp(x, x[hull], y[hull]) + 1e-12)
+
+
+def testEnvelopeAndPolynomialContinuum():
+
+    rng = np.random.default_rng(1)
+    x = np.linspace(6600, 6630, 5000)
+    t = (x - 6615) / 15
+    truth = 1000 * (1 + 0.2 * t - 0.3 * t ** 2)
+    line = 1 - 0.4 * np.exp(-0.5 * ((x - 6612) / 0.3) ** 2)
+    flux = truth * line + rng.normal(0, 5, len(x))
+    flux[[100, 2500, 4000]] += 300  # cosmic rays
+
+    continuum = envelope_continuum(x, flux)
+    assert np.median(np.abs(continuum / truth - 1)) < 0.005
+
+    continuum, mask = polynomial_continuum(x, flux, degree=2, lower=2.0, upper=3.0)
+    assert np.max(np.abs(continuum / truth - 1)) < 0.005
+    assert not mask[np.argmin(line)] and not mask[2500]
+
+    # a stack is fit row by row in one call
+    stack = np.vstack([flux, 2 * flux, flux[::-1]])
+    continua, masks = polynomial_continuum(x, stack, degree=2, lower=2.0, upper=3.0)
+    assert np.allclose(continua[1], 2 * continua[0])
+    assert np.allclose(continua[2], polynomial_continuum(x, flux[::-1], degree=2, lower=2.0,
+                                                          upper=3.0)[0])
@@ -0,0 +1,45 @@
+import os
+import shutil
+
+import pandas as pd
+
+from edibles import PYTHONDIR
+from edibles.continuum import read_saves
+from edibles.utils.continuum_pipeline import run_pipeline, read_checkpoint
+
+
+def testContinuumPipeline(tmp_path):
+
+    obslog = pd.read_csv(PYTHONDIR + "/data/DR4_ObsLog.csv")
+    names = ["HD170740_w860_redl_20140915_O12.fits", "HD148937_w346_blue_20150817_O11.fits"]
+    obslog = obslog[obslog.Filename.str.endswith(tuple(names))]
+    assert len(obslog) == 2
+
+    datadir = str(tmp_path / "DR4" / "data")
+    for filename in obslog.Filename:
+        os.makedirs(os.path.dirname(datadir + filename))
+        shutil.copy(PYTHONDIR + "/../tests/" + os.path.basename(filename), datadir + filename)
+    missing = obslog.iloc[:1].assign(Filename="/HD0/RED_860/HD0_w860_redl_20140915_O12.fits")
+
+    status = run_pipeline(pd.concat([obslog, missing]), user="Test", max_workers=2,
+                          datadir=datadir, verbose=0)
+    assert status.Status.tolist() == ["done", "done", "failed"]
+    outdir = str(tmp_path / "DR4" / "continuum")
+    for filename in obslog.Filename:
+        with open(outdir + filename.replace(".fits", ".csv")) as f:
+            lines = f.read().splitlines()
+        assert lines[:3] == ["######", "# method=clipped_spline", "# n_anchors=4"]
+        assert len(lines[6].split(",")) == 4
+    assert read_checkpoint(outdir + "/continuum_pipeline_done.txt") == set(obslog.Filename)
+
+    # a re-run skips the finished files and retries the failed one
+    status = run_pipeline(pd.concat([obslog, missing]), max_workers=1, datadir=datadir, verbose=0)
+    assert status.Status.tolist() == ["skipped", "skipped", "failed"]
+
+    # a crash between the saves and the checkpoint does not duplicate the saves
+    os.remove(outdir + "/continuum_pipeline_done.txt")
+    status = run_pipeline(obslog, user="Test", max_workers=1, datadir=datadir, verbose=0)
+    assert status.Status.tolist() == ["done", "done"]
+    for filename in obslog.Filename:
+        assert len(read_saves(outdir + filename.replace(".fits", ".csv"))) == 1
+    assert read_checkpoint(outdir + "/continuum_pipeline_done.txt") == set(obslog.Filename)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from edibles.utils.continuum_sigma import continuum_level, continuum_sigma, rolling_continuum
+
+
+def testContinuumLevel():
+
+    rng = np.random.default_rng(2)
+    wave = np.arange(3300, 3310, 0.02)
+    line = 1 - 0.2 * np.exp(-0.5 * ((wave - 3302.4) / 0.05) ** 2)
+    stack = line + rng.normal(0, 0.01, (100, len(wave)))
+
+    level, sigma = continuum_level(stack)
+    assert level.shape == sigma.shape == (100,)
+    assert abs(np.median(level) - 1) < 0.002
+    assert abs(np.median(sigma) - 0.01) < 0.001
+
+    # a stack gives the same as one spectrum at a time
+    single = np.array([continuum_level(flux) for flux in stack[:5]])
+    assert np.allclose(single, np.column_stack([level[:5], sigma[:5]]))
+    noise = continuum_sigma(wave, stack[:5])
+    assert np.allclose(noise, [continuum_sigma(wave, flux) for flux in stack[:5]])
+    assert np.all(noise > 0) and np.all(noise < 0.01)
+
+    level, sigma, snr = rolling_continuum(wave, stack[0] * 50, window=101, refine=True)
+    assert level.shape == sigma.shape == snr.shape == wave.shape
+    assert abs(np.median(level) - 50) < 0.2
+    assert abs(np.median(snr) - 100) < 15
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+from edibles.continuum import Continuum, format_save, read_saves
+from edibles.utils.continuum_store import ContinuumStore
+from edibles.utils.edibles_spectrum import EdiblesSpectrum
+
+
+def testContinuumStore(tmp_path):
+
+    filename = "/HD170740/RED_860/HD170740_w860_redl_20140915_O12.fits"
+    csv_file = tmp_path / "continuum.csv"
+    with open(csv_file, "w") as f:
+        f.write(format_save("spline", 3, [1.0, 2.0, 3.0], [0.9, 1.0, 1.1], "A", "first",
+                            datetime(2020, 10, 6, 10, 56, 2, 192865)))
+        f.write(format_save("spline", 4, [1.0, 2.0, 3.0, 4.0], [1, 1, 1, 1], "B", "second",
+                            datetime(2021, 1, 1, 12, 0, 0, 1)))
+    saves = read_saves(csv_file)
+    assert [save["n_anchors"] for save in saves] == [3, 4]
+
+    # the importer keeps the save order and skips saves it already has
+    store = ContinuumStore(str(tmp_path / "continua.sqlite"))
+    assert store.import_csv(csv_file, filename=filename) == 2
+    assert store.import_csv(csv_file, filename=filename) == 0
+    assert store.count(filename) == 2
+    first = store.get(filename, 0)
+    assert np.array_equal(first["x"], saves[0]["x"]) and np.array_equal(first["y"], saves[0]["y"])
+    assert first["user"] == "A" and first["datetime"] == saves[0]["datetime"]
+    assert store.get(filename)["comments"] == "second"
+    assert store.get(filename, 5) is None
+    assert set(store.latest([filename, "/not/saved.fits"])) == {filename}
+
+    # concurrent appends get distinct save numbers
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        numbers = list(pool.map(lambda i: ContinuumStore(store.db_file).add(
+            filename, [1.0, 2.0], [float(i), 1.0], user="C"), range(8)))
+    assert sorted(numbers) == list(range(2, 10))
+
+    # Continuum reads and writes its saves through the store
+    sp = EdiblesSpectrum("tests/HD170740_w860_redl_20140915_O12.fits", noDATADIR=True)
+    sp.getSpectrum(xmin=7661, xmax=7670)
+    cont = Continuum(sp, method="spline", n_anchors=4, store=store)
+    assert cont.num_saved_continua == 0
+    assert cont.add_to_store(user="D", comments="test") == 0
+    out = cont.prebuilt_model(chosen_save_num=0)
+    assert np.allclose(out, cont.result.best_fit)
@@ -0,0 +1,54 @@
+import os
+import shutil
+
+import pandas as pd
+
+from edibles import PYTHONDIR
+from edibles.data import edibles_create_obslist
+from edibles.data.edibles_create_obslist import createObsList
+from edibles.utils.edibles_oracle import EdiblesOracle
+
+
+def testCreateObsList(tmp_path, monkeypatch):
+
+    datadir = tmp_path / "DR4" / "data"
+    for folder, file in [("HD170740/RED_860", "HD170740_w860_redl_20140915_O12.fits"),
+                         ("HD148937/BLUE_346", "HD148937_w346_blue_20150817_O11.fits")]:
+        os.makedirs(datadir / folder)
+        shutil.copy(PYTHONDIR + "/../tests/" + file, datadir / folder / file)
+    outfile = str(tmp_path / "ObsLog.csv")
+
+    obslog = createObsList(dryrun=False, max_workers=1, datadir=str(datadir), outfile=outfile)
+    assert obslog.Filename.tolist() == ["/HD148937/BLUE_346/HD148937_w346_blue_20150817_O11.fits",
+                                        "/HD170740/RED_860/HD170740_w860_redl_20140915_O12.fits"]
+    assert obslog.Object.tolist() == ["HD 148937", "HD 170740"]
+    assert obslog.Setting.tolist() == [346, 860]
+    assert obslog.Order.tolist() == ["11", "12"]
+    assert obslog.NAXIS1.iloc[1] == 6173
+    assert abs(obslog.VBary.iloc[1] + 28.273558) < 1e-6
+    assert pd.read_csv(outfile).shape == obslog.shape
+
+    # a second run only reads the header of the file that changed
+    read = []
+    readHeader = edibles_create_obslist.readHeader
+
+    def recordingReadHeader(relative_filename, datadir):
+        read.append(relative_filename)
+        return readHeader(relative_filename, datadir=datadir)
+
+    monkeypatch.setattr(edibles_create_obslist, "readHeader", recordingReadHeader)
+    changed = datadir / obslog.Filename.iloc[1][1:]
+    os.utime(changed, ns=(os.stat(changed).st_atime_ns, os.stat(changed).st_mtime_ns + 10**9))
+    again = createObsList(dryrun=False, max_workers=1, datadir=str(datadir), outfile=outfile)
+    assert read == [obslog.Filename.iloc[1]]
+    assert again.drop(columns="FileMTime").equals(obslog.drop(columns="FileMTime"))
+
+
+def testObsMetadata():
+
+    pythia = EdiblesOracle.shared()
+    filename = pythia.obslog.Filename.iloc[0]
+    metadata = pythia.getObsMetadata(filename)
+    assert metadata["Filename"] == filename
+    assert metadata["Object"] == pythia.obslog.Object.iloc[0]
+    assert pythia.getObsMetadata("/no/such/file.fits") is None
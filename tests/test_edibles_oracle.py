@@ -0,0 +1,89 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+from edibles import PYTHONDIR
+from edibles.utils import edibles_oracle
+from edibles.utils.edibles_oracle import EdiblesOracle, _load_logs
+
+
+def testOracleCache(tmp_path, monkeypatch):
+
+    folder = Path(PYTHONDIR + "/data")
+    cache_file = str(tmp_path / "oracle_tables.pkl")
+
+    # the first call writes the cache, the second reads the same tables back
+    tables = _load_logs(folder, cache_file=cache_file)
+    assert os.path.isfile(cache_file)
+    cached = _load_logs(folder, cache_file=cache_file)
+    assert set(cached) == set(tables)
+    assert cached["obslog"].equals(tables["obslog"])
+    assert cached["obslog"].Object.dtype == "category"
+
+    # a corrupted cache file is rebuilt rather than used
+    mtime = os.stat(cache_file).st_mtime_ns
+    with open(cache_file, "wb") as f:
+        f.write(b"not a pickle")
+    assert _load_logs(folder, cache_file=cache_file)["ebvlog"].equals(tables["ebvlog"])
+    assert os.stat(cache_file).st_mtime_ns >= mtime
+
+    # one oracle per process, which answers queries like a fresh one; its cache
+    # goes to CACHEDIR, here a temporary folder
+    monkeypatch.setattr(edibles_oracle, "CACHEDIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(edibles_oracle, "_SHARED", None)
+    assert EdiblesOracle.shared() is EdiblesOracle.shared()
+    assert os.path.isfile(tmp_path / "cache" / "oracle_tables.pkl")
+    files = EdiblesOracle.shared().getObsListByTarget("HD 170740", MergedOnly=True)
+    assert files.tolist() == EdiblesOracle(cache=False).getObsListByTarget(
+        "HD 170740", MergedOnly=True).tolist()
+
+
+def testFilteredObsTable(capsys):
+
+    pythia = EdiblesOracle.shared()
+    queries = [
+        {"object": ["HD 170740"], "Wave": 6614.0, "MergedOnly": True},
+        {"object": ["HD 170740", "HD 147889"], "WaveMin": 3300.0, "WaveMax": 3310.0, "OrdersOnly": True},
+        {"Wave": 5780.0, "MergedOnly": True, "EBV_min": 0.5},
+        {"object": ["HD 170740"], "Wave": 6614.0, "MergedOnly": True},
+    ]
+    table = pythia.getFilteredObsTable(queries)
+    assert capsys.readouterr().out == ""
+
+    # every query returns exactly what the single-query interface returns
+    for i, query in enumerate(queries):
+        expected = pythia.getFilteredObsList(**query)
+        assert table[table["query"] == i].Filename.tolist() == expected.tolist()
+
+    # repeated queries are answered from the memo
+    assert pythia.getFilteredObsTable(queries).equals(table)
+
+    # list and array constraint values work as in the single-query interface
+    ra, dec = pythia.sky_index.position("HD 170740")
+    for near in ([ra, dec], np.array([ra, dec])):
+        query = {"Near": near, "Radius": 10.0, "Wave": 6614.0, "MergedOnly": True}
+        table = pythia.getFilteredObsTable([query])
+        assert table.Filename.tolist() == pythia.getFilteredObsList(**query).tolist()
+        assert len(table) > 0
+
+
+def testSightlineTables():
+
+    pythia = EdiblesOracle.shared()
+    table = pythia.sightline_table
+    assert set(table.object) == set(pythia.object_log.object)
+    assert {"EBV", "SpType", "LogNHI", "LogNHII", "fH2", "RV", "AV"} <= set(table.columns)
+    assert len(pythia.parameter_table) == sum(len(log) for log in (
+        pythia.ebvlog, pythia.sptypelog, pythia.nhilog, pythia.nhiilog,
+        pythia.fh2log, pythia.rvlog, pythia.avlog))
+
+    # one predicate on the tables gives the same objects as FilterEngine per parameter
+    ebv = set(pythia.FilterEngine(None, pythia.ebvlog, None, 0.2, 0.8, 4, verbose=False).object)
+    rv = set(pythia.FilterEngine(None, pythia.rvlog, None, 2.5, None, "All", verbose=False).object)
+    sptype = set(pythia.FilterEngine(None, pythia.sptypelog, None, "B", None, None, verbose=False).object)
+    expected = ebv & rv & sptype & set(pythia.object_log.object)
+    matching = pythia._objectsMatchingParameters({"EBV_min": 0.2, "EBV_max": 0.8, "EBV_reference": 4,
+                                                  "RV_min": 2.5, "RV_reference": "All",
+                                                  "SpType_min": "B"})
+    assert matching == expected and len(matching) > 0
@@ -0,0 +1,30 @@
+import pandas as pd
+
+from edibles import PYTHONDIR
+from edibles.utils.file_search import FilterDR
+
+
+def testFilterDR():
+
+    obslog = pd.read_csv(PYTHONDIR + "/data/DR4_ObsLog.csv")
+
+    # the chain is only recorded; the result is computed once, on request
+    chain = FilterDR().filterStar("HD170740").filterDate("20140916").filterRange([6614.0, 3302.0])
+    assert chain._result is None
+    files = chain.filterOrder(order=[12, 13]).getAllFileNames()
+
+    expected = obslog[(obslog.Object == "HD 170740")
+                      & obslog.DateObs.str.startswith("2014-09-16")
+                      & (((obslog.WaveMin < 6614) & (obslog.WaveMax > 6614))
+                         | ((obslog.WaveMin < 3302) & (obslog.WaveMax > 3302)))
+                      & obslog.Order.isin(["12", "13"])]
+    assert files == expected.Filename.tolist() and len(files) > 0
+    assert chain.getOrders() == sorted(set(expected.Order.astype(int)))
+
+    # merged spectra, sorting and copies
+    merged = FilterDR().filterAll(star="HD170740", wavelength=6614.0, combined=True)
+    assert (merged.getDataFrame().Order == -1).all()
+    dates = FilterDR().filterStar("HD170740").filterOrder().sortDate().getDataFrame().DateObs
+    assert dates.is_monotonic_increasing
+    base = FilterDR().filterStar("HD170740")
+    assert len(base.getCopy().filterDate("20140916").df) < len(base.df)
@@ -0,0 +1,31 @@
+import numpy as np
+
+from edibles.utils.local_continuum_spline import local_continuum, local_continuum_batch
+
+
+def testLocalContinuumBatch():
+
+    rng = np.random.default_rng(0)
+    wave = np.linspace(6600, 6630, 3000)
+    flux = 1000 + 5 * (wave - 6600) + 0.2 * (wave - 6615) ** 2 + rng.normal(0, 3, (4, len(wave)))
+
+    def reference(flux, positions, windows, order):
+        selected = np.zeros(len(wave), dtype=bool)
+        for anchor, window in zip(positions, np.broadcast_to(windows, len(positions))):
+            selected |= (wave > anchor - window / 2.0) & (wave < anchor + window / 2.0)
+        return np.poly1d(np.polyfit(wave[selected], flux[selected], order))(wave)
+
+    # one spectrum, as before
+    normalised, continuum = local_continuum((wave, flux[0]), positions=[6602, 6610, 6625],
+                                            windows=[1.0], spline_order=2)
+    assert np.allclose(continuum, reference(flux[0], [6602, 6610, 6625], 1.0, 2))
+    assert np.allclose(normalised, flux[0] / continuum)
+
+    # several anchor sets and spectra in one call
+    positions = [[6602, 6610, 6625], [6605, 6615]]
+    windows = [[1.0, 1.0, 2.0], 0.5]
+    normalised, continuum = local_continuum_batch(wave, flux, positions, windows=windows)
+    assert continuum.shape == (2, 4, len(wave))
+    for s in range(2):
+        for k in range(4):
+            assert np.allclose(continuum[s, k], reference(flux[k], positions[s], windows[s], 1))
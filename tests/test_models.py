@@ -1,7 +1,10 @@
+import numpy as np
 import pytest
+from scipy.interpolate import CubicSpline
 
 from edibles.utils.edibles_spectrum import EdiblesSpectrum
-from edibles.models import ContinuumModel, VoigtModel
+from edibles.continuum import Continuum
+from edibles.models import ContinuumModel, VoigtModel, spline_basis
 
 
 def testModels(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
@@ -41,6 +44,67 @@ def testModels(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
     assert len(out) == len(sp.flux)
 
 
+def testContinuumLinearFit(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
+
+    sp = EdiblesSpectrum(filename, noDATADIR=True)
+    sp.getSpectrum(xmin=7661, xmax=7670)
+
+    # the basis reproduces the cubic spline through the anchors
+    x_anchors = np.array([7661.0, 7663.5, 7667.0, 7670.0])
+    y_anchors = np.array([1.0, 1.2, 0.9, 1.1])
+    assert np.allclose(spline_basis(sp.wave, x_anchors) @ y_anchors,
+                       CubicSpline(x_anchors, y_anchors)(sp.wave))
+
+    # the linear solution matches the nonlinear fit of the y anchors
+    cont_model = ContinuumModel(n_anchors=4)
+    cont_pars = cont_model.guess(sp.flux, x=sp.wave)
+    result = cont_model.fit(data=sp.flux, params=cont_pars, x=sp.wave)
+    linear = cont_model.linear_fit(sp.flux, x=sp.wave, params=cont_pars)
+    for name in cont_model.ynames:
+        assert np.isclose(linear.params[name].value, result.params[name].value, rtol=1e-6)
+        assert np.isclose(linear.params[name].stderr, result.params[name].stderr, rtol=1e-4)
+    assert np.allclose(linear.best_fit, result.best_fit, rtol=1e-6)
+    # the statistics are those of the fit with n_anchors free parameters
+    assert linear.nvarys == result.nvarys == cont_model.n_anchors and linear.nfree == result.nfree
+    for stat in ("chisqr", "redchi", "aic", "bic"):
+        assert np.isclose(getattr(linear, stat), getattr(result, stat), rtol=1e-5)
+    assert np.allclose(linear.covar, result.covar, rtol=1e-3)
+    assert all(linear.params[name].vary for name in cont_model.ynames)
+    assert len(cont_model._basis_cache) == 1
+
+
+def testContinuumClippedFit(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
+
+    sp = EdiblesSpectrum(filename, noDATADIR=True)
+    sp.getSpectrum(xmin=7661, xmax=7670)
+    cont_model = ContinuumModel(n_anchors=4)
+    cont_pars = cont_model.guess(sp.flux, x=sp.wave)
+
+    # one iteration: fit, reject points one sigma below the fit, refit
+    first = cont_model.linear_fit(sp.flux, x=sp.wave, params=cont_pars)
+    keep = sp.flux >= first.best_fit - np.std(sp.flux - first.best_fit)
+    second = cont_model.linear_fit(sp.flux[keep], x=sp.wave[keep], params=cont_pars)
+    result, mask, n_iterations, converged = cont_model.clipped_fit(
+        sp.flux, x=sp.wave, params=cont_pars, lower=1.0, maxiters=1)
+    assert np.array_equal(mask, keep) and n_iterations == 1
+    assert len(result.best_fit) == len(sp.wave)
+    assert np.allclose(result.best_fit[keep], second.best_fit)
+    for name in cont_model.ynames:
+        assert np.isclose(result.params[name].stderr, second.params[name].stderr)
+
+    # iterating until the mask converges rejects mostly the absorption lines below the fit
+    result, mask, n_iterations, converged = cont_model.clipped_fit(
+        sp.flux, x=sp.wave, params=cont_pars, lower=2.0, upper=3.0, maxiters=50)
+    assert converged and 1 < n_iterations < 50
+    assert 0 < 1 - mask.mean() < 0.5
+    below = sp.flux < result.eval(x=sp.wave)
+    assert np.mean(below[~mask]) > 0.9
+
+    cont = Continuum(sp, method="clipped_spline", n_anchors=4, lower=1.0, maxiters=1,
+                     plot=False, verbose=0)
+    assert cont.continuum.shape == cont.result.best_fit.shape == sp.wave.shape
+
+
 if __name__ == "__main__":
 
     filename = "HD170740_w860_redl_20140915_O12.fits"
@@ -0,0 +1,45 @@
+from edibles.utils.edibles_oracle import EdiblesOracle
+from edibles.utils.file_search import FilterDR
+from edibles.utils.obslog_db import ObsLogDB
+
+
+def testObsLogDB(tmp_path):
+
+    db_file = str(tmp_path / "obslog.sqlite")
+    db = ObsLogDB(db_file)
+    assert db.is_current()
+
+    pandas_oracle = EdiblesOracle.shared()
+    sql_oracle = EdiblesOracle(backend="sqlite", db_file=db_file)
+    assert "obslog" not in sql_oracle.__dict__
+
+    # obslog queries and parameter constraints give the same answers as the in-memory tables
+    for query in ({"object": ["HD 170740"], "Wave": 6614.0, "MergedOnly": True},
+                  {"WaveMin": 3300.0, "WaveMax": 3305.0, "OrdersOnly": True},
+                  {"object": ["HD 147889", "HD 183143"], "EBV_min": 0.5, "SpType_reference": "All"},
+                  {"Wave": 5780.0, "EBV_min": 0.2, "EBV_max": 0.8, "EBV_reference": 4}):
+        expected = pandas_oracle.getFilteredObsList(**query)
+        result = sql_oracle.getFilteredObsList(**query)
+        assert result.tolist() == expected.tolist()
+        assert result.index.tolist() == expected.index.tolist()
+
+    # tables are read from the store on first access
+    assert sql_oracle.obslog.Filename.tolist() == pandas_oracle.obslog.Filename.tolist()
+    assert sql_oracle.ebvlog.value.tolist() == pandas_oracle.ebvlog.value.tolist()
+
+    # FilterDR compiles its filters to SQL
+    expected = FilterDR().filterStar("HD170740").filterRange([6614.0, 5780.0]).filterOrder()
+    result = FilterDR(db=db).filterStar("HD170740").filterRange([6614.0, 5780.0]).filterOrder()
+    assert result.getDataFrame().equals(expected.getDataFrame())
+    assert FilterDR(db=db).filterStar("HD170740").filterDate("20140916").getDates() == ["20140916"]
+
+    db.close()
+    assert len(db.select_files(objects="HD 170740")) > 0
+    db.close()
+
+    # the store file is closed after a build, and its path may contain URI characters
+    odd_file = str(tmp_path / "obs?log#1.sqlite")
+    odd = ObsLogDB(odd_file)
+    assert odd.is_current()
+    assert odd.select_files(objects="HD 170740").tolist() == db.select_files(objects="HD 170740").tolist()
+    odd.close()
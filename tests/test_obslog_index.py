@@ -0,0 +1,84 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from edibles import PYTHONDIR
+from edibles.utils.edibles_oracle import EdiblesOracle
+from edibles.utils.obslog_index import ObsLogIndex, SkyIndex, read_simbad_positions, unit_vectors
+
+
+def testObsLogIndex():
+
+    obslog = pd.read_csv(PYTHONDIR + "/data/DR4_ObsLog.csv")
+    index = ObsLogIndex(obslog)
+    wave_min, wave_max = obslog.WaveMin.to_numpy(), obslog.WaveMax.to_numpy()
+    merged = (obslog.Order == "ALL").to_numpy()
+
+    # coverage and overlap queries agree with a full scan
+    for wave in (3050.0, 3302.4, 5780.5, 6613.6, 8620.0, 10400.0):
+        assert np.array_equal(index.covering(wave),
+                              np.flatnonzero((wave_min < wave) & (wave_max > wave)))
+    assert np.array_equal(index.overlapping(5000.0, 5010.0),
+                          np.flatnonzero((wave_max > 5000.0) & (wave_min < 5010.0)))
+    assert np.array_equal(index.overlapping(wave_min=9000.0), np.flatnonzero(wave_max > 9000.0))
+
+    # combined object, wavelength and order selection
+    objects = ["HD 170740", "HD 147889"]
+    expected = obslog.Object.isin(objects).to_numpy() & (wave_min < 6614) & (wave_max > 6614)
+    assert np.array_equal(index.select(objects=objects, wave=6614, MergedOnly=True),
+                          np.flatnonzero(expected & merged))
+    assert np.array_equal(index.select(objects="HD 170740", OrdersOnly=True),
+                          np.flatnonzero((obslog.Object == "HD 170740").to_numpy() & ~merged))
+    assert len(index.select(objects=["not observed"])) == 0
+    assert len(index.select()) == len(obslog)
+
+
+def testSkyIndex():
+
+    rng = np.random.default_rng(1)
+    ra = rng.uniform(0, 360, 500)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, 500)))
+    index = SkyIndex(["star %d" % i for i in range(500)], ra, dec)
+
+    # cone and nearest-neighbour queries agree with a full scan, also across RA = 0
+    for centre in [(0.5, -10.0), (359.5, 30.0), (120.0, 89.0)]:
+        cos_sep = unit_vectors(ra, dec) @ unit_vectors(*centre)[0]
+        separation = np.degrees(np.arccos(np.clip(cos_sep, -1, 1)))
+        rows, found = index.cone(*centre, radius=20.0)
+        assert np.array_equal(np.sort(rows), np.flatnonzero(separation < 20.0))
+        assert np.allclose(found, np.sort(separation[separation < 20.0]))
+        rows, found = index.nearest(*centre, k=5)
+        assert np.array_equal(rows, np.argsort(separation)[:5])
+        assert np.allclose(found, np.sort(separation)[:5])
+
+    # object positions are mean directions, also across RA = 0, or catalogue positions
+    obslog = pd.DataFrame({"Object": ["A", "A", "B", "B", "C"],
+                           "RA": [359.99, 0.01, 10.0, 10.02, 50.0],
+                           "DEC": [20.0, 20.0, -5.0, -5.0, 1.0]})
+    index = SkyIndex.from_obslog(obslog, positions={"C": (51.0, 2.0)})
+    assert np.allclose(index.position("A"), (0.0, 20.0)) or np.allclose(index.position("A"), (360.0, 20.0))
+    assert np.allclose(index.position("B"), (10.01, -5.0))
+    assert index.position("C") == (51.0, 2.0)
+    obslog.loc[3, "RA"] = 12.0
+    with pytest.warns(UserWarning, match="B"):
+        SkyIndex.from_obslog(obslog)
+    # no warning for an object with a catalogue position
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        SkyIndex.from_obslog(obslog, positions={"B": (10.0, -5.0)})
+        EdiblesOracle(cache=False).sky_index
+
+    simbad = read_simbad_positions(PYTHONDIR + "/data/sightline_data/SIMBAD_query_observed_Oct06_2020.ascii")
+    assert np.allclose(simbad["HD 114886"], (198.684928, -63.581058))
+
+    # the oracle combines a cone with the wavelength and parameter filters
+    pythia = EdiblesOracle.shared()
+    near = pythia.getObjectsNear("HD 170740", radius=10.0)
+    assert near.object.iloc[0] == "HD 170740" and near.separation.iloc[0] == 0.0
+    neighbours = pythia.getObjectsNear("HD 170740", k=3)
+    assert neighbours.object.tolist() == near.object.iloc[1:4].tolist()
+    files = pythia.getFilteredObsList(Near="HD 170740", Radius=10.0, Wave=6614.0, MergedOnly=True)
+    expected = pythia.getFilteredObsList(object=near.object.tolist(), Wave=6614.0, MergedOnly=True)
+    assert files.tolist() == expected.tolist()
@@ -0,0 +1,61 @@
+import os
+import numpy as np
+import pandas as pd
+
+from edibles.utils.order_merging import merge_arrays, merge_orders, trimmed_ranges
+
+
+def testMergeArrays():
+
+    rng = np.random.default_rng(42)
+    truth = lambda wave: 1 - 0.3 * np.exp(-0.5 * ((wave - 5005) / 0.5) ** 2)
+
+    wave1 = np.arange(4990, 5010, 0.02)
+    wave2 = np.arange(5000, 5020, 0.02)
+    flux1 = truth(wave1) + rng.normal(0, 0.01, len(wave1))
+    flux2 = truth(wave2) + rng.normal(0, 0.02, len(wave2))
+
+    wave, flux, error = merge_arrays([wave1, wave2], [flux1, flux2])
+    assert wave[0] >= wave1[0] - 0.01
+    assert wave[-1] <= wave2[-1] + 0.01
+    good = np.isfinite(flux)
+    assert np.all(np.abs(flux[good] - truth(wave[good])) < 0.1)
+
+    # the overlap is better determined than either order alone
+    overlap = (wave > 5001) & (wave < 5009)
+    only2 = (wave > 5011) & (wave < 5019)
+    assert np.median(error[overlap]) < np.median(error[only2])
+
+
+def testMergeOrders(tmp_path):
+
+    filename = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "HD170740_w860_redl_20140915_O12.fits")
+    obslog = pd.DataFrame({"Filename": [filename], "Setting": [860], "Order": ["12"],
+                           "WaveMin": [7564.1], "WaveMax": [7689.8]})
+
+    rows = trimmed_ranges(obslog)
+    assert rows.TrimMin[0] == 0.0
+    assert rows.TrimMax[0] == 0.0
+
+    wave, flux, error = merge_orders([filename], obslog=obslog, cache_dir=str(tmp_path),
+                                     noDATADIR=True)
+    assert len(wave) == len(flux) == len(error)
+    cache_files = os.listdir(str(tmp_path))
+    assert len(cache_files) == 1
+    assert cache_files[0].startswith("HD170740_w860_redl_20140915_")
+
+    cached = merge_orders([filename], cache_dir=str(tmp_path))
+    assert np.array_equal(cached[1], flux, equal_nan=True)
+
+    # another grid or trim table is not answered from the cache
+    grid = np.arange(7600.0, 7650.0, 0.05)
+    regridded = merge_orders([filename], obslog=obslog, grid=grid, cache_dir=str(tmp_path),
+                             noDATADIR=True)
+    assert np.array_equal(regridded[0], grid)
+    trims = pd.DataFrame({"Setting": [860], "Arm": ["redl"], "Order": ["12"],
+                          "TrimMin": [0.1], "TrimMax": [0.1]})
+    trimmed = merge_orders([filename], obslog=obslog, trims=trims, cache_dir=str(tmp_path),
+                           noDATADIR=True)
+    assert trimmed[0][0] > wave[0] + 10
+    assert len(os.listdir(str(tmp_path))) == 3
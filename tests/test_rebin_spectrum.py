@@ -0,0 +1,38 @@
+import numpy as np
+
+from edibles.utils.rebin_spectrum import bin_edges, rebin_operator, rebin_spectrum
+
+
+def testRebinSpectrum():
+
+    wave = np.linspace(6600, 6630, 1501)
+    flux = 1 - 0.5 * np.exp(-0.5 * ((wave - 6614) / 0.3) ** 2)
+    new_wave = np.linspace(6601, 6629, 211)
+
+    # constant flux density is preserved
+    ones = rebin_spectrum(wave, np.ones_like(wave), new_wave)
+    assert np.allclose(ones, 1)
+
+    # integrated flux is conserved over the common range
+    new_flux = rebin_spectrum(wave, flux, new_wave)
+    edges, new_edges = bin_edges(wave), bin_edges(new_wave)
+    in_range = (wave > new_edges[0]) & (wave < new_edges[-1])
+    old_integral = np.sum((flux * np.diff(edges))[in_range])
+    new_integral = np.sum(new_flux * np.diff(new_edges))
+    assert abs(old_integral - new_integral) < 0.05
+
+    # a stack of spectra is rebinned in one call, row by row
+    stack = np.vstack([flux, 2 * flux, flux ** 2])
+    new_stack, new_error = rebin_spectrum(wave, stack, new_wave, error=0.01 * np.ones_like(stack))
+    assert new_stack.shape == (3, len(new_wave))
+    for row, new_row in zip(stack, new_stack):
+        assert np.allclose(rebin_spectrum(wave, row, new_wave), new_row)
+    assert np.all(new_error < 0.01)
+
+    # bins outside the input grid are filled
+    outside = rebin_spectrum(wave, flux, np.linspace(6590, 6610, 50))
+    assert np.isnan(outside[0])
+    assert np.isfinite(outside[-1])
+
+    # operators are cached per grid pair
+    assert rebin_operator(wave, new_wave)[0] is rebin_operator(wave.copy(), new_wave)[0]
@@ -0,0 +1,67 @@
+import numpy as np
+
+from edibles.utils.edibles_spectrum import EdiblesSpectrum
+from edibles.sightline import Sightline
+
+
+def makeSightline(filename="tests/HD170740_w860_redl_20140915_O12.fits"):
+
+    sp = EdiblesSpectrum(filename, noDATADIR=True)
+    sp.getSpectrum(xmin=7661.75, xmax=7669)
+
+    sightline = Sightline(sp, n_anchors=4)
+    sightline.add_line(name='line1', source='Telluric', pars={'d': 0.01, 'tau_0': 0.6, 'lam_0': 7664.8})
+    sightline.add_line(name='line2', source='Telluric', pars={'d': 0.01, 'tau_0': 0.1, 'lam_0': 7666.5})
+    sightline.fit()
+
+    sightline.freeze()
+    sightline.add_line(name='line3', source='Nontelluric',
+                       pars={'d': 0.001, 'tau_0': 0.07, 'lam_0': 7665.25})
+    return sightline
+
+
+def assertSameFit(full, cached):
+
+    assert cached.result.model is cached.complete_model
+    for name in full.result.params:
+        assert np.isclose(full.result.params[name].value, cached.result.params[name].value)
+    assert full.result.init_values.keys() == cached.result.init_values.keys()
+    assert full.result.best_values.keys() == cached.result.best_values.keys()
+    for attr in ['init_fit', 'best_fit', 'residual']:
+        assert np.allclose(getattr(full.result, attr), getattr(cached.result, attr))
+    for attr in ['nfev', 'nvarys', 'ndata', 'nfree']:
+        assert getattr(full.result, attr) == getattr(cached.result, attr)
+    for attr in ['chisqr', 'redchi', 'aic', 'bic', 'rsquared']:
+        assert np.isclose(getattr(full.result, attr), getattr(cached.result, attr))
+    full_components = full.result.eval_components()
+    cached_components = cached.result.eval_components()
+    assert full_components.keys() == cached_components.keys()
+    for name in full_components:
+        assert np.allclose(full_components[name], cached_components[name])
+
+
+def testFrozenCache():
+
+    full = makeSightline()
+    full.fit(cache_frozen=False)
+
+    cached = makeSightline()
+    cached.fit()
+    assert 'Telluric_line1_' in cached.result.eval_components()
+    assertSameFit(full, cached)
+
+    # the fit follows a change of a frozen value
+    for sightline, cache_frozen in [(full, False), (cached, True)]:
+        sightline.all_pars['Telluric_line1_tau_0'].set(value=0.5)
+        sightline.fit(cache_frozen=cache_frozen)
+    assert cached.result.params['Telluric_line1_tau_0'].value == 0.5
+    assertSameFit(full, cached)
+
+    # a fit of the old model, after fits of the new one
+    for sightline, cache_frozen in [(full, False), (cached, True)]:
+        sightline.old_all_pars['y_0'].set(vary=True)
+        sightline.fit(old=True, cache_frozen=cache_frozen)
+    assert cached.result.model is cached.old_complete_model
+    for name in full.result.params:
+        assert np.isclose(full.result.params[name].value, cached.result.params[name].value)
+    assert np.allclose(full.result.best_fit, cached.result.best_fit)
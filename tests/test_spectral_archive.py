@@ -0,0 +1,38 @@
+import os
+import numpy as np
+import pandas as pd
+
+from edibles.utils.edibles_spectrum import EdiblesSpectrum
+from edibles.utils.spectral_archive import pack_archive, SpectralArchive
+
+
+FILES = ["HD170740_w860_redl_20140915_O12.fits", "HD148937_w346_blue_20150817_O11.fits"]
+
+
+def testSpectralArchive(tmp_path):
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    obslog = pd.DataFrame({"Filename": ["/" + f for f in FILES],
+                           "Setting": [860, 346],
+                           "Order": ["12", "11"]})
+
+    index = pack_archive(str(tmp_path), obslog=obslog, datadir=tests_dir, chunk_pixels=500)
+    assert len(index) == 2
+    assert sorted(index.PackFile.unique()) == ["DR4_346_blue.pack", "DR4_860_redl.pack"]
+
+    archive = SpectralArchive(str(tmp_path))
+    assert len(archive) == 2
+    assert "/" + FILES[0] in archive
+
+    sp = EdiblesSpectrum(os.path.join(tests_dir, FILES[0]), noDATADIR=True)
+    packed = archive.getSpectrum("/" + FILES[0])
+    assert np.array_equal(packed.wave, sp.raw_wave)
+    assert np.array_equal(packed.flux, sp.raw_flux)
+    assert np.allclose(packed.bary_wave, sp.raw_bary_wave)
+
+    sp.getSpectrum(xmin=7660, xmax=7680)
+    window = archive.getSpectrum("/" + FILES[0], xmin=7660, xmax=7680)
+    assert np.array_equal(window.wave, sp.wave)
+    assert np.array_equal(window.flux, sp.flux)
+
+    scanned = dict(archive.iter_spectra(setting=346))
+    assert list(scanned) == ["/" + FILES[1]]
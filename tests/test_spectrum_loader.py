@@ -0,0 +1,45 @@
+import os
+import time
+
+import numpy as np
+
+from edibles.utils.edibles_spectrum import EdiblesSpectrum, CompactSpectrum
+from edibles.utils.spectrum_loader import iter_spectra, load_spectra
+
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+FILES = [os.path.join(TESTS_DIR, f) for f in
+         ["HD170740_w860_redl_20140915_O12.fits", "HD148937_w346_blue_20150817_O11.fits"]]
+
+
+def testSpectrumLoader():
+
+    filenames = FILES * 3
+
+    # input order, also when later files are read first
+    def slow_first(filename):
+        if filename == filenames[0]:
+            time.sleep(0.2)
+        return filename
+
+    results = list(iter_spectra(filenames, ordered=True, max_workers=4, reader=slow_first))
+    assert [name for name, _ in results] == filenames
+    assert [sp for _, sp in results] == filenames
+
+    # unordered: every file exactly once, the slow one last
+    results = list(iter_spectra(filenames, ordered=False, max_workers=4, prefetch=2,
+                                reader=slow_first))
+    assert sorted(name for name, _ in results) == sorted(filenames)
+    assert results[-1][0] == filenames[0]
+
+    spectra = load_spectra(filenames, noDATADIR=True, max_workers=2)
+    assert [sp.target for sp in spectra] == [EdiblesSpectrum(f, noDATADIR=True).target
+                                             for f in filenames]
+
+    compact = load_spectra(FILES, compact=True, noDATADIR=True)
+    for filename, sp in zip(FILES, compact):
+        assert isinstance(sp, CompactSpectrum)
+        full = EdiblesSpectrum(filename, noDATADIR=True)
+        assert np.array_equal(sp.wave, full.raw_wave)
+        assert np.array_equal(sp.flux, full.raw_flux)
+        assert np.allclose(sp.bary_wave, full.raw_bary_wave)
@@ -0,0 +1,70 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+import astropy.constants as cst
+
+from edibles.utils import edibles_spectrum
+from edibles.utils.edibles_spectrum import EdiblesSpectrum
+from edibles.utils.superspectrum import (SuperSpectrum, build_superspectra, doppler_factors,
+                                         doppler_regrid)
+
+
+def testSuperSpectrum():
+
+    c = cst.c.to("km/s").value
+    rng = np.random.default_rng(2)
+    wave = np.linspace(6600, 6630, 3000)
+    grid = np.linspace(6605, 6625, 1000)
+
+    # one interstellar line at 6614 AA, seen at a different velocity in each sightline
+    superspectrum = SuperSpectrum(grid)
+    for v_bary, v_ism in zip((-20.0, 5.0, 25.0), (15.0, -10.0, -30.0)):
+        observed = 6614.0 * (1 + v_ism / c) / (1 + v_bary / c)
+        flux = 1 - 0.3 * np.exp(-0.5 * ((wave - observed) / 0.1) ** 2)
+        flux = flux + rng.normal(0, 0.002, len(wave))
+        superspectrum.add(wave, flux, v_bary, v_star=50.0, v_ism=v_ism)
+
+    # all frames are regridded at once and agree with a per-frame interpolation
+    factors = doppler_factors(-20.0, v_star=50.0, v_ism=15.0)
+    regridded = doppler_regrid(wave, flux, grid, factors)
+    for factor, row in zip(factors, regridded):
+        assert np.allclose(row, np.interp(grid, wave * factor, flux))
+
+    # the line is sharp in the interstellar frame and smeared in the others
+    _, ism, error = superspectrum.result("ism")
+    _, geo, _ = superspectrum.result("geocentric")
+    assert abs(grid[np.argmin(ism)] - 6614.0) < 0.05
+    assert np.min(ism) < 0.75 and np.min(geo) > 0.75
+    assert np.all(np.isfinite(error))
+
+
+def testBuildSuperspectra(monkeypatch):
+
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    monkeypatch.setattr(edibles_spectrum, "DATADIR", tests_dir)
+    filename = "HD170740_w860_redl_20140915_O12.fits"
+    sp = EdiblesSpectrum(os.path.join(tests_dir, filename), noDATADIR=True)
+    assert sp.target != "HD 170740"
+
+    obslog = pd.DataFrame({"Object": ["HD 170740"], "WaveMin": [sp.raw_wave[0]],
+                           "WaveMax": [sp.raw_wave[-1]], "Order": ["12"],
+                           "Filename": ["/" + filename]})
+    oracle = SimpleNamespace(obslog=obslog)
+    grid = np.arange(7660, 7670, 0.02)
+
+    # the velocities are keyed by the obslog name, not the FITS OBJECT
+    built = build_superspectra(["HD 170740"], grid, v_star={"HD 170740": 30.0},
+                               v_ism={"HD 170740": -10.0}, oracle=oracle)
+    margin = grid[-1] * (30.0 + 35.0) / cst.c.to("km/s").value
+    window = (sp.raw_wave > grid[0] - margin) & (sp.raw_wave < grid[-1] + margin)
+    expected = SuperSpectrum(grid)
+    expected.add(sp.raw_wave[window], sp.raw_flux[window], sp.v_bary, v_star=30.0, v_ism=-10.0)
+    assert built.targets == ["HD 170740"]
+    for frame in ("stellar", "ism"):
+        assert np.allclose(built.result(frame)[1], expected.result(frame)[1], equal_nan=True)
+
+    with pytest.raises(ValueError, match="HD 170740"):
+        build_superspectra(["HD 170740"], grid, v_star={"HD170740": 30.0}, oracle=oracle)
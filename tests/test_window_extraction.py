@@ -0,0 +1,40 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import astropy.constants as cst
+
+from edibles.utils import edibles_spectrum
+from edibles.utils.edibles_spectrum import EdiblesSpectrum
+from edibles.utils.rebin_spectrum import rebin_spectrum
+from edibles.utils.window_extraction import extract_windows
+
+
+FILE = "HD170740_w860_redl_20140915_O12.fits"
+
+
+def testExtractWindows(monkeypatch):
+
+    tests_dir = os.path.dirname(os.path.abspath(__file__))
+    monkeypatch.setattr(edibles_spectrum, "DATADIR", tests_dir)
+
+    sp = EdiblesSpectrum(os.path.join(tests_dir, FILE), noDATADIR=True)
+    obslog = pd.DataFrame({"Object": ["HD 170740", "HD 147889"],
+                           "WaveMin": [sp.raw_wave[0]] * 2, "WaveMax": [sp.raw_wave[-1]] * 2,
+                           "Order": ["12", "12"], "Filename": ["/" + FILE] * 2})
+    oracle = SimpleNamespace(obslog=obslog)
+
+    rest_wave = 7664.91
+    velocity, flux, meta = extract_windows(["HD 170740"], rest_wave, 50.0, dv=2.0,
+                                           oracle=oracle, MergedOnly=False, rebin=True)
+    assert np.allclose(velocity, np.arange(-50.0, 50.1, 2.0))
+    assert flux.shape == (1, len(velocity))
+    assert meta.Object.tolist() == ["HD 170740"]
+    assert np.isclose(meta.VBary[0], sp.v_bary)
+
+    c = cst.c.to("km/s").value
+    wave_grid = rest_wave * (1 + velocity / c)
+    expected = rebin_spectrum(sp.raw_bary_wave, sp.raw_flux, wave_grid)
+    assert np.allclose(flux[0], expected)
+    assert np.all(np.isfinite(flux))